@@ -0,0 +1,226 @@
+# services/analyzer/bulk_session.py
+"""
+حالت «بارگذاری انبوه» برای ایندکس‌های ES در طول bulk بزرگ (miner، score.py، reprocess/خزش بزرگ).
+
+  with BulkSession(es, ["games"], name="miner"):
+      helpers.bulk(es, actions, ...)
+
+در ورود:  refresh_interval=-1 و translog.durability=async (+ flush_threshold_size بزرگ‌تر)
+در خروج:  تنظیمات اصلی برگردانده می‌شود، یک refresh و در صورت نیاز forcemerge (پس‌زمینه)
+فشرده‌سازی درخواست: client() همان Elasticsearch با http_compress است.
+
+چند پروسه‌ی هم‌زمان روی یک ایندکس: تنظیمات اصلی و فهرست نگه‌دارنده‌ها (holders) در سند ایندکس
+BULK_SESSION_REGISTRY با کلید نام ایندکس نگه داشته می‌شود (seq_no/primary_term برای هم‌زمانی)؛ فقط آخرین
+نگه‌دارنده تنظیمات را برمی‌گرداند. هر نگه‌دارنده هر BULK_SESSION_HEARTBEAT_SEC ثانیه زمانش را به‌روز می‌کند؛
+نگه‌دارنده‌ی قدیمی‌تر از BULK_SESSION_STALE_SEC (پروسه‌ی crash‌شده) در شروع هر session کنار گذاشته می‌شود و
+اگر کسی نماند تنظیمات برگردانده می‌شود. دستی:
+  python bulk_session.py status | recover | recover --force
+"""
+import os, sys, time, uuid, socket, threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from elasticsearch import ApiError, ConflictError, Elasticsearch, NotFoundError
+
+ES_URL          = os.getenv("ES_HOST", "http://es:9200").rstrip("/")
+ENABLED         = os.getenv("BULK_SESSION", "1") == "1"
+REGISTRY        = os.getenv("BULK_SESSION_REGISTRY", "bulk-sessions")
+STALE_SEC       = int(os.getenv("BULK_SESSION_STALE_SEC", "600"))
+HEARTBEAT_SEC   = int(os.getenv("BULK_SESSION_HEARTBEAT_SEC", "60"))
+TRANSLOG_DURABILITY = os.getenv("BULK_TRANSLOG_DURABILITY", "async")
+TRANSLOG_FLUSH  = os.getenv("BULK_TRANSLOG_FLUSH", "1gb")
+COMPRESS        = os.getenv("BULK_COMPRESS", "1") == "1"
+FORCEMERGE      = int(os.getenv("BULK_FORCEMERGE", "0"))   # 0 = خیر؛ N = max_num_segments
+
+# تنظیماتی که session عوض می‌کند (flat)؛ مقدار اصلیِ تنظیم‌نشده None ذخیره و با null برگردانده می‌شود
+MANAGED = ("index.refresh_interval", "index.translog.durability", "index.translog.flush_threshold_size")
+
+def client(url: str = ES_URL, **kw) -> Elasticsearch:
+    return Elasticsearch(url, http_compress=COMPRESS, **kw)
+
+def bulk_settings() -> Dict[str, Any]:
+    return {
+        "index.refresh_interval": "-1",
+        "index.translog.durability": TRANSLOG_DURABILITY,
+        "index.translog.flush_threshold_size": TRANSLOG_FLUSH,
+    }
+
+# ==================== Registry ====================
+def _ensure_registry(es: Elasticsearch):
+    if es.indices.exists(index=REGISTRY):
+        return
+    try:
+        es.indices.create(index=REGISTRY, settings={"number_of_shards": 1}, mappings={"dynamic": False})
+    except ApiError as e:
+        if "resource_already_exists" not in str(e): raise
+
+def _get(es: Elasticsearch, index: str):
+    try:
+        d = es.get(index=REGISTRY, id=index)
+    except NotFoundError:
+        return None
+    return d["_source"], d["_seq_no"], d["_primary_term"]
+
+def _live(holders: Dict[str, float], now: float) -> Dict[str, float]:
+    return {k: v for k, v in (holders or {}).items() if now - float(v) < STALE_SEC}
+
+def _concrete(es: Elasticsearch, indices: Iterable[str]) -> List[str]:
+    """alias/الگو → نام ایندکس‌های واقعی (تنظیمات روی ایندکس واقعی نشسته‌اند)"""
+    out: List[str] = []
+    for idx in indices:
+        for name in es.indices.get_settings(index=idx, flat_settings=True):
+            if name not in out: out.append(name)
+    return out
+
+def _current(es: Elasticsearch, index: str) -> Dict[str, Any]:
+    s = es.indices.get_settings(index=index, flat_settings=True)[index]["settings"]
+    return {k: s.get(k) for k in MANAGED}
+
+def _restore(es: Elasticsearch, index: str, original: Dict[str, Any]):
+    es.indices.put_settings(index=index, settings={k: original.get(k) for k in MANAGED})
+    print(f"[BULK] {index}: settings restored {original}")
+
+def acquire(es: Elasticsearch, index: str, holder: str):
+    for _ in range(50):
+        now = time.time()
+        got = _get(es, index)
+        try:
+            if got is None:
+                # اول ثبت، بعد تغییر تنظیمات: crash بین این دو با recover جبران می‌شود
+                es.index(index=REGISTRY, id=index, op_type="create",
+                         document={"original": _current(es, index), "holders": {holder: now}})
+            else:
+                src, seq, term = got
+                holders = _live(src.get("holders"), now)
+                holders[holder] = now
+                es.index(index=REGISTRY, id=index, document={**src, "holders": holders},
+                         if_seq_no=seq, if_primary_term=term)
+        except ConflictError:
+            continue
+        es.indices.put_settings(index=index, settings=bulk_settings())
+        return
+    raise RuntimeError(f"bulk session: could not register on {index}")
+
+def release(es: Elasticsearch, index: str, holder: Optional[str]) -> bool:
+    """holder را حذف می‌کند؛ اگر کسی نماند تنظیمات برمی‌گردد. True یعنی برگردانده شد."""
+    restored = False
+    for _ in range(50):
+        got = _get(es, index)
+        if got is None:
+            return restored
+        src, seq, term = got
+        holders = _live(src.get("holders"), time.time())
+        holders.pop(holder, None)
+        try:
+            if holders:
+                es.index(index=REGISTRY, id=index, document={**src, "holders": holders},
+                         if_seq_no=seq, if_primary_term=term)
+                if restored:
+                    # کسی وسط برگرداندن وارد شد
+                    es.indices.put_settings(index=index, settings=bulk_settings())
+                return False
+            # اول برگرداندن، بعد حذف: در بدترین حالت یک session جدید بدون تنظیمات bulk ادامه می‌دهد، نه برعکس
+            _restore(es, index, src.get("original") or {})
+            restored = True
+            es.delete(index=REGISTRY, id=index, if_seq_no=seq, if_primary_term=term)
+            return True
+        except ConflictError:
+            continue
+    raise RuntimeError(f"bulk session: could not release {index}")
+
+def touch(es: Elasticsearch, index: str, holder: str):
+    for _ in range(10):
+        got = _get(es, index)
+        if got is None: return
+        src, seq, term = got
+        try:
+            es.index(index=REGISTRY, id=index, document={**src, "holders": {**(src.get("holders") or {}), holder: time.time()}},
+                     if_seq_no=seq, if_primary_term=term)
+            return
+        except ConflictError:
+            continue
+
+def recover(es: Elasticsearch, force: bool = False) -> List[str]:
+    """sessionهای رهاشده: نگه‌دارنده‌های قدیمی حذف و در صورت خالی شدن تنظیمات برگردانده می‌شود."""
+    if not es.indices.exists(index=REGISTRY):
+        return []
+    done = []
+    resp = es.search(index=REGISTRY, query={"match_all": {}}, size=1000, source=False)
+    for h in resp["hits"]["hits"]:
+        index = h["_id"]
+        if force:
+            got = _get(es, index)
+            if got is None: continue
+            _restore(es, index, got[0].get("original") or {})
+            es.options(ignore_status=404).delete(index=REGISTRY, id=index)
+            done.append(index)
+        elif release(es, index, None):
+            done.append(index)
+    return done
+
+# ==================== Context ====================
+class BulkSession:
+    def __init__(self, es: Elasticsearch, indices: Iterable[str], name: str = "bulk",
+                 forcemerge: Optional[int] = None):
+        self.es = es.options(request_timeout=120)
+        self.requested = list(indices)
+        self.indices: List[str] = []
+        self.forcemerge = FORCEMERGE if forcemerge is None else forcemerge
+        self.holder = f"{name}@{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._beat: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "BulkSession":
+        if not ENABLED:
+            return self
+        try:
+            _ensure_registry(self.es)
+            recovered = recover(self.es)
+            if recovered: print(f"[BULK] recovered abandoned sessions on {recovered}")
+            for idx in _concrete(self.es, self.requested):
+                acquire(self.es, idx, self.holder)
+                self.indices.append(idx)
+        except Exception as e:
+            # بدون session هم bulk درست کار می‌کند، فقط کندتر
+            print("[BULK] WARN could not start bulk session:", e)
+        if self.indices:
+            print(f"[BULK] session {self.holder} on {self.indices}")
+            self._beat = threading.Thread(target=self._heartbeat, daemon=True)
+            self._beat.start()
+        return self
+
+    def _heartbeat(self):
+        while not self._stop.wait(HEARTBEAT_SEC):
+            for idx in self.indices:
+                try: touch(self.es, idx, self.holder)
+                except Exception as e: print("[BULK] WARN heartbeat:", e)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        for idx in self.indices:
+            try:
+                last = release(self.es, idx, self.holder)
+                self.es.indices.refresh(index=idx)
+                if last and self.forcemerge > 0:
+                    t = self.es.indices.forcemerge(index=idx, max_num_segments=self.forcemerge, wait_for_completion=False)
+                    print(f"[BULK] {idx}: forcemerge to {self.forcemerge} segments, task {t.get('task')}")
+            except Exception as e:
+                print(f"[BULK] WARN release {idx} (recover: python bulk_session.py recover):", e)
+        return False
+
+def main():
+    es = client(request_timeout=60)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if cmd == "recover":
+        print("[BULK] restored:", recover(es, force="--force" in sys.argv))
+        return
+    if not es.indices.exists(index=REGISTRY):
+        print("[BULK] no sessions.")
+        return
+    for h in es.search(index=REGISTRY, query={"match_all": {}}, size=1000)["hits"]["hits"]:
+        now = time.time()
+        holders = h["_source"].get("holders") or {}
+        ages = ", ".join(f"{k} ({now - float(v):.0f}s)" for k, v in holders.items())
+        print(f"[BULK] {h['_id']}: original={h['_source'].get('original')} holders: {ages or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+# services/analyzer/drift.py
+"""
+پایش drift فیچرها و امتیازها با sketchهای جریانی قابل ادغام (فقط numpy).
+
+- عددی‌ها (rating، ratings_count، ...، predicted_success): t-digest (merging، k1) → چندک‌ها و CDF
+- دسته‌ای‌ها (genre، store، feature_flags): Space-Saving با ظرفیت ثابت → سهم هر مقدار
+- نرخ خالی بودن هر فیلد
+
+train.py از داده‌ی آموزش baseline می‌سازد (داخل model.pkl و فایل کناری model_baseline.json)؛
+miner (MINER_MODE=features) و score.py در همان پاسی که روی سندها می‌زنند یک sketch پر می‌کنند،
+آن را در DRIFT_DIR ذخیره و با baseline مقایسه می‌کنند (PSI و فاصله‌ی KS؛ بالای آستانه → [DRIFT] ALERT).
+"""
+import os, json, math, datetime as dt
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MODEL_DIR       = os.getenv("MODEL_DIR", "/models")
+DRIFT_DIR       = os.getenv("DRIFT_DIR", os.path.join(MODEL_DIR, "drift"))
+BASELINE_FILE   = "model_baseline.json"
+PSI_ALERT       = float(os.getenv("DRIFT_PSI_ALERT", "0.2"))
+MISSING_ALERT   = float(os.getenv("DRIFT_MISSING_ALERT", "0.1"))
+KEEP_RUNS       = int(os.getenv("DRIFT_KEEP_RUNS", "200"))
+
+NUMERIC_FIELDS = ["rating", "ratings_count", "installs", "assets_screenshot_count", "assets_icon_count",
+                  "metric_reviews_count", "metric_review_rating_avg", "metric_review_low_share"]
+SCORE_FIELDS = ["predicted_success", "feature_score"]
+CATEGORICAL_FIELDS = ["genre", "store"]
+MULTI_FIELDS = ["feature_flags"]
+
+# ==================== t-digest ====================
+class TDigest:
+    """merging t-digest با تابع مقیاس k1؛ مقادیر بافر و دسته‌ای فشرده می‌شوند."""
+    def __init__(self, delta: float = 100.0):
+        self.delta = delta
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min, self.max = math.inf, -math.inf
+        self._bv: List[np.ndarray] = []
+        self._bw: List[np.ndarray] = []
+        self._buffered = 0
+
+    @property
+    def n(self) -> float:
+        self._compress()
+        return float(self.weights.sum())
+
+    def add_many(self, values: Iterable[float], weights: Optional[np.ndarray] = None):
+        v = np.asarray(values, dtype=np.float64).ravel()
+        w = np.ones_like(v) if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+        ok = np.isfinite(v)
+        if not ok.any(): return
+        v, w = v[ok], w[ok]
+        self.min, self.max = min(self.min, float(v.min())), max(self.max, float(v.max()))
+        self._bv.append(v); self._bw.append(w)
+        self._buffered += len(v)
+        if self._buffered >= 20 * self.delta:
+            self._compress()
+
+    def add(self, value: float):
+        self.add_many([value])
+
+    def merge(self, other: "TDigest"):
+        other._compress()
+        if len(other.means):
+            self.add_many(other.means, other.weights)
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+
+    def _compress(self):
+        if not self._bv: return
+        v = np.concatenate([self.means, *self._bv])
+        w = np.concatenate([self.weights, *self._bw])
+        self._bv, self._bw, self._buffered = [], [], 0
+        order = np.argsort(v, kind="mergesort")
+        v, w = v[order], w[order]
+        total = w.sum()
+        # مرز k1: k(q) = δ/2π · asin(2q−1)؛ هر centroid حداکثر یک واحد k را می‌پوشاند
+        q_right = np.cumsum(w) / total
+        k = self.delta / (2 * math.pi) * np.arcsin(np.clip(2 * q_right - 1, -1, 1))
+        means, weights = [], []
+        cur_m, cur_w, k_left = v[0], w[0], self.delta / (2 * math.pi) * math.asin(-1)
+        for i in range(1, len(v)):
+            if k[i] - k_left <= 1.0:
+                cur_w += w[i]
+                cur_m += (v[i] - cur_m) * w[i] / cur_w
+            else:
+                means.append(cur_m); weights.append(cur_w)
+                k_left = k[i - 1]
+                cur_m, cur_w = v[i], w[i]
+        means.append(cur_m); weights.append(cur_w)
+        self.means, self.weights = np.asarray(means), np.asarray(weights)
+
+    def _points(self) -> Tuple[np.ndarray, np.ndarray]:
+        self._compress()
+        cum = (np.cumsum(self.weights) - self.weights / 2) / max(self.weights.sum(), 1e-12)
+        return np.concatenate([[self.min], self.means, [self.max]]), np.concatenate([[0.0], cum, [1.0]])
+
+    def quantile(self, q) -> np.ndarray:
+        if not len(self.means) and not self._bv: return np.full(np.shape(q), np.nan)
+        x, c = self._points()
+        return np.interp(q, c, x)
+
+    def cdf(self, x) -> np.ndarray:
+        if not len(self.means) and not self._bv: return np.full(np.shape(x), np.nan)
+        xs, c = self._points()
+        return np.interp(x, xs, c, left=0.0, right=1.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._compress()
+        return {"delta": self.delta, "means": np.round(self.means, 6).tolist(), "weights": self.weights.tolist(),
+                "min": self.min if math.isfinite(self.min) else None, "max": self.max if math.isfinite(self.max) else None}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "TDigest":
+        t = cls(d.get("delta", 100.0))
+        t.means = np.asarray(d.get("means") or [], dtype=np.float64)
+        t.weights = np.asarray(d.get("weights") or [], dtype=np.float64)
+        t.min = d["min"] if d.get("min") is not None else math.inf
+        t.max = d["max"] if d.get("max") is not None else -math.inf
+        return t
+
+# ==================== Space-Saving ====================
+class SpaceSaving:
+    """top-k تقریبی با حافظه‌ی ثابت؛ برای کاردینالیتی کمتر از capacity شمارش دقیق است."""
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        self.n = 0.0
+
+    def add(self, item: str, w: float = 1.0):
+        self.n += w
+        if item in self.counts:
+            self.counts[item] += w
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = w
+            self.errors[item] = 0.0
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim, None)
+            self.counts[item] = floor + w
+            self.errors[item] = floor
+
+    def merge(self, other: "SpaceSaving"):
+        for item, c in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0.0) + c
+            self.errors[item] = self.errors.get(item, 0.0) + other.errors.get(item, 0.0)
+        self.n += other.n
+        if len(self.counts) > self.capacity:
+            for item in sorted(self.counts, key=self.counts.get)[:len(self.counts) - self.capacity]:
+                self.counts.pop(item); self.errors.pop(item, None)
+
+    def top(self, k: int = 20) -> List[Tuple[str, float]]:
+        return sorted(self.counts.items(), key=lambda kv: -kv[1])[:k]
+
+    def shares(self) -> Dict[str, float]:
+        return {k: c / self.n for k, c in self.counts.items()} if self.n else {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "n": self.n, "counts": self.counts, "errors": self.errors}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "SpaceSaving":
+        s = cls(d.get("capacity", 256))
+        s.counts = {k: float(v) for k, v in (d.get("counts") or {}).items()}
+        s.errors = {k: float(v) for k, v in (d.get("errors") or {}).items()}
+        s.n = float(d.get("n") or 0.0)
+        return s
+
+# ==================== Feature sketch ====================
+def _norm_cat(v: Any) -> str:
+    if v is None or (isinstance(v, float) and math.isnan(v)): return "unknown"
+    return str(v).lower()
+
+def _is_missing(v: Any) -> bool:
+    return v is None or (isinstance(v, float) and math.isnan(v)) or v == "" or v == []
+
+class FeatureSketch:
+    def __init__(self):
+        self.rows = 0
+        self.numeric: Dict[str, TDigest] = {f: TDigest() for f in NUMERIC_FIELDS + SCORE_FIELDS}
+        self.categorical: Dict[str, SpaceSaving] = {f: SpaceSaving() for f in CATEGORICAL_FIELDS + MULTI_FIELDS}
+        self.missing: Dict[str, int] = {f: 0 for f in NUMERIC_FIELDS + CATEGORICAL_FIELDS + MULTI_FIELDS}
+        self._nbuf: Dict[str, List[float]] = {f: [] for f in self.numeric}
+
+    def update(self, src: Dict[str, Any]):
+        """یک سند (همان _source که پاس فعلی در دست دارد)"""
+        self.rows += 1
+        for f in NUMERIC_FIELDS:
+            v = src.get(f)
+            if _is_missing(v):
+                self.missing[f] += 1
+                continue
+            try: self._nbuf[f].append(float(v))
+            except (TypeError, ValueError): self.missing[f] += 1
+        for f in CATEGORICAL_FIELDS:
+            v = src.get(f)
+            if _is_missing(v) or _norm_cat(v) == "unknown": self.missing[f] += 1
+            self.categorical[f].add(_norm_cat(v))
+        for f in MULTI_FIELDS:
+            vs = src.get(f)
+            vs = vs if isinstance(vs, list) else ([] if _is_missing(vs) else [vs])
+            if not vs: self.missing[f] += 1
+            for v in vs:
+                self.categorical[f].add(_norm_cat(v))
+        if self.rows % 5000 == 0:
+            self._flush()
+
+    def update_columns(self, n: int, cols: Dict[str, Any]):
+        """نسخه‌ی ستونی update برای DataFrame آموزش (عددی‌ها برداری؛ NaN = خالی)"""
+        self.rows += n
+        for f in NUMERIC_FIELDS:
+            if f not in cols:
+                self.missing[f] += n
+                continue
+            v = np.asarray(cols[f], dtype=np.float64)
+            ok = np.isfinite(v)
+            self.missing[f] += int(n - ok.sum())
+            self.numeric[f].add_many(v[ok])
+        for f in CATEGORICAL_FIELDS:
+            for v in cols.get(f, [None] * n):
+                if _is_missing(v) or _norm_cat(v) == "unknown": self.missing[f] += 1
+                self.categorical[f].add(_norm_cat(v))
+        for f in MULTI_FIELDS:
+            for vs in cols.get(f, [None] * n):
+                vs = vs if isinstance(vs, list) else ([] if _is_missing(vs) else [vs])
+                if not vs: self.missing[f] += 1
+                for v in vs:
+                    self.categorical[f].add(_norm_cat(v))
+
+    def update_many(self, srcs: Iterable[Dict[str, Any]]):
+        for s in srcs:
+            self.update(s)
+
+    def add_scores(self, field: str, values: Iterable[float]):
+        self.numeric[field].add_many(values)
+
+    def _flush(self):
+        for f, buf in self._nbuf.items():
+            if buf:
+                self.numeric[f].add_many(buf)
+                self._nbuf[f] = []
+
+    def merge(self, other: "FeatureSketch"):
+        self._flush(); other._flush()
+        self.rows += other.rows
+        for f, t in other.numeric.items(): self.numeric[f].merge(t)
+        for f, s in other.categorical.items(): self.categorical[f].merge(s)
+        for f, m in other.missing.items(): self.missing[f] = self.missing.get(f, 0) + m
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._flush()
+        return {"rows": self.rows, "missing": self.missing,
+                "numeric": {f: t.to_dict() for f, t in self.numeric.items()},
+                "categorical": {f: s.to_dict() for f, s in self.categorical.items()}}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "FeatureSketch":
+        s = cls()
+        s.rows = int(d.get("rows") or 0)
+        s.missing.update({k: int(v) for k, v in (d.get("missing") or {}).items()})
+        for f, t in (d.get("numeric") or {}).items(): s.numeric[f] = TDigest.from_dict(t)
+        for f, c in (d.get("categorical") or {}).items(): s.categorical[f] = SpaceSaving.from_dict(c)
+        return s
+
+# ==================== Compare ====================
+_EPS = 1e-4
+
+def _psi(base: np.ndarray, cur: np.ndarray) -> float:
+    b, c = np.clip(base, _EPS, None), np.clip(cur, _EPS, None)
+    return float(np.sum((c - b) * np.log(c / b)))
+
+def numeric_drift(base: TDigest, cur: TDigest) -> Optional[Dict[str, float]]:
+    if base.n == 0 or cur.n == 0:
+        return None
+    edges = np.unique(base.quantile(np.linspace(0.1, 0.9, 9)))
+    bb = np.diff(np.concatenate([[0.0], base.cdf(edges), [1.0]]))
+    cc = np.diff(np.concatenate([[0.0], cur.cdf(edges), [1.0]]))
+    grid = np.unique(np.concatenate([base.quantile(np.linspace(0.01, 0.99, 50)), cur.quantile(np.linspace(0.01, 0.99, 50))]))
+    ks = float(np.max(np.abs(base.cdf(grid) - cur.cdf(grid)))) if len(grid) else 0.0
+    return {"psi": round(_psi(bb, cc), 4), "ks": round(ks, 4),
+            "p50_base": round(float(base.quantile(0.5)), 4), "p50_cur": round(float(cur.quantile(0.5)), 4),
+            "p90_base": round(float(base.quantile(0.9)), 4), "p90_cur": round(float(cur.quantile(0.9)), 4)}
+
+def categorical_drift(base: SpaceSaving, cur: SpaceSaving, top: int = 5) -> Optional[Dict[str, Any]]:
+    if not base.n or not cur.n:
+        return None
+    bs, cs = base.shares(), cur.shares()
+    keys = sorted(set(bs) | set(cs))
+    b = np.array([bs.get(k, 0.0) for k in keys] + [max(0.0, 1 - sum(bs.values()))])
+    c = np.array([cs.get(k, 0.0) for k in keys] + [max(0.0, 1 - sum(cs.values()))])
+    shifts = sorted(((k, round(bs.get(k, 0.0), 4), round(cs.get(k, 0.0), 4)) for k in keys),
+                    key=lambda t: -abs(t[2] - t[1]))[:top]
+    return {"psi": round(_psi(b, c), 4), "top_shifts": shifts}
+
+def compare(base: FeatureSketch, cur: FeatureSketch) -> Dict[str, Any]:
+    base._flush(); cur._flush()
+    report: Dict[str, Any] = {"rows_base": base.rows, "rows_cur": cur.rows, "numeric": {}, "categorical": {},
+                              "missing": {}, "alerts": []}
+    for f in cur.numeric:
+        if f in base.numeric:
+            d = numeric_drift(base.numeric[f], cur.numeric[f])
+            if d:
+                report["numeric"][f] = d
+                if d["psi"] > PSI_ALERT: report["alerts"].append(f"{f}: PSI={d['psi']} (p50 {d['p50_base']} → {d['p50_cur']})")
+    for f in cur.categorical:
+        if f in base.categorical:
+            d = categorical_drift(base.categorical[f], cur.categorical[f])
+            if d:
+                report["categorical"][f] = d
+                if d["psi"] > PSI_ALERT:
+                    k, b, c = d["top_shifts"][0]
+                    report["alerts"].append(f"{f}: PSI={d['psi']} ({k}: {b:.1%} → {c:.1%})")
+    if base.rows and cur.rows:
+        for f, m in cur.missing.items():
+            mb, mc = base.missing.get(f, 0) / base.rows, m / cur.rows
+            report["missing"][f] = [round(mb, 4), round(mc, 4)]
+            if mc - mb > MISSING_ALERT:
+                report["alerts"].append(f"{f}: missing/unknown {mb:.1%} → {mc:.1%}")
+    return report
+
+# ==================== Persistence ====================
+def save_baseline(model_dir: str, sketch: FeatureSketch) -> Dict[str, Any]:
+    d = sketch.to_dict()
+    path = os.path.join(model_dir, BASELINE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(d, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return d
+
+def load_baseline(model_dir: str = "") -> Optional[FeatureSketch]:
+    try:
+        with open(os.path.join(model_dir or MODEL_DIR, BASELINE_FILE), "r", encoding="utf-8") as f:
+            return FeatureSketch.from_dict(json.load(f))
+    except (OSError, ValueError):
+        return None
+
+def finish_run(kind: str, sketch: FeatureSketch, model_dir: str = "") -> Optional[Dict[str, Any]]:
+    """sketch این اجرا + گزارش مقایسه با baseline را ذخیره و هشدارها را چاپ می‌کند."""
+    if not sketch.rows and not any(t.n for t in sketch.numeric.values()):
+        return None
+    base = load_baseline(model_dir)
+    report = compare(base, sketch) if base is not None else None
+    stamp = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    os.makedirs(DRIFT_DIR, exist_ok=True)
+    path = os.path.join(DRIFT_DIR, f"{kind}-{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"kind": kind, "created_at": stamp, "sketch": sketch.to_dict(), "report": report}, f, ensure_ascii=False)
+    runs = sorted(p for p in os.listdir(DRIFT_DIR) if p.startswith(kind + "-"))
+    for old in runs[:-KEEP_RUNS] if KEEP_RUNS > 0 else []:
+        os.remove(os.path.join(DRIFT_DIR, old))
+
+    if report is None:
+        print(f"[DRIFT] {kind}: sketch saved to {path} (no training baseline yet)")
+    elif report["alerts"]:
+        for a in report["alerts"]:
+            print(f"[DRIFT] ALERT {kind}: {a}")
+    else:
+        print(f"[DRIFT] {kind}: no drift vs training baseline ({sketch.rows} rows) → {path}")
+    return report
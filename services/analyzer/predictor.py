@@ -0,0 +1,156 @@
+# services/analyzer/predictor.py
+"""
+artifact فشرده‌ی مدل خطی و پیش‌بین NumPy خالص (بدون sklearn / pandas).
+
+train.py برای مدل‌های خطی (MODEL_KIND=logreg) کنار model.pkl این دو فایل را هم می‌نویسد:
+  model.npz    coef (float64, به ترتیب feature_columns) و intercept
+  model.json   feature_columns، ژانرها/فلگ‌های Top-K، دسته‌های one-hot و مشخصات فیچرهای عددی (NUM_SPEC)
+
+CompactModel.load() چند میلی‌ثانیه طول می‌کشد و فقط numpy لازم دارد؛ score.py و worker وقتی این فایل‌ها
+باشند از آن استفاده می‌کنند و API (POST /predict) همین فایل را در image خودش کپی می‌کند. خزنده عمداً
+امتیاز نمی‌دهد: feature_flags و metric_* را miner بعد از خزش می‌نویسد و worker پس از آن امتیاز می‌دهد.
+خروجی predict() با score.score_rows روی همان artifact برابر است.
+"""
+import os, json, math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# فیچرهای عددی به همان شکل prepare_dataframe/prepare_features:
+# (ستون خروجی، فیلد سند، مقدار جایگزین خالی، تبدیل، حد پایین قبل از تبدیل)
+NUM_SPEC: List[Tuple[str, str, float, str, Optional[float]]] = [
+    ("rating",                  "rating",                      0.0,   "identity", None),
+    ("log_ratings_count",       "ratings_count",               0.0,   "log1p",    None),
+    ("assets_screenshot_count", "assets_screenshot_count",     0.0,   "identity", None),
+    ("assets_icon_count",       "assets_icon_count",           0.0,   "identity", None),
+    ("log_reviews_count",       "metric_reviews_count",        0.0,   "log1p",    None),
+    ("review_rating_avg",       "metric_review_rating_avg",    0.0,   "identity", None),
+    ("review_low_share",        "metric_review_low_share",     0.0,   "identity", None),
+    ("log_review_age_days",     "metric_review_age_days",      365.0, "log1p",    0.0),
+    ("log_review_text_len",     "metric_review_text_len_avg",  0.0,   "log1p",    None),
+]
+
+FORMAT_VERSION = 1
+
+# تجمیع ریویوها روی games (miner با MINER_MODE=reviews)؛ train.py و score.py از همین تعریف استفاده می‌کنند
+REVIEW_FEATURES = [field for _, field, *_ in NUM_SPEC if field.startswith("metric_")]
+
+def review_features(df) -> Dict[str, Any]:
+    """ستون‌های ریویو در مسیر pandas (prepare_dataframe/prepare_features)، با همان NUM_SPEC پیش‌بین فشرده"""
+    out: Dict[str, Any] = {}
+    for name, field, fill, fn, lo in NUM_SPEC:
+        if field not in REVIEW_FEATURES: continue
+        s = df[field].fillna(fill)
+        if lo is not None: s = s.clip(lower=lo)
+        s = s.astype(float)
+        out[name] = np.log1p(s) if fn == "log1p" else s
+    return out
+
+def _num(v: Any) -> Optional[float]:
+    if v is None or isinstance(v, (list, dict)): return None
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(f) else f
+
+def _flags(v: Any) -> List[Any]:
+    if isinstance(v, (list, tuple)): return list(v)
+    if v is None or (isinstance(v, float) and math.isnan(v)): return []
+    return [v]
+
+def _genre(v: Any) -> str:
+    if v is None or (isinstance(v, float) and math.isnan(v)): return "unknown"
+    return str(v).lower()
+
+class CompactModel:
+    def __init__(self, meta: Dict[str, Any], coef: np.ndarray, intercept: float):
+        self.meta = meta
+        self.coef = coef
+        self.intercept = intercept
+        self.feature_columns: List[str] = meta["feature_columns"]
+        self.top_flags: List[str] = meta["top_flags"]
+        self._top_genres = set(meta["top_genres"])
+        self._top_flag_set = set(self.top_flags)
+        col = {c: i for i, c in enumerate(self.feature_columns)}
+        self._num = [(col[name], field, fill, fn, lo) for name, field, fill, fn, lo in meta["num_spec"] if name in col]
+        self._genre_col = {g: col[f"genre__{g}"] for g in meta["genre_categories"] if f"genre__{g}" in col}
+        self._flag_col = {f: col[f"flag__{f}"] for f in self.top_flags if f"flag__{f}" in col}
+
+    # ---------- I/O ----------
+    @classmethod
+    def load(cls, model_dir: str) -> "CompactModel":
+        with open(os.path.join(model_dir, "model.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported compact model format {meta.get('format_version')}")
+        with np.load(os.path.join(model_dir, "model.npz")) as z:
+            coef, intercept = z["coef"].astype(np.float64), float(z["intercept"])
+        if coef.shape != (len(meta["feature_columns"]),):
+            raise ValueError("coef does not match feature_columns")
+        return cls(meta, coef, intercept)
+
+    @staticmethod
+    def exists(model_dir: str) -> bool:
+        return all(os.path.exists(os.path.join(model_dir, n)) for n in ("model.json", "model.npz"))
+
+    # ---------- Inference ----------
+    def matrix(self, rows: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(X با ترتیب feature_columns، feature_score)"""
+        X = np.zeros((len(rows), len(self.feature_columns)), dtype=np.float64)
+        fs = np.zeros(len(rows), dtype=np.float64)
+        other = self._genre_col.get("__other__")
+        n_top = max(1, len(self.top_flags))
+        for i, r in enumerate(rows):
+            for j, field, fill, fn, lo in self._num:
+                v = _num(r.get(field))
+                v = fill if v is None else v
+                if lo is not None and v < lo: v = lo
+                X[i, j] = math.log1p(v) if fn == "log1p" else v
+            g = _genre(r.get("genre"))
+            j = self._genre_col.get(g) if g in self._top_genres else other
+            if j is not None:
+                X[i, j] = 1.0
+            flags = _flags(r.get("feature_flags"))
+            for f in flags:
+                j = self._flag_col.get(f)
+                if j is not None:
+                    X[i, j] = 1.0
+            # مثل score.py فلگ‌های تکراری هم شمرده می‌شوند
+            fs[i] = sum(1 for f in flags if f in self._top_flag_set) / n_top
+        return X, fs
+
+    def predict(self, rows: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(predicted_success, feature_score) برای هر ردیف، به همان ترتیب rows"""
+        X, fs = self.matrix(rows)
+        z = X @ self.coef + self.intercept
+        return 1.0 / (1.0 + np.exp(-z)), fs
+
+def export(model_dir: str, model: Any, enc: Dict[str, Any]) -> bool:
+    """
+    فقط برای مدل‌های خطی دودویی (coef_ / intercept_)؛ برای بقیه فایل‌های قبلی پاک می‌شوند تا
+    score.py سراغ model.pkl برود. خروجی: آیا artifact فشرده نوشته شد.
+    """
+    paths = [os.path.join(model_dir, n) for n in ("model.json", "model.npz")]
+    coef = getattr(model, "coef_", None)
+    if coef is None or np.ndim(coef) != 2 or coef.shape[0] != 1:
+        for p in paths:
+            if os.path.exists(p): os.remove(p)
+        return False
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "kind": type(model).__name__,
+        "feature_columns": list(enc["feature_columns"]),
+        "num_columns": list(enc["num_columns"]),
+        "top_genres": list(enc["top_genres"]),
+        "genre_categories": [str(g) for g in enc["ohe_genres"].categories_[0]],
+        "top_flags": list(enc["top_flags"]),
+        "num_spec": [list(s) for s in NUM_SPEC],
+    }
+    np.savez(os.path.join(model_dir, "model.tmp.npz"), coef=np.asarray(coef[0], dtype=np.float64),
+             intercept=np.float64(np.ravel(model.intercept_)[0]))
+    with open(os.path.join(model_dir, "model.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(os.path.join(model_dir, "model.tmp.npz"), paths[1])
+    os.replace(os.path.join(model_dir, "model.json.tmp"), paths[0])
+    return True
@@ -1,22 +1,33 @@
-import os
-from typing import List, Dict, Any, Tuple
-from elasticsearch import Elasticsearch, helpers
-import pandas as pd
+import os, json
+from typing import List, Dict, Any, Tuple, Union
+from elasticsearch import helpers
 import numpy as np
-import joblib
+
+import drift
+import predictor
+from predictor import REVIEW_FEATURES, review_features
+from bulk_session import BulkSession, client as es_client
 
 ES_URL   = os.getenv("ES_HOST", "http://es:9200").rstrip("/")
 ES_INDEX = os.getenv("ES_INDEX", "games")
 MODEL_DIR = os.getenv("MODEL_DIR", "/models")
 BATCH = int(os.getenv("SCORE_BATCH","500"))
+FEATURE_SOURCE = os.getenv("FEATURE_SOURCE", "es").strip().lower()   # es | snapshot (خروجی snapshot.py)
+MODE = os.getenv("SCORE_MODE", "score").strip().lower()   # score | leaderboards (فقط بازسازی از ایندکس)
+ARTIFACT = os.getenv("SCORE_ARTIFACT", "auto").strip().lower()   # auto (فشرده اگر هست) | compact | pickle
+REDIS_URL = os.getenv("REDIS_URL", "")                      # خالی = leaderboard غیرفعال
+LB_PREFIX = os.getenv("LEADERBOARD_PREFIX", "lb")
 
-es = Elasticsearch(ES_URL, request_timeout=60)
+es = es_client(ES_URL, request_timeout=60)
 
 def scan_ids_and_src() -> List[Dict[str,Any]]:
     fields = [
-        "genre","rating","ratings_count",
-        "feature_flags","assets_screenshot_count","assets_icon_count"
+        "store","app_id","title","genre","rating","ratings_count","installs",
+        "feature_flags","assets_screenshot_count","assets_icon_count", *REVIEW_FEATURES
     ]
+    if FEATURE_SOURCE == "snapshot":
+        import snapshot
+        return snapshot.read_frame("games", fields).to_dict("records")
     q = {"query":{"match_all":{}}, "_source": fields}
     out=[]
     for h in helpers.scan(es, index=ES_INDEX, query=q, size=1000, preserve_order=False):
@@ -28,10 +39,13 @@ def prepare_features(rows,
                      top_genres,
                      top_flags,
                      num_columns: List[str],
-                     feature_columns: List[str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+                     feature_columns: List[str]) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+    import pandas as pd   # فقط مسیر model.pkl؛ مسیر فشرده بدون pandas/sklearn بارگذاری می‌شود
     df = pd.DataFrame(rows)
-    for c in ["genre","rating","ratings_count","feature_flags","assets_screenshot_count","assets_icon_count"]:
+    for c in ["genre","rating","ratings_count","feature_flags","assets_screenshot_count","assets_icon_count", *REVIEW_FEATURES]:
         if c not in df.columns: df[c] = np.nan
+    for c in REVIEW_FEATURES:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
 
     # cast/clean
     df["ratings_count"] = pd.to_numeric(df["ratings_count"], errors="coerce")
@@ -48,6 +62,7 @@ def prepare_features(rows,
         "log_ratings_count": np.log1p(df["ratings_count"].fillna(0).astype(float)),
         "assets_screenshot_count": df["assets_screenshot_count"].astype(float),
         "assets_icon_count": df["assets_icon_count"].astype(float),
+        **review_features(df),
     }, index=df.index)
 
     # categorical (use *trained* OHE)
@@ -82,51 +97,195 @@ def prepare_features(rows,
 
     return X, df
 
-def main():
-    artifact = joblib.load(os.path.join(MODEL_DIR, "model.pkl"))
-    model = artifact["model"]
-    ohe = artifact["ohe_genres"]
-    top_genres = artifact["top_genres"]
+def load_artifact(path: str = "") -> Union[Dict[str, Any], predictor.CompactModel]:
+    """model.npz/model.json کنار model.pkl (مدل خطی) بدون unpickle کردن sklearn؛ در غیر این صورت model.pkl"""
+    model_dir = os.path.dirname(path) if path else MODEL_DIR
+    if ARTIFACT == "compact" or (ARTIFACT == "auto" and predictor.CompactModel.exists(model_dir)):
+        return predictor.CompactModel.load(model_dir)
+    import joblib
+    return joblib.load(path or os.path.join(MODEL_DIR, "model.pkl"))
+
+def score_rows(rows: List[Dict[str, Any]], artifact: Union[Dict[str, Any], predictor.CompactModel]) -> Tuple[np.ndarray, np.ndarray]:
+    """(predicted_success, feature_score) برای هر ردیف، به همان ترتیب rows."""
+    if isinstance(artifact, predictor.CompactModel):
+        return artifact.predict(rows)
     top_flags = artifact["top_flags"]
-    num_columns = artifact["num_columns"]
-    feature_columns = artifact["feature_columns"]  # ⟵ ترتیب نهایی ستون‌ها از آموزش
+    X, df = prepare_features(rows, artifact["ohe_genres"], artifact["top_genres"], top_flags,
+                             artifact["num_columns"], artifact["feature_columns"])  # ⟵ ترتیب نهایی ستون‌ها از آموزش
+
+    # پیش‌بینی
+    proba = artifact["model"].predict_proba(X)[:, 1]
+
+    # feature_score مکمل: نسبت فلگ‌های حاضر به کل top_flags
+    if not top_flags:
+        return proba, np.zeros(len(df), dtype=float)
+    fs = df["feature_flags"].apply(lambda L: len([f for f in (L or []) if f in top_flags]) / max(1, len(top_flags)))
+    return proba, fs.fillna(0.0).astype(float).to_numpy()
+
+# ==================== Leaderboards (Redis) ====================
+# sorted set برای هر (store, genre) و تجمیعی‌ها: lb:{store}:{genre} / lb:{store}:all / lb:all:{genre} / lb:all:all
+# عضو = _id بازی، امتیاز = predicted_success؛ اطلاعات نمایشی در hash {LB_PREFIX}:items، کلید فعلی عضو در {LB_PREFIX}:where
+_redis = None
+
+def redis_client():
+    global _redis
+    if _redis is None and REDIS_URL:
+        from redis import Redis
+        _redis = Redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis
+
+def _lb_key(store: str, genre: str, prefix: str = "") -> str:
+    return f"{prefix or LB_PREFIX}:{store}:{genre}"
+
+def leaderboard_keys(store: str, genre: str, prefix: str = "") -> List[str]:
+    return [_lb_key(store, genre, prefix), _lb_key(store, "all", prefix),
+            _lb_key("all", genre, prefix), _lb_key("all", "all", prefix)]
+
+def leaderboard_entry(row: Dict[str, Any], p: float) -> Tuple[str, str, str, float, str]:
+    """(doc_id, store, genre, score, item_json)"""
+    store = str(row.get("store") or "unknown").lower()
+    genre = str(row.get("genre") or "unknown").lower()
+    item = {"store": row.get("store"), "app_id": row.get("app_id"), "title": row.get("title"), "genre": row.get("genre")}
+    return row["_id"], store, genre, float(round(p, 6)), json.dumps(item, ensure_ascii=False)
+
+def update_leaderboards(entries: List[Tuple[str, str, str, float, str]], chunk: int = 1000) -> int:
+    """به‌روزرسانی افزایشی (worker): اگر store/genre عوض شده عضو از کلیدهای قبلی حذف می‌شود."""
+    r = redis_client()
+    if r is None or not entries:
+        return 0
+    where_key, items_key = f"{LB_PREFIX}:where", f"{LB_PREFIX}:items"
+    for i in range(0, len(entries), chunk):
+        part = entries[i:i + chunk]
+        old = r.hmget(where_key, [e[0] for e in part])
+        pipe = r.pipeline(transaction=False)
+        for (doc_id, store, genre, p, item), prev in zip(part, old):
+            where = f"{store}:{genre}"
+            if prev and prev != where:
+                for k in set(leaderboard_keys(*prev.split(":", 1))) - set(leaderboard_keys(store, genre)):
+                    pipe.zrem(k, doc_id)
+            for k in leaderboard_keys(store, genre):
+                pipe.zadd(k, {doc_id: p})
+                pipe.sadd(f"{LB_PREFIX}:keys", k)
+            pipe.hset(where_key, doc_id, where)
+            pipe.hset(items_key, doc_id, item)
+        pipe.execute()
+    return len(entries)
+
+def rebuild_leaderboards(entries: List[Tuple[str, str, str, float, str]], chunk: int = 5000) -> int:
+    """
+    بازسازی کامل: همه‌چیز زیر پیشوند موقت نوشته و در انتها با یک MULTI/RENAME جایگزین می‌شود
+    (خواننده‌ها هیچ‌وقت leaderboard نیمه‌کاره نمی‌بینند). کلیدهای قدیمی که دیگر عضوی ندارند حذف می‌شوند.
+    """
+    r = redis_client()
+    if r is None:
+        return 0
+    tmp = f"{LB_PREFIX}:tmp"
+    for k in r.smembers(f"{tmp}:keys"):
+        r.delete(k)
+    r.delete(f"{tmp}:keys", f"{tmp}:where", f"{tmp}:items")
+
+    keys = set()
+    for i in range(0, len(entries), chunk):
+        pipe = r.pipeline(transaction=False)
+        by_key: Dict[str, Dict[str, float]] = {}
+        for doc_id, store, genre, p, item in entries[i:i + chunk]:
+            for k in leaderboard_keys(store, genre, tmp):
+                by_key.setdefault(k, {})[doc_id] = p
+            pipe.hset(f"{tmp}:where", doc_id, f"{store}:{genre}")
+            pipe.hset(f"{tmp}:items", doc_id, item)
+        for k, members in by_key.items():
+            pipe.zadd(k, members)
+        if by_key:
+            pipe.sadd(f"{tmp}:keys", *by_key)
+        keys.update(by_key)
+        pipe.execute()
+
+    live = {LB_PREFIX + k[len(tmp):] for k in keys}
+    stale = r.smembers(f"{LB_PREFIX}:keys") - live
+    pipe = r.pipeline(transaction=True)
+    for k in keys:
+        pipe.rename(k, LB_PREFIX + k[len(tmp):])
+    for k in ("where", "items"):
+        if entries:
+            pipe.rename(f"{tmp}:{k}", f"{LB_PREFIX}:{k}")
+        else:
+            pipe.delete(f"{LB_PREFIX}:{k}")
+    if stale:
+        pipe.delete(*stale)
+    pipe.delete(f"{LB_PREFIX}:keys", f"{tmp}:keys")
+    if live:
+        pipe.sadd(f"{LB_PREFIX}:keys", *live)
+    pipe.execute()
+    return len(keys)
+
+def scan_scored() -> List[Tuple[str, str, str, float, str]]:
+    q = {"query": {"exists": {"field": "predicted_success"}},
+         "_source": ["store", "app_id", "title", "genre", "predicted_success"]}
+    out = []
+    for h in helpers.scan(es, index=ES_INDEX, query=q, size=2000, preserve_order=False):
+        src = h.get("_source", {})
+        out.append(leaderboard_entry({"_id": h["_id"], **src}, float(src.get("predicted_success") or 0.0)))
+    return out
+
+def ensure_mapping():
+    try:
+        es.indices.put_mapping(index=ES_INDEX, properties={
+            "predicted_success": {"type": "float"},
+            "feature_score": {"type": "float"},
+        })
+    except Exception as e:
+        print("[SCORE] WARN put_mapping:", e)
+
+def main():
+    ensure_mapping()
+    if MODE == "leaderboards":
+        n = rebuild_leaderboards(scan_scored())
+        print(f"[SCORE] leaderboards rebuilt from index: {n} keys")
+        return
+
+    artifact = load_artifact()
 
     rows = scan_ids_and_src()
     if not rows:
         print("[SCORE] no docs.")
         return
 
-    X, df = prepare_features(rows, ohe, top_genres, top_flags, num_columns, feature_columns)
+    proba, fs = score_rows(rows, artifact)
 
-    # پیش‌بینی
-    proba = model.predict_proba(X)[:, 1]
-
-    # feature_score مکمل: نسبت فلگ‌های حاضر به کل top_flags
-    if top_flags:
-        fs = df["feature_flags"].apply(lambda L: len([f for f in (L or []) if f in top_flags]) / max(1, len(top_flags)))
-    else:
-        fs = pd.Series(0.0, index=df.index)
-    fs = fs.fillna(0.0).astype(float)
+    # sketch همین پاس برای مقایسه با baseline آموزش
+    sketch = drift.FeatureSketch()
+    sketch.update_many(rows)
+    sketch.add_scores("predicted_success", proba)
+    sketch.add_scores("feature_score", fs)
 
     updates=[]
-    for doc_id, p, sc in zip([r["_id"] for r in rows], proba, fs):
-        updates.append({
-            "_op_type":"update",
-            "_index": ES_INDEX,
-            "_id": doc_id,
-            "doc": {
-                "predicted_success": float(round(p,6)),
-                "feature_score": float(round(sc,6)),
-            },
-            "doc_as_upsert": True
-        })
-        if len(updates) >= BATCH:
+    with BulkSession(es, [ES_INDEX], name="score"):
+        for doc_id, p, sc in zip([r["_id"] for r in rows], proba, fs):
+            updates.append({
+                "_op_type":"update",
+                "_index": ES_INDEX,
+                "_id": doc_id,
+                "doc": {
+                    "predicted_success": float(round(p,6)),
+                    "feature_score": float(round(sc,6)),
+                },
+                "doc_as_upsert": True
+            })
+            if len(updates) >= BATCH:
+                helpers.bulk(es, updates, raise_on_error=False, request_timeout=120)
+                updates.clear()
+        if updates:
             helpers.bulk(es, updates, raise_on_error=False, request_timeout=120)
-            updates.clear()
-    if updates:
-        helpers.bulk(es, updates, raise_on_error=False, request_timeout=120)
 
     print("[SCORE] done. wrote predicted_success & feature_score")
+    drift.finish_run("score", sketch, MODEL_DIR)
+
+    if redis_client() is not None:
+        try:
+            n = rebuild_leaderboards([leaderboard_entry(r, p) for r, p in zip(rows, proba)])
+            print(f"[SCORE] leaderboards rebuilt: {n} keys")
+        except Exception as e:
+            print("[SCORE] WARN leaderboards:", e)
 
 if __name__ == "__main__":
     main()
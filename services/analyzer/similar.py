@@ -0,0 +1,226 @@
+# services/analyzer/similar.py
+"""
+بردار فشرده‌ی هر بازی برای «بازی‌های مشابه» (endpoint /similar در API).
+
+بردار = TruncatedSVD روی [TF-IDF عنوان+توضیحات | feature_flags | ژانر]، L2-نرمال، float32.
+خروجی در SIMILAR_DIR:
+  vectors.npy   ماتریس (n, dim) که API با mmap می‌خواند
+  items.json    ترتیب ردیف‌ها: [{"id","store","app_id","title","genre"}, ...]
+  model.pkl     vectorizer/vocab/svd برای به‌روزرسانی افزایشی
+  meta.json     زمان ساخت و ابعاد (API با تغییر mtime آن دوباره بارگذاری می‌کند)
+
+اجرای پیش‌فرض افزایشی است: فقط بازی‌هایی که indexed_at یا features_indexed_at آن‌ها بعد از
+ساخت قبلی است (بعد از خزش/miner، با range query) با همان مدل transform و جایگزین/اضافه می‌شوند و
+بازی‌هایی که از ایندکس حذف شده‌اند از vectors/items برداشته می‌شوند.
+SIMILAR_MODE=full یا نبودن مدل → ساخت کامل. SIMILAR_LOOP_SEC>0 → اجرای دائمی (سرویس similar در compose).
+"""
+import os, json, time, datetime as dt
+from typing import Any, Dict, List, Set, Tuple
+
+import numpy as np
+import joblib
+from elasticsearch import Elasticsearch, helpers
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+ES_URL       = os.getenv("ES_HOST", "http://es:9200").rstrip("/")
+ES_INDEX     = os.getenv("ES_INDEX", "games")
+MODEL_DIR    = os.getenv("MODEL_DIR", "/models")
+SIMILAR_DIR  = os.getenv("SIMILAR_DIR", os.path.join(MODEL_DIR, "similar"))
+MODE         = os.getenv("SIMILAR_MODE", "incremental").strip().lower()
+DIM          = int(os.getenv("SIMILAR_DIM", "128"))
+MAX_FEATURES = int(os.getenv("SIMILAR_MAX_FEATURES", "50000"))
+FLAG_WEIGHT  = float(os.getenv("SIMILAR_FLAG_WEIGHT", "0.5"))
+GENRE_WEIGHT = float(os.getenv("SIMILAR_GENRE_WEIGHT", "0.7"))
+LOOP_SEC     = int(os.getenv("SIMILAR_LOOP_SEC", "0"))       # 0 = یک بار
+
+es = Elasticsearch(ES_URL, request_timeout=60)
+
+FIELDS = ["store", "app_id", "title", "description", "genre", "feature_flags", "indexed_at", "features_indexed_at"]
+
+def _text(src: Dict[str, Any]) -> str:
+    return f"{src.get('title') or ''} {src.get('title') or ''} {src.get('description') or ''}".replace("‌", " ")
+
+def _item(doc_id: str, src: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": doc_id, "store": src.get("store"), "app_id": src.get("app_id"),
+            "title": src.get("title"), "genre": src.get("genre")}
+
+# ==================== Features ====================
+def _onehot(values: List[List[str]], vocab: Dict[str, int], weight: float) -> sparse.csr_matrix:
+    rows, cols = [], []
+    for i, vs in enumerate(values):
+        for v in vs:
+            j = vocab.get(v)
+            if j is not None:
+                rows.append(i); cols.append(j)
+    data = np.full(len(rows), weight, dtype=np.float32)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(values), max(1, len(vocab))))
+
+def _flags(srcs: List[Dict]) -> List[List[str]]:
+    return [[str(f).lower() for f in (s.get("feature_flags") or [])] for s in srcs]
+
+def _genres(srcs: List[Dict]) -> List[List[str]]:
+    return [[str(s.get("genre") or "unknown").lower()] for s in srcs]
+
+def featurize(model: Dict[str, Any], srcs: List[Dict]) -> sparse.csr_matrix:
+    return sparse.hstack([
+        model["tfidf"].transform([_text(s) for s in srcs]),
+        _onehot(_flags(srcs), model["flags"], FLAG_WEIGHT),
+        _onehot(_genres(srcs), model["genres"], GENRE_WEIGHT),
+    ]).tocsr()
+
+def embed(model: Dict[str, Any], srcs: List[Dict]) -> np.ndarray:
+    v = model["svd"].transform(featurize(model, srcs)).astype(np.float32)
+    v /= np.maximum(np.linalg.norm(v, axis=1, keepdims=True), 1e-12)
+    return v
+
+def fit(srcs: List[Dict]) -> Dict[str, Any]:
+    tfidf = TfidfVectorizer(max_features=MAX_FEATURES, min_df=2, sublinear_tf=True,
+                            token_pattern=r"(?u)\b\w\w+\b", dtype=np.float32)
+    tfidf.fit([_text(s) for s in srcs])
+    model: Dict[str, Any] = {
+        "tfidf": tfidf,
+        "flags": {f: i for i, f in enumerate(sorted({f for fs in _flags(srcs) for f in fs}))},
+        "genres": {g: i for i, g in enumerate(sorted({g for gs in _genres(srcs) for g in gs}))},
+    }
+    X = featurize(model, srcs)
+    model["svd"] = TruncatedSVD(n_components=max(2, min(DIM, X.shape[1] - 1, len(srcs) - 1)), random_state=42).fit(X)
+    return model
+
+# ==================== Storage ====================
+def _path(name: str) -> str:
+    return os.path.join(SIMILAR_DIR, name)
+
+def load_existing() -> Tuple[Any, List[Dict], np.ndarray, Dict]:
+    try:
+        model = joblib.load(_path("model.pkl"))
+        with open(_path("items.json"), "r", encoding="utf-8") as f:
+            items = json.load(f)
+        with open(_path("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(_path("vectors.npy"))
+        return model, items, vectors, meta
+    except (OSError, ValueError):
+        return None, [], np.zeros((0, 0), dtype=np.float32), {}
+
+def save(model: Dict, items: List[Dict], vectors: np.ndarray, built_at: str):
+    os.makedirs(SIMILAR_DIR, exist_ok=True)
+    # اول داده‌ها، آخر meta.json (API با mtime آن بارگذاری می‌کند)
+    joblib.dump(model, _path("model.pkl.tmp")); os.replace(_path("model.pkl.tmp"), _path("model.pkl"))
+    np.save(_path("vectors.tmp.npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(_path("vectors.tmp.npy"), _path("vectors.npy"))
+    with open(_path("items.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(items, f, ensure_ascii=False)
+    os.replace(_path("items.json.tmp"), _path("items.json"))
+    meta = {"built_at": built_at, "count": len(items), "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0}
+    with open(_path("meta.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(_path("meta.json.tmp"), _path("meta.json"))
+
+# ==================== ES ====================
+def scan_all() -> Tuple[List[str], List[Dict]]:
+    ids, srcs = [], []
+    for h in helpers.scan(es, index=ES_INDEX, query={"query": {"match_all": {}}, "_source": FIELDS}, size=1000):
+        ids.append(h["_id"]); srcs.append(h.get("_source", {}))
+    return ids, srcs
+
+def ensure_mapping() -> bool:
+    """features_indexed_at را مپ می‌کند؛ True یعنی تازه اضافه شد (سندهای قبلی در range دیده نمی‌شوند → ساخت کامل)"""
+    try:
+        props = es.indices.get_mapping(index=ES_INDEX)
+        if all("features_indexed_at" in (m.get("mappings", {}).get("properties") or {}) for m in props.values()):
+            return False
+        es.indices.put_mapping(index=ES_INDEX, properties={"features_indexed_at": {"type": "date"}})
+        return True
+    except Exception as e:
+        print("[SIM] WARN put_mapping:", e)
+        return False
+
+def changed_since(built_at: str) -> List[str]:
+    if not built_at:
+        return [h["_id"] for h in helpers.scan(es, index=ES_INDEX, query={"query": {"match_all": {}}, "_source": False})]
+    q = {"bool": {"should": [{"range": {"indexed_at": {"gt": built_at}}},
+                             {"range": {"features_indexed_at": {"gt": built_at}}}],
+                  "minimum_should_match": 1}}
+    return [h["_id"] for h in helpers.scan(es, index=ES_INDEX, query={"query": q, "_source": False}, size=5000)]
+
+def live_ids() -> Set[str]:
+    q = {"query": {"match_all": {}}, "_source": False}
+    return {h["_id"] for h in helpers.scan(es, index=ES_INDEX, query=q, size=10000)}
+
+def drop_deleted(items: List[Dict], vectors: np.ndarray) -> Tuple[List[Dict], np.ndarray, int]:
+    """
+    بازی‌های حذف‌شده از ایندکس؛ اسکن شناسه‌ها فقط وقتی که count ایندکس با تعداد ردیف‌ها نمی‌خواند
+    (همه‌ی سندهای ایندکس در items هستند، پس count کمتر یعنی حذف)
+    """
+    if es.count(index=ES_INDEX)["count"] >= len(items):
+        return items, vectors, 0
+    live = live_ids()
+    keep = [i for i, it in enumerate(items) if it["id"] in live]
+    return [items[i] for i in keep], vectors[keep], len(items) - len(keep)
+
+def fetch_docs(ids: List[str], chunk: int = 1000) -> Tuple[List[str], List[Dict]]:
+    got_ids, srcs = [], []
+    for i in range(0, len(ids), chunk):
+        resp = es.mget(index=ES_INDEX, ids=ids[i:i + chunk], _source=FIELDS)
+        for d in resp.get("docs", []):
+            if d.get("found"):
+                got_ids.append(d["_id"]); srcs.append(d.get("_source", {}))
+    return got_ids, srcs
+
+# ==================== Main ====================
+def build_full(built_at: str):
+    ids, srcs = scan_all()
+    if len(ids) < 3:
+        print("[SIM] not enough games.")
+        return
+    model = fit(srcs)
+    vectors = embed(model, srcs)
+    save(model, [_item(i, s) for i, s in zip(ids, srcs)], vectors, built_at)
+    print(f"[SIM] full build: {len(ids)} games, dim={vectors.shape[1]}")
+
+def run_once(full: bool = False):
+    t0 = time.time()
+    built_at = dt.datetime.utcnow().isoformat(timespec="seconds")
+    model, items, vectors, meta = (None, [], None, {}) if full else load_existing()
+    if model is None or not items:
+        build_full(built_at)
+        print(f"[SIM] done in {time.time() - t0:.1f}s")
+        return
+
+    ids, srcs = fetch_docs(changed_since(meta.get("built_at", "")))
+    updated = added = 0
+    if ids:
+        new_vecs = embed(model, srcs)
+        pos = {it["id"]: i for i, it in enumerate(items)}
+        append_items, append_rows = [], []
+        for doc_id, src, v in zip(ids, srcs, new_vecs):
+            i = pos.get(doc_id)
+            if i is None:
+                append_items.append(_item(doc_id, src)); append_rows.append(v)
+            else:
+                items[i] = _item(doc_id, src); vectors[i] = v
+        if append_rows:
+            vectors = np.vstack([vectors, np.stack(append_rows)])
+            items.extend(append_items)
+        updated, added = len(ids) - len(append_rows), len(append_rows)
+    items, vectors, removed = drop_deleted(items, vectors)
+    if not (updated or added or removed):
+        print("[SIM] nothing changed since", meta.get("built_at"))
+        return
+    save(model, items, vectors, built_at)
+    print(f"[SIM] incremental: updated={updated} added={added} removed={removed} total={len(items)} "
+          f"in {time.time() - t0:.1f}s")
+
+def main():
+    full = ensure_mapping() or MODE == "full"
+    while True:
+        run_once(full)
+        if LOOP_SEC <= 0:
+            break
+        full = False
+        time.sleep(LOOP_SEC)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# services/analyzer/snapshot.py
+"""
+اسنپ‌شات ستونی (Parquet) از ایندکس‌های games / reviews / assets برای آموزش، اسکوردهی و تحلیل‌های موردی.
+
+ساختار روی دیسک (SNAPSHOT_DIR):
+  {index}/store={store}/part-YYYYmmddTHHMMSSffffff.parquet  پارتیشن hive روی store، zstd
+  {index}/_state.json                                  watermark روی indexed_at و snapshot_id
+
+- اجرای پیش‌فرض افزایشی است: فقط سندهای indexed_at >= watermark قبلی در یک part جدید نوشته می‌شوند؛
+  خواننده برای هر _id جدیدترین ردیف (بیشترین _snap_at) را نگه می‌دارد.
+- وقتی تعداد partهای یک پارتیشن از SNAPSHOT_MAX_PARTS بیشتر شد همان پارتیشن در یک فایل فشرده می‌شود.
+- خروجی miner/score (metric_*، predicted_success، ...) indexed_at را عوض نمی‌کند؛ بعد از اجرای آن‌ها
+  SNAPSHOT_MODE=full بزنید.
+
+خواندن (train.py / score.py با FEATURE_SOURCE=snapshot):
+  read_frame("games", ["genre", "rating", ...])   → DataFrame با projection ستون‌ها و memory map
+
+اجرا:
+  docker compose run --rm analyzer python /app/snapshot.py
+  SNAPSHOT_INDEXES=games,reviews,assets SNAPSHOT_MODE=full docker compose run --rm analyzer python /app/snapshot.py
+"""
+import os, json, glob, time, datetime as dt
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from elasticsearch import Elasticsearch, helpers
+
+ES_URL       = os.getenv("ES_HOST", "http://es:9200").rstrip("/")
+MODEL_DIR    = os.getenv("MODEL_DIR", "/models")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(MODEL_DIR, "snapshot"))
+MODE         = os.getenv("SNAPSHOT_MODE", "incremental").strip().lower()   # incremental | full
+INDEXES      = [i.strip() for i in os.getenv("SNAPSHOT_INDEXES", "games").split(",") if i.strip()]
+ROW_GROUP    = int(os.getenv("SNAPSHOT_ROW_GROUP", "50000"))
+MAX_PARTS    = int(os.getenv("SNAPSHOT_MAX_PARTS", "8"))
+SCROLL_SIZE  = int(os.getenv("SNAPSHOT_SCROLL_SIZE", "2000"))
+
+# نام ایندکس در ES (ES_INDEX / ES_REVIEWS_INDEX / ES_ASSETS_INDEX) ← نام منطقی اسنپ‌شات
+ES_NAMES = {
+    "games": os.getenv("ES_INDEX", "games"),
+    "reviews": os.getenv("ES_REVIEWS_INDEX", "reviews"),
+    "assets": os.getenv("ES_ASSETS_INDEX", "assets"),
+}
+
+_TYPES = {
+    "str": pa.string(), "float": pa.float64(), "int": pa.int64(),
+    "list": pa.list_(pa.string()), "date": pa.timestamp("ms", tz="UTC"),
+}
+
+# store ستون پارتیشن است و داخل فایل‌ها نوشته نمی‌شود
+SCHEMAS: Dict[str, Dict[str, str]] = {
+    "games": {
+        "app_id": "str", "title": "str", "genre": "str", "developer": "str",
+        "rating": "float", "ratings_count": "int", "installs": "int",
+        "feature_flags": "list", "monetization": "list",
+        "assets_icon_count": "int", "assets_screenshot_count": "int", "screenshot_count": "int", "video_count": "int",
+        "metric_reviews_count": "float", "metric_review_rating_avg": "float", "metric_review_low_share": "float",
+        "metric_review_age_days": "float", "metric_review_text_len_avg": "float", "metric_review_text_len_max": "float",
+        "predicted_success": "float", "feature_score": "float", "clone_cluster_id": "str",
+        "released_at": "date", "updated_at": "date", "indexed_at": "date",
+    },
+    "reviews": {
+        "app_id": "str", "app_title": "str", "author": "str", "rating": "float", "title": "str", "body": "str",
+        "sentiment": "str", "sentiment_score": "float", "topics": "list",
+        "created_at": "date", "indexed_at": "date",
+    },
+    "assets": {
+        "app_id": "str", "type": "str", "url": "str", "width": "int", "height": "int",
+        "phash": "str", "dhash": "str", "palette": "list", "image_bytes": "int", "image_error": "str",
+        "image_at": "date", "indexed_at": "date",
+    },
+}
+
+def schema_for(index: str) -> pa.Schema:
+    cols = SCHEMAS[index]
+    return pa.schema([("_id", pa.string()), *[(c, _TYPES[t]) for c, t in cols.items()], ("_snap_at", pa.string())])
+
+# ==================== Values ====================
+def _ts(v: Any) -> Optional[dt.datetime]:
+    if not v: return None
+    try:
+        t = dt.datetime.fromisoformat(str(v).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return t if t.tzinfo else t.replace(tzinfo=dt.timezone.utc)
+
+def _value(v: Any, typ: str) -> Any:
+    if v is None: return None
+    try:
+        if typ == "float": return float(v)
+        if typ == "int": return int(float(v))
+        if typ == "list": return [str(x) for x in (v if isinstance(v, list) else [v])]
+        if typ == "date": return _ts(v)
+        return v if isinstance(v, str) else json.dumps(v, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+
+def to_table(index: str, hits: List[Dict[str, Any]], snap_at: str) -> pa.Table:
+    cols = SCHEMAS[index]
+    data: Dict[str, List[Any]] = {"_id": [h["_id"] for h in hits]}
+    for c, t in cols.items():
+        data[c] = [_value(h["_source"].get(c), t) for h in hits]
+    data["_snap_at"] = [snap_at] * len(hits)
+    return pa.Table.from_pydict(data, schema=schema_for(index))
+
+# ==================== State ====================
+def _root(index: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, index)
+
+def load_state(index: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(_root(index), "_state.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(index: str, state: Dict[str, Any]):
+    path = os.path.join(_root(index), "_state.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+def snapshot_id(index: str = "games") -> str:
+    """شناسه‌ی نسخه‌ی فعلی اسنپ‌شات (برای کلید cache)؛ خالی یعنی اسنپ‌شاتی وجود ندارد."""
+    return str(load_state(index).get("snapshot_id") or "")
+
+# ==================== Write ====================
+def scan_hits(es: Elasticsearch, index: str, since: str) -> Iterator[Dict[str, Any]]:
+    query: Dict[str, Any] = {"range": {"indexed_at": {"gte": since}}} if since else {"match_all": {}}
+    body = {"query": query, "_source": ["store", *SCHEMAS[index]]}
+    yield from helpers.scan(es, index=ES_NAMES[index], query=body, size=SCROLL_SIZE, preserve_order=False)
+
+def _partition(store: Any) -> str:
+    s = str(store or "unknown").strip().lower() or "unknown"
+    return "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in s)
+
+def write_parts(index: str, hits: Iterable[Dict[str, Any]], snap_at: str) -> Dict[str, Any]:
+    """hitها را بر اساس store در part جدید هر پارتیشن می‌نویسد؛ خروجی: تعداد ردیف و بیشینه‌ی indexed_at"""
+    schema = schema_for(index)
+    part = f"part-{snap_at}.parquet"
+    writers: Dict[str, pq.ParquetWriter] = {}
+    bufs: Dict[str, List[Dict[str, Any]]] = {}
+    rows, max_ts = 0, None
+
+    def flush(p: str):
+        if not bufs.get(p): return
+        if p not in writers:
+            d = os.path.join(_root(index), f"store={p}")
+            os.makedirs(d, exist_ok=True)
+            writers[p] = pq.ParquetWriter(os.path.join(d, "." + part + ".tmp"), schema, compression="zstd")
+        writers[p].write_table(to_table(index, bufs[p], snap_at), row_group_size=ROW_GROUP)
+        bufs[p] = []
+
+    try:
+        for h in hits:
+            src = h.get("_source", {})
+            p = _partition(src.get("store"))
+            bufs.setdefault(p, []).append(h)
+            rows += 1
+            t = _ts(src.get("indexed_at"))
+            if t and (max_ts is None or t > max_ts): max_ts = t
+            if len(bufs[p]) >= ROW_GROUP:
+                flush(p)
+        for p in list(bufs):
+            flush(p)
+    finally:
+        for w in writers.values():
+            w.close()
+    # فایل‌های نقطه‌دار را خواننده نادیده می‌گیرد؛ partها فقط بعد از نوشتن کامل همه‌ی پارتیشن‌ها دیده می‌شوند
+    for p in writers:
+        d = os.path.join(_root(index), f"store={p}")
+        os.replace(os.path.join(d, "." + part + ".tmp"), os.path.join(d, part))
+    return {"rows": rows, "max_indexed_at": max_ts.isoformat() if max_ts else None, "partitions": sorted(writers)}
+
+def compact(index: str, partition_dir: str):
+    """همه‌ی partهای یک پارتیشن → یک فایل با آخرین ردیف هر _id"""
+    files = sorted(glob.glob(os.path.join(partition_dir, "part-*.parquet")))
+    if len(files) <= MAX_PARTS:
+        return
+    df = pq.read_table(files, schema=schema_for(index), memory_map=True).to_pandas()
+    df = df.sort_values("_snap_at", kind="stable").drop_duplicates("_id", keep="last")
+    last = os.path.basename(files[-1])
+    out = os.path.join(partition_dir, "." + last + ".compact")
+    pq.write_table(pa.Table.from_pandas(df, schema=schema_for(index), preserve_index=False), out,
+                   compression="zstd", row_group_size=ROW_GROUP)
+    for f in files:
+        os.remove(f)
+    os.replace(out, os.path.join(partition_dir, last))
+    print(f"[SNAP] compacted {index}/{os.path.basename(partition_dir)}: {len(files)} parts → {len(df)} rows")
+
+def snapshot_index(es: Elasticsearch, index: str, full: bool):
+    state = {} if full else load_state(index)
+    since = state.get("watermark") or ""
+    if not since:
+        full = True
+    if full and os.path.isdir(_root(index)):
+        for f in glob.glob(os.path.join(_root(index), "store=*", "part-*.parquet")):
+            os.remove(f)
+    os.makedirs(_root(index), exist_ok=True)
+
+    t0 = time.time()
+    snap_at = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    res = write_parts(index, scan_hits(es, index, since), snap_at)
+    for d in glob.glob(os.path.join(_root(index), "store=*")):
+        compact(index, d)
+
+    save_state(index, {
+        "snapshot_id": f"{index}-{snap_at}" if res["rows"] or not state else state.get("snapshot_id"),
+        "watermark": res["max_indexed_at"] or since,
+        "updated_at": snap_at,
+        "rows_last_run": res["rows"],
+    })
+    print(f"[SNAP] {index}: {'full' if full else 'incremental since ' + since} → {res['rows']} rows "
+          f"in {len(res['partitions'])} partitions ({time.time() - t0:.1f}s)")
+
+# ==================== Read ====================
+def read_table(index: str, columns: Optional[List[str]] = None, stores: Optional[List[str]] = None) -> pa.Table:
+    """projection ستون‌ها + memory map؛ ردیف‌های تکراری (partهای افزایشی) به جدیدترین نسخه کاهش می‌یابند."""
+    root = _root(index)
+    if not glob.glob(os.path.join(root, "store=*", "part-*.parquet")):
+        raise FileNotFoundError(f"no snapshot for {index} in {root} (run analyzer snapshot.py)")
+    schema = schema_for(index).append(pa.field("store", pa.string()))
+    cols = None if columns is None else list(dict.fromkeys(["_id", *columns, "_snap_at"]))
+    filters = [("store", "in", [_partition(s) for s in stores])] if stores else None
+    t = pq.read_table(root, columns=cols, filters=filters, memory_map=True, schema=schema,
+                      partitioning="hive", ignore_prefixes=["_", "."])
+    if t.num_rows and pc.count_distinct(t["_id"]).as_py() != t.num_rows:
+        # بعد از مرتب‌سازی نزولی روی _snap_at، اولین وقوع هر _id جدیدترین نسخه‌ی آن است
+        t = t.sort_by([("_snap_at", "descending")])
+        _, first = np.unique(t["_id"].to_numpy(zero_copy_only=False), return_index=True)
+        t = t.take(np.sort(first))
+    return t
+
+def read_frame(index: str, columns: Optional[List[str]] = None, stores: Optional[List[str]] = None):
+    """DataFrame با _id و ستون‌های خواسته‌شده؛ ستون‌های list به list پایتون تبدیل می‌شوند (سازگار با خروجی ES)."""
+    df = read_table(index, columns, stores).to_pandas()
+    for c, t in SCHEMAS[index].items():
+        if t == "list" and c in df.columns:
+            df[c] = df[c].map(lambda v: None if v is None else list(v))
+    return df.drop(columns=["_snap_at"], errors="ignore")
+
+def main():
+    es = Elasticsearch(ES_URL, request_timeout=120)
+    for index in INDEXES:
+        if index not in SCHEMAS:
+            print(f"[SNAP] unknown index {index}; expected one of {sorted(SCHEMAS)}")
+            continue
+        snapshot_index(es, index, MODE == "full")
+
+if __name__ == "__main__":
+    main()
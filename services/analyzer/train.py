@@ -1,37 +1,53 @@
-import os, json
-from typing import List, Dict, Any
+import os, json, time, shutil, hashlib
+from typing import List, Dict, Any, Optional, Tuple, Union
 from elasticsearch import Elasticsearch, helpers
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.linear_model import LogisticRegression
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.model_selection import StratifiedKFold
+from joblib import Parallel, delayed
 from sklearn.metrics import roc_auc_score, classification_report
 import joblib
 
+import drift
+import predictor
+from predictor import REVIEW_FEATURES, review_features
+
 ES_URL   = os.getenv("ES_HOST", "http://es:9200").rstrip("/")
 ES_INDEX = os.getenv("ES_INDEX", "games")
 MODEL_DIR = os.getenv("MODEL_DIR", "/models")
 TOP_K_GENRES = int(os.getenv("TOP_K_GENRES","20"))
 TOP_K_FLAGS  = int(os.getenv("TOP_K_FLAGS","40"))
+MODE         = os.getenv("TRAIN_MODE", "train").strip().lower()      # train | select
+MODEL_KIND   = os.getenv("MODEL_KIND", "logreg").strip().lower()     # logreg | hgb
+MODEL_PARAMS = json.loads(os.getenv("MODEL_PARAMS", "") or "{}")     # مثلاً {"C": 0.3, "class_weight": "balanced"}
+FEATURE_SOURCE = os.getenv("FEATURE_SOURCE", "es").strip().lower()   # es | snapshot (خروجی snapshot.py)
 
 es = Elasticsearch(ES_URL, request_timeout=60)
 
-def scan_games() -> List[Dict[str, Any]]:
+def scan_games() -> Union[List[Dict[str, Any]], pd.DataFrame]:
     fields = [
-        "title","genre","rating","ratings_count",
-        "feature_flags","assets_screenshot_count","assets_icon_count"
+        "store","title","genre","rating","ratings_count","installs",
+        "feature_flags","assets_screenshot_count","assets_icon_count", *REVIEW_FEATURES
     ]
+    if FEATURE_SOURCE == "snapshot":
+        import snapshot
+        return snapshot.read_frame("games", fields)
     q = {"query":{"match_all":{}}, "_source": fields}
     rows = []
     for h in helpers.scan(es, index=ES_INDEX, query=q, size=1000, preserve_order=False):
         rows.append(h.get("_source", {}))
     return rows
 
-def prepare_dataframe(rows: List[Dict[str,Any]]) -> pd.DataFrame:
-    df = pd.DataFrame(rows)
-    for c in ["genre","rating","ratings_count","feature_flags","assets_screenshot_count","assets_icon_count"]:
+def prepare_dataframe(rows: Union[List[Dict[str,Any]], pd.DataFrame]) -> pd.DataFrame:
+    df = rows.copy() if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+    for c in ["genre","rating","ratings_count","feature_flags","assets_screenshot_count","assets_icon_count", *REVIEW_FEATURES]:
         if c not in df.columns: df[c] = np.nan
+    for c in REVIEW_FEATURES:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
 
     df["ratings_count"] = pd.to_numeric(df["ratings_count"], errors="coerce")
     df["rating"] = pd.to_numeric(df["rating"], errors="coerce")
@@ -50,19 +66,78 @@ def label_success(df: pd.DataFrame) -> pd.Series:
 
 def flags_to_frame(flags_col: pd.Series, top_flags: List[str]) -> pd.DataFrame:
     data = {f"flag__{f}": flags_col.apply(lambda L: 1 if f in (L or []) else 0) for f in top_flags}
-    return pd.DataFrame(data)
+    return pd.DataFrame(data, index=flags_col.index)
 
-def main():
-    print("[TRAIN] fetching data from ES ...")
-    rows = scan_games()
-    if not rows:
-        print("[TRAIN] no data found.")
-        return
+# ==================== Feature-matrix cache ====================
+# ماتریس کدشده + برچسب‌ها روی دیسک؛ کلید = نسخه‌ی داده (snapshot_id یا max_seq_no شاردها) + تنظیمات encoder.
+# با تغییر فقط مدل/هایپرپارامترها اسکن و کدگذاری کامل رد می‌شود. FEATURE_VERSION را با تغییر منطق کدگذاری بالا ببرید.
+FEATURE_VERSION     = 2
+FEATURE_CACHE       = os.getenv("FEATURE_CACHE", "1") == "1"
+FEATURE_CACHE_DIR   = os.getenv("FEATURE_CACHE_DIR", os.path.join(MODEL_DIR, "feature_cache"))
+FEATURE_CACHE_MAX   = int(os.getenv("FEATURE_CACHE_MAX", "4"))      # تعداد ورودی‌ها (LRU)
+FEATURE_CACHE_MAX_MB = int(os.getenv("FEATURE_CACHE_MAX_MB", "4096"))
 
-    df = prepare_dataframe(rows)
-    print(f"[TRAIN] rows: {len(df)}")
-    y = label_success(df)
+def data_version() -> str:
+    if FEATURE_SOURCE == "snapshot":
+        import snapshot
+        return snapshot.snapshot_id("games")
+    # max_seq_no هر شارد با هر index/update/delete بالا می‌رود و بعد از restart هم حفظ می‌شود
+    stats = es.indices.stats(index=ES_INDEX, level="shards")
+    seqs = []
+    for name, idx in sorted(stats.get("indices", {}).items()):
+        for sid, copies in sorted(idx.get("shards", {}).items()):
+            primaries = [c for c in copies if c.get("routing", {}).get("primary")]
+            seqs.append(f"{name}/{sid}:{max((c.get('seq_no') or {}).get('max_seq_no', -1) for c in primaries or copies)}")
+    return ",".join(seqs)
+
+def cache_key(version: str) -> str:
+    cfg = {"data": version, "source": FEATURE_SOURCE, "top_k_genres": TOP_K_GENRES, "top_k_flags": TOP_K_FLAGS,
+           "review_features": REVIEW_FEATURES, "feature_version": FEATURE_VERSION,
+           "drift_fields": drift.NUMERIC_FIELDS}   # baseline drift هم داخل enc کش می‌شود
+    return hashlib.sha1(json.dumps(cfg, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def _cache_entries() -> List[str]:
+    if not os.path.isdir(FEATURE_CACHE_DIR): return []
+    dirs = [os.path.join(FEATURE_CACHE_DIR, d) for d in os.listdir(FEATURE_CACHE_DIR) if not d.startswith(".")]
+    return sorted((d for d in dirs if os.path.isfile(os.path.join(d, "meta.pkl"))), key=os.path.getmtime, reverse=True)
+
+def _dir_mb(d: str) -> float:
+    return sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d)) / 1e6
 
+def evict_cache(keep: str = ""):
+    total = 0.0
+    for i, d in enumerate(_cache_entries()):
+        total += _dir_mb(d)
+        if d != keep and (i >= FEATURE_CACHE_MAX or total > FEATURE_CACHE_MAX_MB):
+            shutil.rmtree(d, ignore_errors=True)
+            print(f"[TRAIN] evicted feature cache {os.path.basename(d)}")
+
+def load_cached(key: str) -> Optional[Tuple[pd.DataFrame, pd.Series, Dict[str, Any]]]:
+    d = os.path.join(FEATURE_CACHE_DIR, key)
+    try:
+        enc = joblib.load(os.path.join(d, "meta.pkl"))
+        X = np.load(os.path.join(d, "X.npy"), mmap_mode="r")
+        y = np.load(os.path.join(d, "y.npy"))
+    except (OSError, ValueError, EOFError):
+        return None
+    os.utime(d)  # LRU
+    return pd.DataFrame(X, columns=enc["feature_columns"]), pd.Series(y), enc
+
+def save_cached(key: str, X: pd.DataFrame, y: pd.Series, enc: Dict[str, Any]):
+    d = os.path.join(FEATURE_CACHE_DIR, key)
+    tmp = os.path.join(FEATURE_CACHE_DIR, f".{key}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "X.npy"), np.ascontiguousarray(X.to_numpy(dtype=np.float32)))
+    np.save(os.path.join(tmp, "y.npy"), y.to_numpy(dtype=np.int8))
+    joblib.dump(enc, os.path.join(tmp, "meta.pkl"))
+    shutil.rmtree(d, ignore_errors=True)
+    os.replace(tmp, d)
+    evict_cache(keep=d)
+
+# ==================== Encoding ====================
+def encode(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """X نهایی + encoderها (همان چیزی که score.py از artifact لازم دارد)"""
     # top genres + clip
     top_genres = df["genre"].value_counts().head(TOP_K_GENRES).index.tolist()
     df["genre_clipped"] = df["genre"].where(df["genre"].isin(top_genres), other="__other__")
@@ -85,20 +160,170 @@ def main():
         "log_ratings_count": np.log1p(df["ratings_count"].fillna(0).astype(float)),
         "assets_screenshot_count": df["assets_screenshot_count"].astype(float),
         "assets_icon_count": df["assets_icon_count"].astype(float),
+        **review_features(df),
     }, index=df.index)
-    num_columns = list(X_num.columns)
 
     # concat
     X = pd.concat([X_num, X_cat, X_flags], axis=1)
+    return X, {
+        "ohe_genres": ohe,
+        "top_genres": top_genres,
+        "top_flags": top_flags,
+        "num_columns": list(X_num.columns),
+        "feature_columns": list(X.columns),  # ⟵ مهم: ترتیب نهایی ستون‌ها
+    }
+
+def load_matrix() -> Optional[Tuple[pd.DataFrame, pd.Series, Dict[str, Any]]]:
+    key = ""
+    if FEATURE_CACHE:
+        try:
+            key = cache_key(data_version())
+        except Exception as e:
+            print("[TRAIN] WARN data version unavailable, cache disabled:", e)
+        hit = load_cached(key) if key else None
+        if hit is not None:
+            print(f"[TRAIN] feature cache hit {key}: {hit[0].shape}")
+            return hit
+
+    print(f"[TRAIN] fetching data from {FEATURE_SOURCE} ...")
+    rows = scan_games()
+    if len(rows) == 0:
+        print("[TRAIN] no data found.")
+        return None
 
-    # ذخیره‌ی «ترتیب» فیچرها
-    feature_columns = list(X.columns)
+    raw = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+    df = prepare_dataframe(raw)
+    print(f"[TRAIN] rows: {len(df)}")
+    y = label_success(df)
+    X, enc = encode(df)
+    # baseline drift از همین داده، قبل از fillna (بخش امتیازها بعد از آموزش اضافه می‌شود)
+    base = drift.FeatureSketch()
+    cols: Dict[str, Any] = {f: pd.to_numeric(raw[f], errors="coerce").to_numpy(dtype=float)
+                            for f in drift.NUMERIC_FIELDS if f in raw.columns}
+    cols.update({f: raw[f].tolist() for f in drift.CATEGORICAL_FIELDS + drift.MULTI_FIELDS if f in raw.columns})
+    base.update_columns(len(raw), cols)
+    enc["drift_baseline"] = base.to_dict()
+    if key:
+        save_cached(key, X, y, enc)
+        print(f"[TRAIN] feature cache stored {key}")
+    return X, y, enc
+
+# ==================== Model selection ====================
+# TRAIN_MODE=select: همه‌ی کاندیداها × TOP_K_FLAGS × foldها روی یک ماتریس کدشده (joblib آن را برای
+# workerها memmap می‌کند)، به صورت موازی. خروجی: leaderboard از AUC در کنار زمان fit/predict.
+SELECT_JOBS       = int(os.getenv("SELECT_JOBS", "-1"))
+SELECT_FOLDS      = int(os.getenv("SELECT_FOLDS", "5"))
+SELECT_STRATEGY   = os.getenv("SELECT_STRATEGY", "grid").strip().lower()   # grid | halving
+SELECT_TOP_K_FLAGS = [int(k) for k in os.getenv("SELECT_TOP_K_FLAGS", "").split(",") if k.strip()]
+HALVING_FACTOR    = 3
+
+CANDIDATES: List[Tuple[str, Dict[str, Any]]] = [
+    *[("logreg", {"C": c, "class_weight": w}) for c in (0.1, 1.0, 10.0) for w in (None, "balanced")],
+    *[("hgb", {"learning_rate": lr, "max_leaf_nodes": leaves, "max_iter": 200})
+      for lr in (0.05, 0.1) for leaves in (15, 31)],
+]
+
+def make_model(kind: str, params: Dict[str, Any]):
+    if kind == "hgb":
+        return HistGradientBoostingClassifier(random_state=42, early_stopping=True, **params)
+    return LogisticRegression(max_iter=1000, **params)
+
+def _fit_eval(kind: str, params: Dict[str, Any], cols: np.ndarray, X: np.ndarray, y: np.ndarray,
+              tr: np.ndarray, te: np.ndarray) -> Tuple[float, float, float]:
+    """(auc, fit_sec, predict_us_per_row)"""
+    Xtr, Xte = X[np.ix_(tr, cols)], X[np.ix_(te, cols)]
+    t0 = time.perf_counter()
+    model = make_model(kind, params).fit(Xtr, y[tr])
+    t1 = time.perf_counter()
+    p = model.predict_proba(Xte)[:, 1]
+    t2 = time.perf_counter()
+    return float(roc_auc_score(y[te], p)), t1 - t0, (t2 - t1) / max(1, len(te)) * 1e6
+
+def _flag_columns(enc: Dict[str, Any], k: int) -> np.ndarray:
+    """ستون‌های عددی + ژانر + k فلگ پرتکرار اول (top_flags به ترتیب فراوانی است)"""
+    keep = set(enc["top_flags"][:k])
+    return np.array([i for i, c in enumerate(enc["feature_columns"])
+                     if not c.startswith("flag__") or c[len("flag__"):] in keep], dtype=np.int64)
+
+def evaluate(configs: List[Tuple[str, Dict[str, Any], int]], X: np.ndarray, y: np.ndarray,
+             enc: Dict[str, Any], n_rows: int, parallel: Parallel) -> List[Dict[str, Any]]:
+    rows = np.arange(len(y))
+    if n_rows < len(y):
+        rows = np.sort(np.random.RandomState(42).choice(len(y), n_rows, replace=False))
+    folds = [(rows[tr], rows[te]) for tr, te in
+             StratifiedKFold(SELECT_FOLDS, shuffle=True, random_state=42).split(rows, y[rows])]
+    tasks = [(ci, kind, params, _flag_columns(enc, k), tr, te)
+             for ci, (kind, params, k) in enumerate(configs) for tr, te in folds]
+    results = parallel(delayed(_fit_eval)(kind, params, cols, X, y, tr, te) for _, kind, params, cols, tr, te in tasks)
+
+    by_cfg: Dict[int, List[Tuple[float, float, float]]] = {}
+    for (ci, *_), r in zip(tasks, results):
+        by_cfg.setdefault(ci, []).append(r)
+    board = []
+    for ci, rs in by_cfg.items():
+        kind, params, k = configs[ci]
+        aucs = np.array([r[0] for r in rs])
+        board.append({
+            "model": kind, "params": params, "top_k_flags": k, "rows": int(len(rows)),
+            "auc_mean": round(float(aucs.mean()), 4), "auc_std": round(float(aucs.std()), 4),
+            "fit_sec": round(float(np.mean([r[1] for r in rs])), 3),
+            "predict_us_per_row": round(float(np.mean([r[2] for r in rs])), 3),
+        })
+    return sorted(board, key=lambda b: (-b["auc_mean"], b["predict_us_per_row"]))
+
+def select_models(X: pd.DataFrame, y: pd.Series, enc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    Xa = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    ya = y.to_numpy(dtype=np.int8)
+    ks = sorted({min(k, len(enc["top_flags"])) for k in (SELECT_TOP_K_FLAGS or [TOP_K_FLAGS])})
+    configs = [(kind, params, k) for kind, params in CANDIDATES for k in ks]
+    print(f"[SELECT] {len(configs)} configs × {SELECT_FOLDS} folds on {Xa.shape} ({SELECT_STRATEGY}, n_jobs={SELECT_JOBS})")
+
+    with Parallel(n_jobs=SELECT_JOBS, max_nbytes="1M") as parallel:
+        if SELECT_STRATEGY != "halving":
+            return evaluate(configs, Xa, ya, enc, len(ya), parallel)
+        # successive halving: دور اول روی زیرنمونه‌ی کوچک، هر دور 1/3 بهترها با 3 برابر داده
+        rounds = max(1, int(np.ceil(np.log(len(configs)) / np.log(HALVING_FACTOR))))
+        for r in range(rounds):
+            last = r == rounds - 1
+            n_rows = len(ya) if last else max(SELECT_FOLDS * 50, len(ya) // HALVING_FACTOR ** (rounds - 1 - r))
+            board = evaluate(configs, Xa, ya, enc, n_rows, parallel)
+            print(f"[SELECT] halving round {r + 1}/{rounds}: {len(configs)} configs on {board[0]['rows']} rows, "
+                  f"best AUC={board[0]['auc_mean']}")
+            if not last:
+                keep = max(1, int(np.ceil(len(board) / HALVING_FACTOR)))
+                configs = [(b["model"], b["params"], b["top_k_flags"]) for b in board[:keep]]
+        return board
+
+def run_selection(X: pd.DataFrame, y: pd.Series, enc: Dict[str, Any]):
+    t0 = time.time()
+    board = select_models(X, y, enc)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    path = os.path.join(MODEL_DIR, "model_selection.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "folds": SELECT_FOLDS,
+                   "strategy": SELECT_STRATEGY, "leaderboard": board}, f, ensure_ascii=False, indent=2)
+    print(f"[SELECT] {'model':<7} {'top_k':>5} {'auc':>7} {'±':>6} {'fit_s':>7} {'pred_us':>8}  params")
+    for b in board:
+        print(f"[SELECT] {b['model']:<7} {b['top_k_flags']:>5} {b['auc_mean']:>7.4f} {b['auc_std']:>6.4f} "
+              f"{b['fit_sec']:>7.2f} {b['predict_us_per_row']:>8.2f}  {json.dumps(b['params'])}")
+    best = board[0]
+    print(f"[SELECT] wrote {path} in {time.time() - t0:.1f}s; train the best with:\n"
+          f"  MODEL_KIND={best['model']} MODEL_PARAMS='{json.dumps(best['params'])}' TOP_K_FLAGS={best['top_k_flags']}")
+
+def main():
+    loaded = load_matrix()
+    if loaded is None:
+        return
+    X, y, enc = loaded
+    if MODE == "select":
+        run_selection(X, y, enc)
+        return
 
     # split + train
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42, stratify=y
     )
-    model = LogisticRegression(max_iter=1000)
+    model = make_model(MODEL_KIND, MODEL_PARAMS)
     model.fit(X_train, y_train)
 
     # eval
@@ -109,14 +334,15 @@ def main():
 
     # save artifacts
     os.makedirs(MODEL_DIR, exist_ok=True)
-    joblib.dump({
-        "model": model,
-        "ohe_genres": ohe,
-        "top_genres": top_genres,
-        "top_flags": top_flags,
-        "num_columns": num_columns,
-        "feature_columns": feature_columns,  # ⟵ مهم: ترتیب نهایی ستون‌ها
-    }, os.path.join(MODEL_DIR, "model.pkl"))
+    # baseline drift + artifact فشرده قبل از model.pkl (worker با تغییر mtime آن بارگذاری می‌کند)
+    base = drift.FeatureSketch.from_dict(enc.get("drift_baseline") or {})
+    base.add_scores("predicted_success", p)
+    flag_cols = [c for c in X.columns if c.startswith("flag__")]
+    base.add_scores("feature_score", X_test[flag_cols].sum(axis=1).to_numpy() / max(1, len(enc["top_flags"])))
+    enc = {**enc, "drift_baseline": drift.save_baseline(MODEL_DIR, base)}
+    if predictor.export(MODEL_DIR, model, enc):
+        print(f"[TRAIN] saved compact model to {MODEL_DIR}/model.npz + model.json")
+    joblib.dump({"model": model, **enc}, os.path.join(MODEL_DIR, "model.pkl"))
     print(f"[TRAIN] saved model to {MODEL_DIR}/model.pkl")
 
 if __name__ == "__main__":
@@ -1,7 +1,14 @@
 ﻿# ./services/api/app.py
-from fastapi import FastAPI, Query
-from typing import List
+import csv, io, os, re, json, time, threading, datetime as dt
+import numpy as np
+from fastapi import Body, FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 from elasticsearch import Elasticsearch
+from redis import Redis
+from redis.exceptions import RedisError
+
+from predictor import CompactModel
 
 app = FastAPI(title="IR Game Insights API")
 
@@ -15,9 +22,19 @@ def health():
     except Exception as e:
         return {"ok": False, "error": str(e), "es": ES_HOST}
 
+SEARCH_FIELDS = {
+    "games":   ["title^2", "description"],
+    "reviews": ["title^2", "body"],
+}
+
+def build_query(index: str, q: Optional[str]) -> Dict[str, Any]:
+    if not q:
+        return {"match_all": {}}
+    return {"multi_match": {"query": q, "fields": SEARCH_FIELDS[index]}}
+
 @app.get("/search")
 def search_games(q: str = Query(default="بازی")):
-    body = {"query": {"multi_match": {"query": q, "fields": ["title^2","description"]}}}
+    body = {"query": build_query("games", q)}
     res = es.search(index="games", body=body)
     hits = [h["_source"] for h in res.get("hits", {}).get("hits", [])]
     return {"count": len(hits), "items": hits}
@@ -47,3 +64,550 @@ def top_features(genre: str = "hyper-casual"):
         }
         for b in buckets
     ]
+
+# ==================== Suggest ====================
+# تکمیل خودکار عنوان: trie درون‌حافظه از پرطرفدارترین عنوان‌ها + fallback روی زیرفیلد title.suggest (edge-n-gram)
+SUGGEST_TRIE_SIZE = int(os.getenv("SUGGEST_TRIE_SIZE", "10000"))
+SUGGEST_TRIE_TTL_SEC = 900
+SUGGEST_TRIE_DEPTH = 8     # گره‌ها تا این عمق؛ پیشوند بلندتر از لیست tail همان گره فیلتر می‌شود
+SUGGEST_TOPK = 20
+
+_FA_MAP = str.maketrans({
+    "ي": "ی", "ى": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه", "أ": "ا", "إ": "ا", "آ": "ا", "\u200c": " ",
+    **{chr(0x06F0 + i): str(i) for i in range(10)}, **{chr(0x0660 + i): str(i) for i in range(10)},
+})
+_DIACRITICS = re.compile("[\u064B-\u065F\u0670]")
+
+def normalize_fa(s: str) -> str:
+    """همان نرمال‌سازی analyzer title_autocomplete (ی/ک عربی، اعراب، ارقام فارسی، نیم‌فاصله)."""
+    return " ".join(_DIACRITICS.sub("", (s or "").translate(_FA_MAP)).lower().split())
+
+class TitleTrie:
+    """
+    آیتم‌ها به ترتیب محبوبیت درج می‌شوند، پس top هر گره همان SUGGEST_TOPK آیتم اول است و
+    جست‌وجو فقط پیمایش پیشوند است. هر عنوان با کل عنوان و با شروع هر کلمه‌اش درج می‌شود.
+    """
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.items = items
+        self.built_at = time.time()
+        self.root: list = [{}, [], []]  # [children, top, tail]
+        for i, it in enumerate(items):
+            words = normalize_fa(it.get("title") or "").split()
+            for w in range(len(words)):
+                self._insert(" ".join(words[w:]), i)
+
+    def _insert(self, key: str, i: int):
+        node = self.root
+        for ch in key[:SUGGEST_TRIE_DEPTH]:
+            node = node[0].setdefault(ch, [{}, [], []])
+            if len(node[1]) < SUGGEST_TOPK and i not in node[1]:
+                node[1].append(i)
+        if len(key) > SUGGEST_TRIE_DEPTH:
+            node[2].append((key, i))
+
+    def lookup(self, prefix: str, k: int) -> List[int]:
+        node = self.root
+        for ch in prefix[:SUGGEST_TRIE_DEPTH]:
+            node = node[0].get(ch)
+            if node is None:
+                return []
+        if len(prefix) <= SUGGEST_TRIE_DEPTH:
+            return node[1][:k]
+        out: List[int] = []
+        for key, i in node[2]:
+            if key.startswith(prefix) and i not in out:
+                out.append(i)
+                if len(out) >= k: break
+        return out
+
+    @classmethod
+    def from_es(cls) -> "TitleTrie":
+        body = {
+            "size": min(SUGGEST_TRIE_SIZE, 10000),
+            "_source": ["title", "store", "app_id", "genre"],
+            "query": {"exists": {"field": "title"}},
+            "sort": [{"ratings_count": {"order": "desc", "missing": "_last"}}, {"installs": {"order": "desc", "missing": "_last"}}],
+        }
+        res = es.search(index="games", body=body)
+        return cls([h["_source"] for h in res.get("hits", {}).get("hits", []) if h.get("_source", {}).get("title")])
+
+_trie: Dict[str, Any] = {"trie": None, "refreshing": False}
+_trie_lock = threading.Lock()
+
+def _refresh_trie():
+    try:
+        t = TitleTrie.from_es()
+        _trie["trie"] = t
+    except Exception as e:
+        print("[API] suggest trie refresh failed:", e)
+    finally:
+        _trie["refreshing"] = False
+
+def title_trie() -> Optional[TitleTrie]:
+    """ساخت اول همزمان است؛ بعد از آن trie قدیمی سرو می‌شود و نوسازی در پس‌زمینه انجام می‌شود."""
+    t = _trie["trie"]
+    if t is None:
+        with _trie_lock:
+            if _trie["trie"] is None:
+                _refresh_trie()
+        return _trie["trie"]
+    if time.time() - t.built_at > SUGGEST_TRIE_TTL_SEC and not _trie["refreshing"]:
+        _trie["refreshing"] = True
+        threading.Thread(target=_refresh_trie, daemon=True).start()
+    return t
+
+def suggest_from_es(q: str, limit: int) -> List[Dict[str, Any]]:
+    body = {
+        "size": limit,
+        "_source": ["title", "store", "app_id", "genre"],
+        "query": {"function_score": {
+            "query": {"match": {"title.suggest": {"query": q, "operator": "and"}}},
+            "field_value_factor": {"field": "ratings_count", "modifier": "log1p", "missing": 0},
+            "boost_mode": "sum",
+        }},
+    }
+    res = es.search(index="games", body=body)
+    return [h["_source"] for h in res.get("hits", {}).get("hits", [])]
+
+@app.get("/suggest")
+def suggest(q: str = Query(..., min_length=1), limit: int = Query(default=10, ge=1, le=SUGGEST_TOPK)):
+    prefix = normalize_fa(q)
+    if not prefix:
+        return {"count": 0, "items": []}
+    trie = title_trie()
+    items = [trie.items[i] for i in trie.lookup(prefix, limit)] if trie else []
+    if len(items) < limit:
+        seen = {(it.get("store"), it.get("app_id")) for it in items}
+        try:
+            for it in suggest_from_es(q, limit):
+                if (it.get("store"), it.get("app_id")) not in seen and len(items) < limit:
+                    items.append(it); seen.add((it.get("store"), it.get("app_id")))
+        except Exception as e:
+            print("[API] suggest ES fallback failed:", e)
+    return {"count": len(items), "items": items}
+
+# ==================== Export (PIT + search_after) ====================
+EXPORT_PAGE_SIZE = 1000
+EXPORT_KEEP_ALIVE = "2m"
+
+# ستون‌های پیش‌فرض هر ایندکس برای CSV/Parquet (نوع‌ها برای schemaی Parquet)
+EXPORT_COLUMNS = {
+    "games": {
+        "store": "str", "app_id": "str", "title": "str", "genre": "str", "developer": "str",
+        "rating": "float", "ratings_count": "int", "installs": "int",
+        "feature_flags": "list", "assets_icon_count": "int", "assets_screenshot_count": "int",
+        "predicted_success": "float", "feature_score": "float",
+        "updated_at": "str", "indexed_at": "str", "source_url": "str",
+    },
+    "reviews": {
+        "store": "str", "app_id": "str", "app_title": "str", "author": "str",
+        "rating": "float", "title": "str", "body": "str",
+        "created_at": "str", "indexed_at": "str", "source_url": "str",
+    },
+}
+
+def iter_export_hits(index: str, query: Dict[str, Any], page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    کل نتایج query را صفحه‌به‌صفحه با point-in-time و search_after می‌خواند.
+    در هر لحظه فقط یک صفحه در حافظه است؛ صفحه‌ی بعد فقط وقتی گرفته می‌شود که مصرف‌کننده جلو برود.
+    """
+    pit_id = es.open_point_in_time(index=index, keep_alive=EXPORT_KEEP_ALIVE)["id"]
+    try:
+        search_after = None
+        while True:
+            res = es.search(
+                pit={"id": pit_id, "keep_alive": EXPORT_KEEP_ALIVE},
+                query=query, size=page_size, sort=[{"_shard_doc": "asc"}],
+                track_total_hits=False,
+                **({"search_after": search_after} if search_after else {}),
+            )
+            pit_id = res.get("pit_id", pit_id)
+            hits = res.get("hits", {}).get("hits", [])
+            if not hits:
+                break
+            for h in hits:
+                yield h.get("_source", {})
+            if len(hits) < page_size:
+                break
+            search_after = hits[-1]["sort"]
+    finally:
+        try: es.close_point_in_time(id=pit_id)
+        except Exception: pass
+
+def _chunks(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    buf: List[Dict[str, Any]] = []
+    for r in rows:
+        buf.append(r)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+def _csv_cell(v: Any) -> Any:
+    if v is None: return ""
+    if isinstance(v, list): return "|".join(str(x) for x in v)
+    if isinstance(v, dict): return json.dumps(v, ensure_ascii=False)
+    return v
+
+def stream_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for chunk in _chunks(rows, EXPORT_PAGE_SIZE):
+        yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk).encode("utf-8")
+
+def stream_csv(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    for chunk in _chunks(rows, EXPORT_PAGE_SIZE):
+        for r in chunk:
+            w.writerow([_csv_cell(r.get(c)) for c in columns])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0); buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+class _DrainSink:
+    """file-like کمینه برای ParquetWriter که بایت‌های نوشته‌شده را بین chunkها تخلیه می‌کند."""
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+        self.closed = False
+    def write(self, b) -> int:
+        b = bytes(b); self._parts.append(b); self._pos += len(b)
+        return len(b)
+    def tell(self) -> int:
+        return self._pos
+    def flush(self):
+        pass
+    def close(self):
+        self.closed = True
+    def drain(self) -> bytes:
+        out = b"".join(self._parts); self._parts.clear()
+        return out
+
+def _arrow_schema(columns: Dict[str, str]):
+    import pyarrow as pa
+    types = {"str": pa.string(), "float": pa.float64(), "int": pa.int64(), "list": pa.list_(pa.string())}
+    return pa.schema([(name, types[t]) for name, t in columns.items()])
+
+def _arrow_value(v: Any, typ: str) -> Any:
+    if v is None: return None
+    try:
+        if typ == "float": return float(v)
+        if typ == "int": return int(float(v))
+        if typ == "list": return [str(x) for x in (v if isinstance(v, list) else [v])]
+        return v if isinstance(v, str) else json.dumps(v, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+
+def stream_parquet(rows: Iterable[Dict[str, Any]], columns: Dict[str, str]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _arrow_schema(columns)
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for chunk in _chunks(rows, EXPORT_PAGE_SIZE):
+            data = {c: [_arrow_value(r.get(c), t) for r in chunk] for c, t in columns.items()}
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            out = sink.drain()
+            if out: yield out
+    finally:
+        writer.close()
+    out = sink.drain()
+    if out: yield out
+
+EXPORT_MEDIA = {
+    "ndjson":  ("application/x-ndjson", "ndjson"),
+    "csv":     ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+@app.get("/export")
+def export(index: str = Query(default="games"),
+           q: Optional[str] = Query(default=None),
+           format: str = Query(default="ndjson"),
+           fields: Optional[str] = Query(default=None, description="ستون‌ها با کاما؛ پیش‌فرض ستون‌های ایندکس")):
+    if index not in EXPORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"index must be one of {sorted(EXPORT_COLUMNS)}")
+    if format not in EXPORT_MEDIA:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(EXPORT_MEDIA)}")
+
+    columns = dict(EXPORT_COLUMNS[index])
+    if fields:
+        wanted = [f.strip() for f in fields.split(",") if f.strip()]
+        columns = {f: columns.get(f, "str") for f in wanted}
+
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="parquet export needs pyarrow")
+
+    rows = iter_export_hits(index, build_query(index, q))
+    if format == "ndjson":
+        body = stream_ndjson(rows if not fields else ({c: r.get(c) for c in columns} for r in rows))
+    elif format == "csv":
+        body = stream_csv(rows, list(columns))
+    else:
+        body = stream_parquet(rows, columns)
+
+    media, ext = EXPORT_MEDIA[format]
+    return StreamingResponse(body, media_type=media,
+                             headers={"Content-Disposition": f'attachment; filename="{index}.{ext}"'})
+
+# آیکن‌های مشابه: pHash (خروجی services/scraper/images.py) در یک آرایه‌ی uint64 در حافظه؛
+# فاصله‌ی Hamming با XOR + popcount برداری روی کل آرایه (چند میلی‌ثانیه برای صدها هزار آیکن)
+ICON_INDEX_TTL_SEC = 600
+_POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount64(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POP8[x.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+class HammingIndex:
+    def __init__(self, keys: List[Dict[str, Any]], hashes: np.ndarray):
+        self.keys = keys
+        self.hashes = hashes
+        self.built_at = time.time()
+        self.by_app: Dict[str, int] = {f"{k['store']}::{k['app_id']}": i for i, k in enumerate(keys)}
+
+    @classmethod
+    def from_es(cls) -> "HammingIndex":
+        keys, hashes = [], []
+        q = {"bool": {"filter": [{"term": {"type": "icon"}}, {"exists": {"field": "phash"}}]}}
+        for h in iter_export_hits("assets", q):
+            try:
+                hashes.append(int(h["phash"], 16))
+            except (KeyError, TypeError, ValueError):
+                continue
+            keys.append({"store": h.get("store"), "app_id": h.get("app_id"), "url": h.get("url")})
+        return cls(keys, np.array(hashes, dtype=np.uint64))
+
+    def query(self, h: int, max_distance: int, limit: int) -> List[tuple]:
+        d = popcount64(np.bitwise_xor(self.hashes, np.uint64(h)))
+        idx = np.flatnonzero(d <= max_distance)
+        idx = idx[np.argsort(d[idx], kind="stable")][:limit]
+        return [(int(i), int(d[i])) for i in idx]
+
+_icon_index: Dict[str, Any] = {"index": None, "refreshing": False}
+_icon_lock = threading.Lock()
+
+def _refresh_icon_index():
+    try:
+        _icon_index["index"] = HammingIndex.from_es()
+    except Exception as e:
+        print("[API] icon index refresh failed:", e)
+    finally:
+        _icon_index["refreshing"] = False
+
+def icon_index() -> Optional[HammingIndex]:
+    """مثل title_trie: ساخت اول همزمان، بعد از آن ایندکس قدیمی سرو و نوسازی در پس‌زمینه."""
+    idx = _icon_index["index"]
+    if idx is None:
+        with _icon_lock:
+            if _icon_index["index"] is None:
+                _refresh_icon_index()
+        return _icon_index["index"]
+    if time.time() - idx.built_at > ICON_INDEX_TTL_SEC and not _icon_index["refreshing"]:
+        _icon_index["refreshing"] = True
+        threading.Thread(target=_refresh_icon_index, daemon=True).start()
+    return idx
+
+@app.get("/similar-icons/{store}/{app_id}")
+def similar_icons(store: str, app_id: str,
+                  max_distance: int = Query(default=10, ge=0, le=32),
+                  limit: int = Query(default=20, ge=1, le=200)):
+    idx = icon_index()
+    if idx is None:
+        raise HTTPException(status_code=503, detail="icon index unavailable")
+    me = idx.by_app.get(f"{store}::{app_id}")
+    if me is None:
+        raise HTTPException(status_code=404, detail="icon hash not found for this app (run images.py)")
+    items = []
+    for i, dist in idx.query(int(idx.hashes[me]), max_distance, limit + 1):
+        k = idx.keys[i]
+        if (k["store"], k["app_id"]) == (store, app_id):
+            continue
+        items.append({**k, "distance": dist})
+    return {"count": len(items[:limit]), "items": items[:limit]}
+
+# بازی‌های مشابه: بردارهای services/analyzer/similar.py با mmap؛ top-k دقیق به صورت بلوکی
+# (ضرب داخلی روی بلوک‌های SIMILAR_BLOCK ردیفی + argpartition) بدون بارگذاری کل ماتریس در RAM
+SIMILAR_DIR = os.getenv("SIMILAR_DIR", "/models/similar")
+SIMILAR_BLOCK = 65536
+
+class VectorIndex:
+    def __init__(self, root: str):
+        self.meta_mtime = os.path.getmtime(os.path.join(root, "meta.json"))
+        self.vectors = np.load(os.path.join(root, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(root, "items.json"), "r", encoding="utf-8") as f:
+            self.items: List[Dict[str, Any]] = json.load(f)
+        self.pos = {(it["store"], it["app_id"]): i for i, it in enumerate(self.items)}
+
+    def top_k(self, q: np.ndarray, k: int, exclude: int = -1) -> List[tuple]:
+        best_i = np.empty(0, dtype=np.int64)
+        best_s = np.empty(0, dtype=np.float32)
+        for start in range(0, len(self.vectors), SIMILAR_BLOCK):
+            sims = np.asarray(self.vectors[start:start + SIMILAR_BLOCK]) @ q
+            if start <= exclude < start + len(sims):
+                sims[exclude - start] = -np.inf
+            kk = min(k, len(sims))
+            part = np.argpartition(-sims, kk - 1)[:kk]
+            best_i = np.concatenate([best_i, part + start])
+            best_s = np.concatenate([best_s, sims[part]])
+            if len(best_i) > k:
+                keep = np.argpartition(-best_s, k - 1)[:k]
+                best_i, best_s = best_i[keep], best_s[keep]
+        order = np.argsort(-best_s)
+        return [(int(best_i[j]), float(best_s[j])) for j in order if np.isfinite(best_s[j])]
+
+_similar: Dict[str, Any] = {"index": None}
+_similar_lock = threading.Lock()
+
+def similar_index() -> VectorIndex:
+    with _similar_lock:
+        idx = _similar["index"]
+        try:
+            mtime = os.path.getmtime(os.path.join(SIMILAR_DIR, "meta.json"))
+        except OSError:
+            raise HTTPException(status_code=503, detail="similar index not built (run analyzer similar.py)")
+        if idx is None or idx.meta_mtime != mtime:
+            idx = _similar["index"] = VectorIndex(SIMILAR_DIR)
+        return idx
+
+@app.get("/similar/{store}/{app_id}")
+def similar_games(store: str, app_id: str, limit: int = Query(default=10, ge=1, le=100)):
+    idx = similar_index()
+    me = idx.pos.get((store, app_id))
+    if me is None:
+        raise HTTPException(status_code=404, detail="game not in similar index")
+    hits = idx.top_k(np.asarray(idx.vectors[me]), limit, exclude=me)
+    return {"count": len(hits), "items": [{**idx.items[i], "score": round(s, 4)} for i, s in hits]}
+
+# leaderboardهای predicted_success که score.py / worker در Redis نگه می‌دارند؛ اگر کلید نبود (cache سرد یا
+# Redis در دسترس نبود) از ES با sort خوانده می‌شود. بازسازی: SCORE_MODE=leaderboards در analyzer
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+LB_PREFIX = os.getenv("LEADERBOARD_PREFIX", "lb")
+rds = Redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+def leaderboard_from_redis(store: str, genre: str, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+    key = f"{LB_PREFIX}:{store}:{genre}"
+    pipe = rds.pipeline(transaction=False)
+    pipe.zcard(key)
+    pipe.zrevrange(key, offset, offset + limit - 1, withscores=True)
+    total, ranked = pipe.execute()
+    if not total:
+        return None
+    raw = rds.hmget(f"{LB_PREFIX}:items", [m for m, _ in ranked]) if ranked else []
+    items = [{**json.loads(r or "{}"), "rank": offset + i + 1, "predicted_success": sc}
+             for i, ((m, sc), r) in enumerate(zip(ranked, raw))]
+    return {"source": "redis", "total": total, "items": items}
+
+def leaderboard_from_es(store: str, genre: str, offset: int, limit: int) -> Dict[str, Any]:
+    filt = [{"exists": {"field": "predicted_success"}}]
+    if store != "all": filt.append({"term": {"store": store}})
+    if genre != "all": filt.append({"term": {"genre": genre}})
+    body = {
+        "from": offset, "size": limit, "track_total_hits": True,
+        "_source": ["store", "app_id", "title", "genre", "predicted_success"],
+        "query": {"bool": {"filter": filt}},
+        "sort": [{"predicted_success": "desc"}],
+    }
+    res = es.search(index="games", body=body)
+    hits = res.get("hits", {})
+    items = [{**h["_source"], "rank": offset + i + 1} for i, h in enumerate(hits.get("hits", []))]
+    return {"source": "es", "total": hits.get("total", {}).get("value", len(items)), "items": items}
+
+@app.get("/leaderboard")
+def leaderboard(store: str = Query(default="all"), genre: str = Query(default="all"),
+                offset: int = Query(default=0, ge=0, le=9900), limit: int = Query(default=20, ge=1, le=100)):
+    store, genre = store.strip().lower() or "all", genre.strip().lower() or "all"
+    try:
+        res = leaderboard_from_redis(store, genre, offset, limit)
+    except RedisError as e:
+        print("[API] leaderboard redis unavailable:", e)
+        res = None
+    if res is None:
+        res = leaderboard_from_es(store, genre, offset, limit)
+    return {"store": store, "genre": genre, "offset": offset, "count": len(res["items"]), **res}
+
+# امتیاز «چه می‌شد اگر» برای بازی‌ای که هنوز در ایندکس نیست (پیش‌نویس سازنده، مقایسه‌ی ژانر/فلگ‌ها):
+# artifact فشرده‌ی train.py (model.json/model.npz) با predictor.py؛ با تغییر model.json دوباره بارگذاری می‌شود
+MODEL_DIR = os.getenv("MODEL_DIR", "/models")
+PREDICT_MAX_ROWS = 1000
+
+_model: Dict[str, Any] = {"model": None, "mtime": None}
+_model_lock = threading.Lock()
+
+def compact_model() -> CompactModel:
+    with _model_lock:
+        try:
+            mtime = os.path.getmtime(os.path.join(MODEL_DIR, "model.json"))
+        except OSError:
+            raise HTTPException(status_code=503, detail="compact model not found (run analyzer train.py with a linear MODEL_KIND)")
+        if _model["model"] is None or _model["mtime"] != mtime:
+            _model["model"], _model["mtime"] = CompactModel.load(MODEL_DIR), mtime
+        return _model["model"]
+
+@app.post("/predict")
+def predict(rows: List[Dict[str, Any]] = Body(...)):
+    """ردیف‌ها با همان فیلدهای سند games (genre، rating، ratings_count، feature_flags، assets_*، metric_*)."""
+    if len(rows) > PREDICT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"at most {PREDICT_MAX_ROWS} rows per request")
+    proba, fs = compact_model().predict(rows)
+    return {"count": len(rows), "items": [{"predicted_success": round(float(p), 6), "feature_score": round(float(sc), 6)}
+                                          for p, sc in zip(proba, fs)]}
+
+# واژه‌های پرتکرار هفته (services/miner/trends.py) در sorted setهای trends:{source}:{week}:{genre}
+TRENDS_PREFIX = os.getenv("TRENDS_PREFIX", "trends")
+TREND_SOURCES = ("reviews", "complaints", "descriptions")
+
+def _iso_week(d: dt.date) -> str:
+    y, w, _ = d.isocalendar()
+    return f"{y}-W{w:02d}"
+
+@app.get("/trends")
+def trends(genre: str = Query(default="all"), week: Optional[str] = Query(default=None, pattern=r"^\d{4}-W\d{2}$"),
+           source: str = Query(default="reviews"), limit: int = Query(default=20, ge=1, le=200)):
+    genre, source = genre.strip().lower() or "all", source.strip().lower()
+    if source not in TREND_SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(TREND_SOURCES)}")
+    try:
+        monday = dt.datetime.strptime(f"{week}-1", "%G-W%V-%u").date() if week else dt.date.today()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid ISO week")
+    week, prev = _iso_week(monday), _iso_week(monday - dt.timedelta(days=7))
+    try:
+        ranked = rds.zrevrange(f"{TRENDS_PREFIX}:{source}:{week}:{genre}", 0, limit - 1, withscores=True)
+        before = rds.zmscore(f"{TRENDS_PREFIX}:{source}:{prev}:{genre}", [t for t, _ in ranked]) if ranked else []
+    except RedisError as e:
+        print("[API] trends redis unavailable:", e)
+        raise HTTPException(status_code=503, detail="trends store unavailable")
+    items = [{"term": t, "count": int(c), "prev_count": int(b or 0), "delta": int(c - (b or 0))}
+             for (t, c), b in zip(ranked, before)]
+    return {"genre": genre, "week": week, "prev_week": prev, "source": source, "count": len(items), "items": items}
+
+# ریویوها پشت alias نوشتن/خواندن (reviews-YYYY.MM-NNNNNN با rollover)؛ با فیلتر indexed_at و
+# pre_filter_shard_size=1 ایندکس‌های ماه‌های قدیمی در مرحله‌ی can_match کنار گذاشته می‌شوند
+REVIEWS_INDEX = os.getenv("ES_REVIEWS_INDEX", "reviews")
+
+@app.get("/reviews/{store}/{app_id}")
+def recent_reviews(store: str, app_id: str, days: int = Query(default=30, ge=1, le=3650),
+                   limit: int = Query(default=20, ge=1, le=200)):
+    body = {
+        "size": limit,
+        "_source": ["store", "app_id", "app_title", "author", "rating", "title", "body",
+                    "sentiment", "topics", "created_at", "indexed_at"],
+        "query": {"bool": {"filter": [
+            {"term": {"store": store.lower()}},
+            {"term": {"app_id": app_id}},
+            {"range": {"indexed_at": {"gte": f"now-{days}d/d"}}},
+        ]}},
+        "sort": [{"created_at": {"order": "desc", "missing": "_last", "unmapped_type": "date"}}],
+    }
+    res = es.search(index=REVIEWS_INDEX, body=body, pre_filter_shard_size=1, ignore_unavailable=True)
+    hits = res.get("hits", {}).get("hits", [])
+    return {"store": store, "app_id": app_id, "days": days, "count": len(hits),
+            "shards": res.get("_shards", {}), "items": [h["_source"] for h in hits]}
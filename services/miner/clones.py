@@ -0,0 +1,217 @@
+# services/miner/clones.py
+"""
+تشخیص کلون/تقریباً تکراری‌ها (reskin) با MinHash + LSH روی title+description.
+
+- متن با همان _norm_txt ماینر نرمال و به shingleهای سه‌واژه‌ای شکسته می‌شود
+- امضای MinHash (CLONE_PERM جایگشت) با NumPy، باندهای LSH (CLONE_BANDS) برای پیدا کردن کاندیداها
+- فقط کاندیداهای هم‌باند با شباهت تخمینی >= CLONE_THRESHOLD به هم وصل می‌شوند (union-find)
+- clone_cluster_id = کوچک‌ترین _id خوشه؛ clone_cluster_size = اندازه‌ی خوشه (تکی‌ها: _id خودشان و 1)
+
+حالت (امضاها و خوشه‌ها) در CLONES_STATE ذخیره می‌شود؛ اجرای بعدی فقط بازی‌های بدون
+clone_cluster_id را امضا و در همان باندها درج می‌کند و فقط سندهایی که خوشه‌شان عوض شده را می‌نویسد.
+
+اجرا:
+  docker compose run --rm miner python /app/clones.py            # incremental
+  CLONES_MODE=full docker compose run --rm miner python /app/clones.py
+"""
+import os, zlib, time
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from elasticsearch import helpers
+
+from miner import es, ES_INDEX, STORE_FILTER, BATCH_SIZE, _norm_txt
+
+CLONES_STATE = os.getenv("CLONES_STATE", "/models/clones_state.npz")
+MODE         = os.getenv("CLONES_MODE", "incremental").strip().lower()   # incremental | full
+NUM_PERM     = int(os.getenv("CLONE_PERM", "128"))
+BANDS        = int(os.getenv("CLONE_BANDS", "16"))                       # NUM_PERM / BANDS سطر در هر باند
+THRESHOLD    = float(os.getenv("CLONE_THRESHOLD", "0.8"))
+SHINGLE      = int(os.getenv("CLONE_SHINGLE", "3"))
+MIN_SHINGLES = int(os.getenv("CLONE_MIN_SHINGLES", "8"))                 # متن کوتاه‌تر امضا نمی‌شود
+MAX_BUCKET   = int(os.getenv("CLONE_MAX_BUCKET", "500"))                 # باکت‌های خیلی شلوغ (متن قالبی) نادیده
+
+ROWS = NUM_PERM // BANDS
+_P = np.uint64((1 << 31) - 1)
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+
+# ---------- MinHash ----------
+def shingles(title: str, desc: str) -> np.ndarray:
+    toks = (_norm_txt(title) + " " + _norm_txt(desc)).split()
+    grams = {" ".join(toks[i:i + SHINGLE]) for i in range(max(0, len(toks) - SHINGLE + 1))}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+def minhash(sh: np.ndarray) -> np.ndarray:
+    # (a*x + b) mod p برای همه‌ی جایگشت‌ها × همه‌ی shingleها، سپس min روی shingleها
+    return ((_A[:, None] * sh[None, :] + _B[:, None]) % _P).min(axis=1).astype(np.uint32)
+
+def band_keys(sig: np.ndarray) -> List[bytes]:
+    return [sig[b * ROWS:(b + 1) * ROWS].tobytes() for b in range(BANDS)]
+
+# ---------- State ----------
+class CloneState:
+    def __init__(self, ids: List[str], sigs: np.ndarray, clusters: List[str]):
+        self.ids = ids
+        self._buf = sigs  # ظرفیت دوبرابرشونده؛ ردیف‌های معتبر: sigs
+        self.clusters = clusters
+        self.pos = {d: i for i, d in enumerate(ids)}
+        self.bands: List[Dict[bytes, List[int]]] = [dict() for _ in range(BANDS)]
+        for i in range(len(ids)):
+            self._index(i)
+
+    @classmethod
+    def load(cls, path: str) -> "CloneState":
+        if not path or not os.path.exists(path):
+            return cls([], np.zeros((0, NUM_PERM), dtype=np.uint32), [])
+        z = np.load(path)
+        if z["sigs"].shape[1] != NUM_PERM or int(z["bands"]) != BANDS:
+            print("[CLONES] state has different MinHash params; starting fresh")
+            return cls([], np.zeros((0, NUM_PERM), dtype=np.uint32), [])
+        return cls(z["ids"].tolist(), z["sigs"], z["clusters"].tolist())
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, ids=np.array(self.ids, dtype=str), sigs=self.sigs,
+                 clusters=np.array(self.clusters, dtype=str), bands=BANDS)
+        os.replace(tmp, path)
+
+    @property
+    def sigs(self) -> np.ndarray:
+        return self._buf[:len(self.ids)]
+
+    def _append(self, sig: np.ndarray):
+        if len(self.ids) >= len(self._buf):
+            grown = np.zeros((max(1024, 2 * len(self._buf)), NUM_PERM), dtype=np.uint32)
+            grown[:len(self._buf)] = self._buf
+            self._buf = grown
+        self._buf[len(self.ids)] = sig
+
+    def _index(self, i: int):
+        for b, key in enumerate(band_keys(self.sigs[i])):
+            self.bands[b].setdefault(key, []).append(i)
+
+    def add(self, doc_id: str, sig: np.ndarray) -> Tuple[int, List[int]]:
+        """سند را درج می‌کند؛ خروجی: (ردیف، ردیف‌های تأییدشده با شباهت >= THRESHOLD)"""
+        cands = set()
+        for b, key in enumerate(band_keys(sig)):
+            bucket = self.bands[b].get(key)
+            if bucket and len(bucket) < MAX_BUCKET:
+                cands.update(bucket)
+        i = self.pos.get(doc_id)
+        if i is None:
+            i = len(self.ids)
+            self._append(sig)
+            self.ids.append(doc_id); self.clusters.append(doc_id); self.pos[doc_id] = i
+        else:
+            self._buf[i] = sig
+        cands.discard(i)
+        self._index(i)
+        if not cands:
+            return i, []
+        c = np.fromiter(cands, dtype=np.int64, count=len(cands))
+        sim = (self.sigs[c] == sig[None, :]).mean(axis=1)
+        return i, c[sim >= THRESHOLD].tolist()
+
+# ---------- Union-find ----------
+def _find(parent: List[int], x: int) -> int:
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+def _union(parent: List[int], a: int, b: int):
+    ra, rb = _find(parent, a), _find(parent, b)
+    if ra != rb:
+        parent[max(ra, rb)] = min(ra, rb)
+
+def assign_clusters(state: CloneState, docs: Iterable[Tuple[str, str, str]]) -> Dict[str, Tuple[str, int]]:
+    """
+    docs: (doc_id, title, description) بازی‌های جدید
+    خروجی: {doc_id: (clone_cluster_id, clone_cluster_size)} فقط برای سندهایی که مقدارشان عوض شده
+    """
+    old_clusters = list(state.clusters)
+    edges: List[Tuple[int, int]] = []
+    touched: List[str] = []
+    for doc_id, title, desc in docs:
+        touched.append(doc_id)
+        sh = shingles(title, desc)
+        if len(sh) < MIN_SHINGLES:
+            continue
+        i, matches = state.add(doc_id, minhash(sh))
+        edges.extend((i, j) for j in matches)
+
+    # خوشه‌های قبلی + یال‌های جدید
+    n = len(state.ids)
+    parent = list(range(n))
+    first: Dict[str, int] = {}
+    for i, c in enumerate(state.clusters):
+        if c in first: _union(parent, first[c], i)
+        else: first[c] = i
+    for a, b in edges:
+        _union(parent, a, b)
+
+    label_of_root: Dict[int, str] = {}
+    for i in range(n):
+        r = _find(parent, i)
+        if r not in label_of_root or state.ids[i] < label_of_root[r]:
+            label_of_root[r] = state.ids[i]
+    new_clusters = [label_of_root[_find(parent, i)] for i in range(n)]
+    old_sizes = Counter(old_clusters)
+    new_sizes = Counter(new_clusters)
+    state.clusters = new_clusters
+
+    out: Dict[str, Tuple[str, int]] = {}
+    for i, d in enumerate(state.ids):
+        c = new_clusters[i]
+        if i >= len(old_clusters) or old_clusters[i] != c or old_sizes[old_clusters[i]] != new_sizes[c]:
+            out[d] = (c, new_sizes[c])
+    # بازی‌های بدون متن کافی: خوشه‌ی تکی
+    for d in touched:
+        if d not in state.pos:
+            out[d] = (d, 1)
+    return out
+
+# ---------- ES ----------
+def ensure_mapping():
+    try:
+        es.indices.put_mapping(index=ES_INDEX, properties={
+            "clone_cluster_id": {"type": "keyword", "ignore_above": 1024},
+            "clone_cluster_size": {"type": "integer"},
+        })
+    except Exception as e:
+        print("[CLONES] WARN put_mapping:", e)
+
+def scan_new_games(full: bool) -> Iterable[Tuple[str, str, str]]:
+    must_not = [] if full else [{"exists": {"field": "clone_cluster_id"}}]
+    filt = [{"term": {"store": STORE_FILTER}}] if STORE_FILTER else []
+    q = {"query": {"bool": {"filter": filt, "must_not": must_not}}, "_source": ["title", "description"]}
+    for h in helpers.scan(es, index=ES_INDEX, query=q, size=1000, preserve_order=False):
+        src = h.get("_source", {})
+        yield h["_id"], src.get("title") or "", src.get("description") or ""
+
+def main():
+    full = MODE == "full"
+    ensure_mapping()
+    state = CloneState([], np.zeros((0, NUM_PERM), dtype=np.uint32), []) if full else CloneState.load(CLONES_STATE)
+    print(f"[CLONES] mode={'full' if full else 'incremental'} state={len(state.ids)} perm={NUM_PERM} bands={BANDS}x{ROWS}")
+
+    t0 = time.time()
+    changes = assign_clusters(state, scan_new_games(full))
+    state.save(CLONES_STATE)
+    n_multi = sum(1 for c, s in Counter(state.clusters).items() if s > 1)
+    print(f"[CLONES] {len(state.ids)} signed, {n_multi} clone clusters, {len(changes)} docs to update ({time.time() - t0:.1f}s)")
+
+    updates = (
+        {"_op_type": "update", "_index": ES_INDEX, "_id": d,
+         "doc": {"clone_cluster_id": c, "clone_cluster_size": s}}
+        for d, (c, s) in changes.items()
+    )
+    ok, fail = helpers.bulk(es, updates, raise_on_error=False, request_timeout=120, chunk_size=BATCH_SIZE)
+    print(f"[CLONES] bulk ok={ok}, fail={len(fail) if isinstance(fail, list) else 0}")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,25 @@
 # services/scraper/miner.py
 import os, re, json, math, datetime as dt
-from typing import Dict, List, Any, Iterable, Optional, Tuple
-from elasticsearch import Elasticsearch, helpers
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+from elasticsearch import helpers
+
+import drift
+from bulk_session import BulkSession, client as es_client
 
 ES_URL        = os.getenv("ES_HOST", "http://es:9200").rstrip("/")
 ES_INDEX      = os.getenv("ES_INDEX", "games")
 ASSETS_INDEX  = os.getenv("ES_ASSETS_INDEX", "assets")
+REVIEWS_INDEX = os.getenv("ES_REVIEWS_INDEX", "reviews")
 BATCH_SIZE    = int(os.getenv("MINER_BATCH", "500"))
 MAX_DOCS      = int(os.getenv("MINER_MAX_DOCS", "0"))  # 0 = no limit
 STORE_FILTER  = os.getenv("MINER_STORE", "").strip()   # e.g. "myket" | "bazaar" | ""
+# features: فقط فیچرهای متنی (شمارش assets هنگام ingest در خزنده نوشته می‌شود)
+# reconcile: اصلاح شمارش assets روی games با merge-join مرتب (حافظه‌ی ثابت)
+# reviews: تجمیع ریویوها به فیلدهای metric_* روی games (همان merge-join)
+MODE          = os.getenv("MINER_MODE", "features").strip().lower()
 
 # از options برای حذف DeprecationWarning
-es = Elasticsearch(ES_URL).options(request_timeout=60)
+es = es_client(ES_URL).options(request_timeout=60)
 
 # ---------- Keyword dictionaries ----------
 DEFAULT_DICT = {
@@ -94,21 +102,25 @@ def success_score(doc: Dict[str, Any]) -> float:
     return round(base, 4)
 
 # ---------- batch assets aggregation (سریع و مقیاس‌پذیر) ----------
-def build_assets_counts_map() -> Dict[Tuple[str, str], Dict[str, int]]:
+ZERO_COUNTS = {"icons": 0, "shots": 0, "videos": 0}
+
+def iter_composite(index: str, sub_aggs: Dict[str, Any], base_query: Optional[Dict[str, Any]] = None,
+                   runtime_mappings: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[Tuple[str, str], Dict[str, Any]]]:
     """
-    خروجی: {(store, app_id): {"icons": x, "shots": y}}
+    باکت‌های composite روی (store, app_id) را صفحه‌به‌صفحه و به ترتیب صعودی کلید برمی‌گرداند:
+    ((store, app_id), bucket)
+    base_query: محدود کردن به زیرمجموعه‌ای از اپ‌ها (پیش‌فرض: همه یا MINER_STORE)
     """
-    result: Dict[Tuple[str, str], Dict[str, int]] = {}
     after_key = None
 
-    base_query: Dict[str, Any] = {"match_all": {}}
-    if STORE_FILTER:
-        base_query = {"term": {"store": STORE_FILTER}}
+    if base_query is None:
+        base_query = {"term": {"store": STORE_FILTER}} if STORE_FILTER else {"match_all": {}}
 
     while True:
         body = {
             "size": 0,
             "query": base_query,
+            **({"runtime_mappings": runtime_mappings} if runtime_mappings else {}),
             "aggs": {
                 "by_app": {
                     "composite": {
@@ -119,25 +131,41 @@ def build_assets_counts_map() -> Dict[Tuple[str, str], Dict[str, int]]:
                         ],
                         **({"after": after_key} if after_key else {})
                     },
-                    "aggs": {
-                        "icons": {"filter": {"term": {"type": "icon"}}},
-                        "shots": {"filter": {"term": {"type": "screenshot"}}}
-                    }
+                    "aggs": sub_aggs
                 }
             }
         }
-        resp = es.search(index=ASSETS_INDEX, body=body)
+        resp = es.search(index=index, body=body)
         buckets = resp.get("aggregations", {}).get("by_app", {}).get("buckets", [])
         for b in buckets:
-            store = b["key"]["store"]
-            app   = b["key"]["app_id"]
-            icons = int(b["icons"]["doc_count"])
-            shots = int(b["shots"]["doc_count"])
-            result[(store, app)] = {"icons": icons, "shots": shots}
+            yield (b["key"]["store"], b["key"]["app_id"]), b
         after_key = resp.get("aggregations", {}).get("by_app", {}).get("after_key")
         if not after_key:
             break
-    return result
+
+def iter_assets_counts(base_query: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[Tuple[str, str], Dict[str, int]]]:
+    """((store, app_id), {"icons": x, "shots": y, "videos": z}) به ترتیب کلید."""
+    sub_aggs = {
+        "icons":  {"filter": {"term": {"type": "icon"}}},
+        "shots":  {"filter": {"term": {"type": "screenshot"}}},
+        "videos": {"filter": {"term": {"type": "video"}}},
+    }
+    for key, b in iter_composite(ASSETS_INDEX, sub_aggs, base_query):
+        yield key, {
+            "icons": int(b["icons"]["doc_count"]),
+            "shots": int(b["shots"]["doc_count"]),
+            "videos": int(b["videos"]["doc_count"]),
+        }
+
+def assets_fields(counts: Dict[str, int]) -> Dict[str, Any]:
+    """همان فیلدهایی که crawler.asset_counts_action هنگام ingest می‌نویسد."""
+    return {
+        "assets_icon_count": counts["icons"],
+        "assets_screenshot_count": counts["shots"],
+        # برای سازگاری با ویژوال‌های قدیمی:
+        "screenshot_count": counts["shots"],
+        "video_count": counts["videos"],
+    }
 
 # ---------- scan games ----------
 def scan_games() -> Iterable[Dict[str, Any]]:
@@ -147,8 +175,145 @@ def scan_games() -> Iterable[Dict[str, Any]]:
     ):
         yield hit
 
+def scan_games_sorted(fields: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    اسکن games به ترتیب (store, app_id) با PIT + search_after؛ همان ترتیب کلیدهای composite
+    (هر دو روی keyword نرمال‌شده) تا merge-join بدون نگه‌داشتن نقشه در حافظه ممکن باشد.
+    مقدار نرمال‌شده‌ی کلید در hit["sort"][:2] است.
+    """
+    q = {"term": {"store": STORE_FILTER}} if STORE_FILTER else {"match_all": {}}
+    pit = es.open_point_in_time(index=ES_INDEX, keep_alive="5m")["id"]
+    after = None
+    try:
+        while True:
+            resp = es.search(
+                pit={"id": pit, "keep_alive": "5m"}, query=q, _source=fields, size=BATCH_SIZE,
+                sort=[{"store": "asc"}, {"app_id": "asc"}, {"_shard_doc": "asc"}],
+                **({"search_after": after} if after else {}),
+            )
+            pit = resp.get("pit_id", pit)
+            hits = resp["hits"]["hits"]
+            if not hits:
+                break
+            yield from hits
+            after = hits[-1]["sort"]
+    finally:
+        try:
+            es.close_point_in_time(id=pit)
+        except Exception:
+            pass
+
+def merge_join(hits: Iterable[Dict[str, Any]],
+               buckets: Iterator[Tuple[Tuple[str, str], Any]]) -> Iterator[Tuple[Dict[str, Any], Any]]:
+    """
+    merge-join دو جریان مرتب بر (store, app_id): اسکن games و باکت‌های composite.
+    برای هر hit مقدار باکت هم‌کلید (یا None) را برمی‌گرداند؛ در هر لحظه فقط یک باکت در حافظه است.
+    """
+    cur = next(buckets, None)
+    for h in hits:
+        store, app_id = h["sort"][0], h["sort"][1]
+        if store is None or app_id is None:
+            continue
+        key = (store, app_id)
+        while cur is not None and cur[0] < key:
+            cur = next(buckets, None)
+        yield h, (cur[1] if cur is not None and cur[0] == key else None)
+
+def _changed_updates(pairs: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]], stamp_field: str,
+                     label: str) -> Iterator[Dict[str, Any]]:
+    """فقط سندهایی که مقدارشان با _source فعلی فرق دارد update می‌شوند."""
+    checked = changed = 0
+    for h, doc in pairs:
+        checked += 1
+        src = h.get("_source", {})
+        if all(src.get(k) == v for k, v in doc.items()):
+            continue
+        changed += 1
+        doc[stamp_field] = dt.datetime.utcnow().isoformat(timespec="seconds")
+        yield {"_op_type": "update", "_index": ES_INDEX, "_id": h["_id"], "doc": doc}
+        if MAX_DOCS and changed >= MAX_DOCS:
+            break
+    print(f"[MINER] {label}: checked={checked} changed={changed}")
+
+def reconcile_updates() -> Iterator[Dict[str, Any]]:
+    """شمارش assets روی games را با باکت‌های composite روی assets هم‌خوان می‌کند."""
+    hits = scan_games_sorted(list(assets_fields(ZERO_COUNTS)))
+    pairs = ((h, assets_fields(c or ZERO_COUNTS)) for h, c in merge_join(hits, iter_assets_counts()))
+    return _changed_updates(pairs, "assets_counted_at", "reconcile")
+
+# ---------- review aggregates (metric_*) ----------
+REVIEW_METRIC_FIELDS = [
+    "metric_reviews_count", "metric_review_rating_avg", "metric_review_low_share",
+    "metric_review_age_days", "metric_review_text_len_avg", "metric_review_text_len_max",
+]
+
+# طول متن ریویو از _source (title/body یا text) بدون نیاز به فیلد مپ‌شده
+REVIEW_TEXT_LEN = {"review_text_len": {"type": "long", "script": {"source": """
+    long n = 0;
+    for (def f : ['title', 'body', 'text']) {
+      def v = params._source[f];
+      if (v != null) { n += v.toString().length(); }
+    }
+    emit(n);
+"""}}}
+
+REVIEW_AGGS = {
+    "rating":   {"avg": {"field": "rating"}},
+    "rated":    {"value_count": {"field": "rating"}},
+    "low":      {"filter": {"range": {"rating": {"lte": 2}}}},
+    "last_at":  {"max": {"field": "created_at"}},
+    "last_idx": {"max": {"field": "indexed_at"}},
+    "text_len": {"stats": {"field": "review_text_len"}},
+}
+
+def review_metrics(b: Optional[Dict[str, Any]], now_ms: float) -> Dict[str, Any]:
+    if not b:
+        return {k: (0 if k == "metric_reviews_count" else None) for k in REVIEW_METRIC_FIELDS}
+    rated = b["rated"]["value"] or 0
+    last = b["last_at"]["value"] or b["last_idx"]["value"]
+    tl = b["text_len"]
+    return {
+        "metric_reviews_count": int(b["doc_count"]),
+        "metric_review_rating_avg": round(b["rating"]["value"], 3) if b["rating"]["value"] is not None else None,
+        "metric_review_low_share": round(b["low"]["doc_count"] / rated, 4) if rated else None,
+        "metric_review_age_days": round(max(0.0, now_ms - last) / 86400000.0, 2) if last else None,
+        "metric_review_text_len_avg": round(tl["avg"], 1) if tl.get("avg") is not None else None,
+        "metric_review_text_len_max": int(tl["max"]) if tl.get("max") is not None else None,
+    }
+
+def ensure_review_metric_mapping():
+    # mapping با dynamic=false است؛ dynamic template به‌تنهایی فیلد جدید را مپ نمی‌کند
+    try:
+        es.indices.put_mapping(index=ES_INDEX, properties={
+            k: {"type": "scaled_float", "scaling_factor": 100} for k in REVIEW_METRIC_FIELDS
+        })
+    except Exception as e:
+        print("[MINER] WARN put_mapping metric_*:", e)
+
+def review_updates() -> Iterator[Dict[str, Any]]:
+    """
+    یک composite روی reviews (به ترتیب store, app_id) merge-join با اسکن مرتب games؛
+    بدون کوئری جدا برای هر اپ و با حافظه‌ی ثابت.
+    """
+    ensure_review_metric_mapping()
+    now_ms = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc).timestamp() * 1000.0
+    hits = scan_games_sorted(REVIEW_METRIC_FIELDS)
+    buckets = iter_composite(REVIEWS_INDEX, REVIEW_AGGS, runtime_mappings=REVIEW_TEXT_LEN)
+    pairs = ((h, review_metrics(b, now_ms)) for h, b in merge_join(hits, buckets))
+    return _changed_updates(pairs, "reviews_aggregated_at", "reviews")
+
+# ---------- drift ----------
+# sketch فیچرها روی همان اسکن features (بدون پاس اضافه)؛ مقایسه با baseline آموزش در /models
+_sketch = drift.FeatureSketch()
+
+def sketched(hits: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for h in hits:
+        _sketch.update(h.get("_source", {}))
+        yield h
+
 def build_updates(docs: Iterable[Dict[str, Any]],
-                  assets_map: Dict[Tuple[str, str], Dict[str, int]]) -> Iterable[Dict[str, Any]]:
+                  assets_map: Optional[Dict[Tuple[str, str], Dict[str, int]]] = None) -> Iterable[Dict[str, Any]]:
+    """assets_map=None: شمارش assets دست نمی‌خورد (در ingest نوشته شده است)."""
     n = 0
     for h in docs:
         src = h.get("_source", {})
@@ -159,7 +324,6 @@ def build_updates(docs: Iterable[Dict[str, Any]],
         flags  = collect_flags(src.get("title",""), src.get("description",""))
         terms  = collect_terms(src.get("title",""), src.get("description",""), "marketing_terms")
         topics = collect_terms(src.get("title",""), src.get("description",""), "topics")
-        counts = assets_map.get((store, app_id), {"icons": 0, "shots": 0})
         sscore = success_score(src)
 
         # feature_flags موجود را با پرچم‌های جدید merge کن
@@ -170,13 +334,11 @@ def build_updates(docs: Iterable[Dict[str, Any]],
             "feature_flags": merged_flags,
             "desc_marketing_terms": terms,
             "desc_topics": topics,
-            "assets_icon_count": counts["icons"],
-            "assets_screenshot_count": counts["shots"],
-            # برای سازگاری با ویژوال‌های قدیمی:
-            "screenshot_count": counts["shots"],
             "success_score": sscore,
             "features_indexed_at": dt.datetime.utcnow().isoformat(timespec="seconds"),
         }
+        if assets_map is not None:
+            doc.update(assets_fields(assets_map.get((store, app_id), ZERO_COUNTS)))
 
         yield {
             "_op_type": "update",
@@ -191,12 +353,19 @@ def build_updates(docs: Iterable[Dict[str, Any]],
             break
 
 def main():
-    assets_map = build_assets_counts_map()
-    updates = build_updates(scan_games(), assets_map)
-    ok, fail = helpers.bulk(
-        es, updates, raise_on_error=False, request_timeout=120, chunk_size=BATCH_SIZE
-    )
+    if MODE == "reconcile":
+        updates = reconcile_updates()
+    elif MODE == "reviews":
+        updates = review_updates()
+    else:
+        updates = build_updates(sketched(scan_games()))
+    with BulkSession(es, [ES_INDEX], name=f"miner-{MODE}"):
+        ok, fail = helpers.bulk(
+            es, updates, raise_on_error=False, request_timeout=120, chunk_size=BATCH_SIZE
+        )
     print(f"[MINER] bulk ok={ok}, fail={len(fail) if isinstance(fail, list) else 0}")
+    if MODE not in ("reconcile", "reviews"):
+        drift.finish_run("miner", _sketch)
 
 if __name__ == "__main__":
     import math  # بعد از import بالایی استفاده شد
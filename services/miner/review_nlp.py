@@ -0,0 +1,195 @@
+# services/miner/review_nlp.py
+"""
+برچسب‌گذاری احساس و موضوع ریویوها (sentiment, sentiment_score, topics) روی ایندکس reviews.
+
+- ریویوها با sliced scroll خوانده می‌شوند؛ هر slice در یک پروسه‌ی جدا: scan → امتیاز → bulk
+- فقط ریویوهایی که sentiment ندارند یا nlp_version قدیمی‌تر دارند پردازش می‌شوند
+- امتیاز احساس: lexicon فارسی/انگلیسی (تک‌واژه و عبارت چندواژه‌ای) با نفی ساده، روی هر batch با numpy نرمال می‌شود
+- موضوع‌ها: یک regex اجتماع (automaton کامپایل‌شده) روی همه‌ی کلیدواژه‌های review_topics
+
+lexicon و موضوع‌ها از feature_dict.yml (کلیدهای review_sentiment / review_topics) قابل تغییرند؛
+بعد از تغییرشان REVIEW_NLP_VERSION را یک واحد بالا ببرید تا همه دوباره پردازش شوند.
+
+اجرا:
+  docker compose run --rm miner python /app/review_nlp.py
+"""
+import os, re, time, multiprocessing as mp
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+
+from miner import DICT, _norm_txt
+
+ES_URL        = os.getenv("ES_HOST", "http://es:9200").rstrip("/")
+REVIEWS_INDEX = os.getenv("ES_REVIEWS_INDEX", "reviews")
+NLP_VERSION   = int(os.getenv("REVIEW_NLP_VERSION", "1"))
+SLICES        = int(os.getenv("REVIEW_NLP_SLICES", str(os.cpu_count() or 2)))
+SCROLL_SIZE   = int(os.getenv("REVIEW_NLP_SCROLL_SIZE", "2000"))
+BULK_CHUNK    = int(os.getenv("REVIEW_NLP_BULK_CHUNK", "2000"))
+STORE_FILTER  = os.getenv("MINER_STORE", "").strip()
+
+# ---------- Lexicon ----------
+DEFAULT_SENTIMENT = {
+    "positive": [
+        "عالی","خوب","خیلی خوب","بهترین","فوق العاده","قشنگ","زیبا","جذاب","سرگرم کننده","باحال","عالیه","خوبه",
+        "دوست دارم","ممنون","مرسی","عشق","محشر","لذت","اعتیاد آور","پیشنهاد میکنم",
+        "great","good","awesome","amazing","love","best","fun","excellent","nice","cool","perfect",
+    ],
+    "negative": [
+        "بد","افتضاح","ضعیف","مزخرف","خراب","باگ","کرش","هنگ","لگ","تبلیغ زیاد","تبلیغات زیاد","پولی","کلاهبرداری",
+        "اعصاب خرد کن","حیف","بدترین","گند","باز نمیشه","اجرا نمیشه","قطع میشه","پول","وقت تلف",
+        "bad","worst","bug","crash","lag","boring","scam","ads","trash","waste","broken","hate","laggy",
+    ],
+    "negators": ["نه","نیست","نبود","اصلا","هیچ","بدون","not","no","never","don't","isn't"],
+}
+
+DEFAULT_TOPICS = {
+    "ads":         ["تبلیغ","تبلیغات","ads","advert"],
+    "bugs":        ["باگ","کرش","هنگ","خطا","ارور","bug","crash","error","freeze"],
+    "performance": ["لگ","کند","سنگین","داغ","باتری","lag","slow","fps","battery"],
+    "monetization":["پول","خرید","گرون","گران","الماس","سکه","pay","price","gems","coins","pay to win"],
+    "difficulty":  ["سخت","آسون","آسان","مرحله","difficult","hard","easy","level"],
+    "graphics":    ["گرافیک","طراحی","graphics","design"],
+    "controls":    ["کنترل","control","controls"],
+    "online":      ["آنلاین","سرور","اینترنت","online","server","multiplayer"],
+    "update":      ["آپدیت","بروزرسانی","به روز رسانی","نسخه","update","version"],
+    "support":     ["پشتیبانی","جواب","support"],
+}
+
+SENTIMENT = {**DEFAULT_SENTIMENT, **(DICT.get("review_sentiment") or {})}
+TOPICS    = DICT.get("review_topics") or DEFAULT_TOPICS
+
+TOKEN_RE = re.compile(r"[\w']+", re.U)
+
+def _build_weights(lex: Dict[str, List[str]]) -> Dict[str, float]:
+    w: Dict[str, float] = {}
+    for t in lex.get("positive", []): w[_norm_txt(t).strip()] = 1.0
+    for t in lex.get("negative", []): w[_norm_txt(t).strip()] = -1.0
+    return w
+
+WEIGHTS   = _build_weights(SENTIMENT)
+MAX_NGRAM = max((len(k.split()) for k in WEIGHTS), default=1)
+NEGATORS  = {_norm_txt(t).strip() for t in SENTIMENT.get("negators", [])}
+
+def _build_topic_re(topics: Dict[str, List[str]]) -> Tuple[re.Pattern, Dict[str, str]]:
+    """همه‌ی کلیدواژه‌ها در یک الگو (بلندترین اول) تا متن فقط یک بار پیمایش شود."""
+    owner: Dict[str, str] = {}
+    for topic, words in topics.items():
+        for w in words:
+            w = _norm_txt(w).strip()
+            if w: owner.setdefault(w, topic)
+    alts = sorted(owner, key=len, reverse=True)
+    pat = re.compile(r"(?<!\w)(" + "|".join(re.escape(a) for a in alts) + r")(?!\w)", re.U) if alts else re.compile(r"(?!x)x")
+    return pat, owner
+
+TOPIC_RE, TOPIC_OWNER = _build_topic_re(TOPICS)
+
+# ---------- Scoring ----------
+def review_text(src: Dict[str, Any]) -> str:
+    return " ".join(str(src.get(k) or "") for k in ("title", "body", "text")).strip()
+
+def raw_sentiment(tokens: List[str]) -> Tuple[float, int]:
+    """(جمع وزن‌ها، تعداد توکن) — عبارت‌های چندواژه‌ای قبل از تک‌واژه؛ نفی تا دو توکن بعد را برعکس می‌کند."""
+    total, i, flip_until = 0.0, 0, -1
+    n = len(tokens)
+    while i < n:
+        if tokens[i] in NEGATORS:
+            flip_until = i + 2
+            i += 1
+            continue
+        w, step = 0.0, 1
+        for k in range(min(MAX_NGRAM, n - i), 0, -1):
+            w = WEIGHTS.get(" ".join(tokens[i:i + k]), 0.0)
+            if w:
+                step = k
+                break
+        total += -w if i <= flip_until else w
+        i += step
+    return total, n
+
+def topics_of(text: str) -> List[str]:
+    return list(dict.fromkeys(TOPIC_OWNER[m.group(1)] for m in TOPIC_RE.finditer(text)))
+
+def analyze_batch(srcs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    texts = [_norm_txt(review_text(s)) for s in srcs]
+    raws, lens = zip(*(raw_sentiment(TOKEN_RE.findall(t)) for t in texts)) if texts else ((), ())
+    raw = np.asarray(raws, dtype=float)
+    n = np.asarray(lens, dtype=float)
+
+    # امتیاز متن در [-1, 1]؛ برای متن خالی از امتیاز ستاره‌ای (1..5) استفاده می‌شود
+    text_score = np.tanh(raw / np.sqrt(np.maximum(n, 1.0)))
+    stars = np.asarray([float(s.get("rating") or 0) for s in srcs], dtype=float)
+    star_score = np.where(stars > 0, (stars - 3.0) / 2.0, 0.0)
+    score = np.where(raw != 0, 0.7 * text_score + 0.3 * star_score, star_score)
+    label = np.where(score > 0.15, "positive", np.where(score < -0.15, "negative", "neutral"))
+
+    return [
+        {"sentiment": str(lb), "sentiment_score": round(float(sc), 4), "topics": topics_of(t), "nlp_version": NLP_VERSION}
+        for lb, sc, t in zip(label, score, texts)
+    ]
+
+# ---------- Sliced scroll ----------
+def pending_query() -> Dict[str, Any]:
+    q: Dict[str, Any] = {"bool": {"should": [
+        {"bool": {"must_not": [{"exists": {"field": "sentiment"}}]}},
+        {"bool": {"must_not": [{"exists": {"field": "nlp_version"}}]}},
+        {"range": {"nlp_version": {"lt": NLP_VERSION}}},
+    ], "minimum_should_match": 1}}
+    if STORE_FILTER:
+        q["bool"]["filter"] = [{"term": {"store": STORE_FILTER}}]
+    return q
+
+def _batched(it: Iterable[Dict[str, Any]], n: int) -> Iterator[List[Dict[str, Any]]]:
+    buf: List[Dict[str, Any]] = []
+    for x in it:
+        buf.append(x)
+        if len(buf) >= n:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+def run_slice(slice_id: int) -> Tuple[int, int, int]:
+    es = Elasticsearch(ES_URL).options(request_timeout=120)
+    body: Dict[str, Any] = {"query": pending_query(), "_source": ["title", "body", "text", "rating"]}
+    if SLICES > 1:
+        body["slice"] = {"id": slice_id, "max": SLICES}
+    hits = helpers.scan(es, index=REVIEWS_INDEX, query=body, size=SCROLL_SIZE, scroll="5m", preserve_order=False)
+    seen = 0
+
+    def actions():
+        nonlocal seen
+        for batch in _batched(hits, SCROLL_SIZE):
+            seen += len(batch)
+            for h, doc in zip(batch, analyze_batch([h.get("_source", {}) for h in batch])):
+                yield {"_op_type": "update", "_index": h["_index"], "_id": h["_id"], "doc": doc}
+
+    ok, errors = helpers.bulk(es, actions(), chunk_size=BULK_CHUNK, raise_on_error=False)
+    return seen, ok or 0, len(errors) if isinstance(errors, list) else 0
+
+def ensure_mapping(es: Elasticsearch):
+    try:
+        es.indices.put_mapping(index=REVIEWS_INDEX, properties={"nlp_version": {"type": "integer"}})
+    except Exception as e:
+        print("[NLP] WARN put_mapping nlp_version:", e)
+
+def main():
+    es = Elasticsearch(ES_URL).options(request_timeout=60)
+    ensure_mapping(es)
+    todo = es.count(index=REVIEWS_INDEX, query=pending_query())["count"]
+    print(f"[NLP] {todo} reviews to analyze (version={NLP_VERSION}, slices={SLICES})")
+    if not todo:
+        return
+
+    t0 = time.time()
+    seen = ok = fail = 0
+    with mp.Pool(SLICES) as pool:
+        for n, o, f in pool.imap_unordered(run_slice, range(SLICES)):
+            seen += n; ok += o; fail += f
+            print(f"[NLP] slice done: seen={seen}/{todo} ok={ok} fail={fail}")
+    dt_s = max(time.time() - t0, 1e-6)
+    print(f"[NLP] done. reviews={seen} ok={ok} fail={fail} in {dt_s:.1f}s ({seen / dt_s:.0f} reviews/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# services/miner/trends.py
+"""
+روند واژه‌های پرتکرار («این هفته بازیکن‌ها از چه شکایت دارند») به تفکیک (ژانر، هفته).
+
+- ریویوهای جدید (و توضیحات بازی‌های تازه‌ایندکس‌شده) از روی watermark روی indexed_at خوانده می‌شوند
+- متن با همان نرمال‌سازی review_nlp توکن می‌شود؛ تک‌واژه‌ها و دوواژه‌ای‌ها بدون stopword
+- هر batch در Space-Saving درون‌حافظه (drift.SpaceSaving) برای هر (منبع، هفته، ژانر) خلاصه می‌شود و بعد در
+  sorted setهای Redis ادغام می‌شود؛ هر کلید به TRENDS_CAPACITY عضو برتر بریده می‌شود (خلاصه‌ی قابل ادغام)
+
+کلیدها:  trends:{source}:{week}:{genre}   source ∈ reviews | complaints | descriptions ، genre=all برای همه
+complaints = ریویوهای منفی (sentiment=negative یا امتیاز ≤ 2)؛ API: GET /trends
+
+اجرا:
+  docker compose up -d trends                              # هر TRENDS_LOOP_SEC ثانیه
+  TRENDS_LOOP_SEC=0 docker compose run --rm miner python /app/trends.py   # یک بار
+"""
+import os, time, datetime as dt
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from elasticsearch import helpers
+from redis import Redis
+
+from miner import es, ES_INDEX, REVIEWS_INDEX, DICT, _norm_txt
+from review_nlp import TOKEN_RE, review_text
+from drift import SpaceSaving
+
+REDIS_URL     = os.getenv("REDIS_URL", "redis://redis:6379/0")
+PREFIX        = os.getenv("TRENDS_PREFIX", "trends")
+CAPACITY      = int(os.getenv("TRENDS_CAPACITY", "500"))
+TTL_WEEKS     = int(os.getenv("TRENDS_TTL_WEEKS", "12"))
+LAG_SEC       = int(os.getenv("TRENDS_LAG_SEC", "60"))       # سندهایی که هنوز refresh نشده‌اند جا نمانند
+LOOP_SEC      = int(os.getenv("TRENDS_LOOP_SEC", "0"))       # 0 = یک بار
+BATCH         = int(os.getenv("TRENDS_BATCH", "5000"))
+BOOTSTRAP_DAYS = int(os.getenv("TRENDS_BOOTSTRAP_DAYS", "28"))  # اجرای اول فقط همین چند روز اخیر
+GENRE_CACHE   = 50000
+
+DEFAULT_STOPWORDS = [
+    "و","در","به","از","که","این","آن","را","با","است","برای","یه","یک","هم","تا","اما","ولی","اگه","اگر","رو",
+    "من","ما","شما","اون","هست","بود","شد","شده","میشه","کنه","کنید","کردم","داره","دارد","خیلی","فقط",
+    "بازی","برنامه","هر","چی","چرا","کنم","باشه","نمی","می","ها","های","the","a","an","and","or","is","it","this",
+    "to","of","in","for","game","app","i","you","my","me","but","so","very",
+]
+STOPWORDS = {_norm_txt(w).strip() for w in (DICT.get("trend_stopwords") or DEFAULT_STOPWORDS)}
+
+# ==================== Tokenize ====================
+def terms(text: str) -> List[str]:
+    toks = [t for t in TOKEN_RE.findall(_norm_txt(text)) if len(t) > 1 and not t.isdigit()]
+    keep = [t if t not in STOPWORDS else None for t in toks]
+    out = [t for t in keep if t]
+    out.extend(f"{a} {b}" for a, b in zip(keep, keep[1:]) if a and b)
+    return out
+
+def iso_week(v: Any) -> Optional[str]:
+    try:
+        t = dt.datetime.fromisoformat(str(v).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    y, w, _ = t.isocalendar()
+    return f"{y}-W{w:02d}"
+
+def is_complaint(src: Dict[str, Any]) -> bool:
+    try: low = 0 < float(src.get("rating") or 0) <= 2
+    except (TypeError, ValueError): low = False
+    return src.get("sentiment") == "negative" or low
+
+# ==================== Genre lookup ====================
+_genres: "OrderedDict[str, str]" = OrderedDict()
+
+def genres_for(keys: Iterable[str]) -> Dict[str, str]:
+    """_id بازی (store::app_id) → ژانر؛ LRU کوچک + mget برای بقیه"""
+    keys = list(dict.fromkeys(keys))
+    missing = [k for k in keys if k not in _genres]
+    for i in range(0, len(missing), 1000):
+        resp = es.mget(index=ES_INDEX, ids=missing[i:i + 1000], _source=["genre"])
+        for d in resp.get("docs", []):
+            _genres[d["_id"]] = str(((d.get("_source") or {}).get("genre")) or "unknown").lower()
+    for k in missing:
+        _genres.setdefault(k, "unknown")
+    for k in keys:
+        _genres.move_to_end(k)
+    while len(_genres) > GENRE_CACHE:
+        _genres.popitem(last=False)
+    return {k: _genres[k] for k in keys}
+
+# ==================== Sources ====================
+def scan_since(index: str, since: str, until: str, fields: List[str]) -> Iterator[Dict[str, Any]]:
+    rng: Dict[str, Any] = {"lte": until}
+    if since: rng["gt"] = since
+    q = {"query": {"range": {"indexed_at": rng}}, "_source": fields}
+    # reviews پشت alias ماهانه است؛ pre_filter ایندکس‌هایی را که indexed_at آن‌ها بیرون بازه است رد می‌کند
+    yield from helpers.scan(es, index=index, query=q, size=2000, preserve_order=False, pre_filter_shard_size=1)
+
+def _batched(it: Iterable[Dict[str, Any]], n: int) -> Iterator[List[Dict[str, Any]]]:
+    buf: List[Dict[str, Any]] = []
+    for x in it:
+        buf.append(x)
+        if len(buf) >= n:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+Seen = Dict[str, List[str]]   # کلید set سندهای شمرده‌شده‌ی هفته -> idهای تازه‌ی این batch
+
+def first_seen(r: Redis, name: str, hits: List[Dict[str, Any]], weeks: List[Optional[str]]) -> Tuple[List[bool], Seen]:
+    """
+    برای هر سند: آیا هنوز در set شمرده‌شده‌های هفته‌اش نیست. فقط می‌خواند؛ idها را merge_into_redis در همان
+    MULTI/EXEC شمارش‌ها اضافه می‌کند تا ادغام ناموفق باعث گم شدن شمارش در اجرای بعدی نشود.
+    """
+    pipe = r.pipeline(transaction=False)
+    for h, week in zip(hits, weeks):
+        if week:
+            pipe.sismember(f"{PREFIX}:seen:{name}:{week}", h["_id"])
+    member = iter(pipe.execute())
+    fresh: List[bool] = []
+    seen: Seen = {}
+    batch = set()
+    for h, week in zip(hits, weeks):
+        ok = bool(week) and not next(member) and (week, h["_id"]) not in batch
+        if ok:
+            batch.add((week, h["_id"]))
+            seen.setdefault(f"{PREFIX}:seen:{name}:{week}", []).append(h["_id"])
+        fresh.append(ok)
+    return fresh, seen
+
+def summarize_reviews(r: Redis, hits: List[Dict[str, Any]]) -> Tuple[Dict[Tuple[str, str, str], SpaceSaving], Seen]:
+    """هر ریویو یک بار شمرده می‌شود، حتی اگر خزش دوباره indexed_at آن را جلو ببرد"""
+    srcs = [h.get("_source", {}) for h in hits]
+    weeks = [iso_week(s.get("created_at")) or iso_week(s.get("indexed_at")) for s in srcs]
+    fresh, seen = first_seen(r, "reviews", hits, weeks)
+    genre = genres_for(f"{s.get('store')}::{s.get('app_id')}" for s, ok in zip(srcs, fresh) if ok)
+    out: Dict[Tuple[str, str, str], SpaceSaving] = {}
+    for s, week, ok in zip(srcs, weeks, fresh):
+        if not ok: continue
+        g = genre.get(f"{s.get('store')}::{s.get('app_id')}", "unknown")
+        sources = ["reviews", "complaints"] if is_complaint(s) else ["reviews"]
+        for term in terms(review_text(s)):
+            for src in sources:
+                for gg in (g, "all"):
+                    out.setdefault((src, week, gg), SpaceSaving(CAPACITY)).add(term)
+    return out, seen
+
+def summarize_descriptions(r: Redis, hits: List[Dict[str, Any]]) -> Tuple[Dict[Tuple[str, str, str], SpaceSaving], Seen]:
+    """هر بازی حداکثر یک بار در هفته شمرده می‌شود (خزش دوباره indexed_at را جلو می‌برد)"""
+    weeks = [iso_week(h.get("_source", {}).get("indexed_at")) for h in hits]
+    fresh, seen = first_seen(r, "descriptions", hits, weeks)
+    out: Dict[Tuple[str, str, str], SpaceSaving] = {}
+    for h, week, ok in zip(hits, weeks, fresh):
+        if not ok: continue
+        s = h.get("_source", {})
+        g = str(s.get("genre") or "unknown").lower()
+        # هر واژه یک بار برای هر بازی (توضیحات بلند نباید غالب شوند)
+        for term in set(terms(f"{s.get('title') or ''} {s.get('description') or ''}")):
+            for gg in (g, "all"):
+                out.setdefault(("descriptions", week, gg), SpaceSaving(CAPACITY)).add(term)
+    return out, seen
+
+# ==================== Redis ====================
+def _key(source: str, week: str, genre: str) -> str:
+    return f"{PREFIX}:{source}:{week}:{genre}"
+
+def merge_into_redis(r: Redis, summaries: Dict[Tuple[str, str, str], SpaceSaving], seen: Seen):
+    """
+    ZINCRBY شمارش‌های batch، برش به CAPACITY عضو برتر و علامت زدن سندهای شمرده‌شده، همه در یک MULTI/EXEC:
+    یا هر دو اعمال می‌شوند یا هیچ‌کدام (اجرای بعدی از همان watermark دوباره می‌شمارد)
+    """
+    if not summaries and not seen: return
+    pipe = r.pipeline(transaction=True)
+    for (source, week, genre), ss in summaries.items():
+        key = _key(source, week, genre)
+        for term, c in ss.counts.items():
+            pipe.zincrby(key, c, term)
+        pipe.zremrangebyrank(key, 0, -(CAPACITY + 1))
+        pipe.expire(key, TTL_WEEKS * 7 * 86400)
+        pipe.sadd(f"{PREFIX}:genres", genre)
+    for key, ids in seen.items():
+        pipe.sadd(key, *ids)
+        pipe.expire(key, TTL_WEEKS * 7 * 86400)
+    pipe.execute()
+
+def run_source(r: Redis, name: str, index: str, fields: List[str], summarize) -> int:
+    wm_key = f"{PREFIX}:watermark:{name}"
+    since = r.get(wm_key) or ""
+    if not since and BOOTSTRAP_DAYS > 0:
+        since = (dt.datetime.utcnow() - dt.timedelta(days=BOOTSTRAP_DAYS)).isoformat(timespec="seconds")
+    until = (dt.datetime.utcnow() - dt.timedelta(seconds=LAG_SEC)).isoformat(timespec="seconds")
+    n = 0
+    for batch in _batched(scan_since(index, since, until, fields), BATCH):
+        merge_into_redis(r, *summarize(r, batch))
+        n += len(batch)
+    # watermark فقط بعد از ادغام کامل جلو می‌رود (اجرای ناقص دوباره از همان نقطه شروع می‌کند)
+    r.set(wm_key, until)
+    print(f"[TRENDS] {name}: {n} docs in ({since or 'beginning'}, {until}]")
+    return n
+
+def run_once(r: Redis):
+    t0 = time.time()
+    run_source(r, "reviews", REVIEWS_INDEX,
+               ["store", "app_id", "title", "body", "text", "rating", "sentiment", "created_at", "indexed_at"],
+               summarize_reviews)
+    run_source(r, "descriptions", ES_INDEX, ["title", "description", "genre", "indexed_at"], summarize_descriptions)
+    print(f"[TRENDS] done in {time.time() - t0:.1f}s")
+
+def main():
+    r = Redis.from_url(REDIS_URL, decode_responses=True)
+    while True:
+        try:
+            run_once(r)
+        except Exception as e:
+            if not LOOP_SEC: raise
+            print("[TRENDS] run failed, will retry:", e)
+        if not LOOP_SEC:
+            break
+        time.sleep(LOOP_SEC)
+
+if __name__ == "__main__":
+    main()
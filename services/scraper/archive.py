@@ -0,0 +1,119 @@
+# services/scraper/archive.py
+"""
+آرشیو خام صفحات (شبیه WARC) برای اجرای دوباره‌ی استخراج بدون خزش مجدد.
+
+ساختار روی دیسک (append-only):
+  seg-<ts>-<pid>-<n>.zst   هر رکورد یک frame مستقل zstd:  header(JSON)\\n + body(UTF-8)
+  seg-<ts>-<pid>-<n>.idx   هر خط:  doc_id \\t offset \\t length \\t fetched_at
+
+چون هر رکورد frame جداست، با offset/length از idx می‌شود مستقیم همان رکورد را خواند.
+هر پروسه‌ی خزنده segmentهای خودش را می‌نویسد، پس چند خزنده روی یک پوشه تداخلی ندارند.
+"""
+import os, json, time, glob, datetime as dt
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SEGMENT_MAX_BYTES = int(float(os.getenv("ARCHIVE_SEGMENT_MB", "256")) * 1024 * 1024)
+ZSTD_LEVEL        = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "6"))
+
+# (segment_path, offset, length)
+Pointer = Tuple[str, int, int]
+
+class PageArchive:
+    def __init__(self, root: str, segment_max_bytes: int = SEGMENT_MAX_BYTES, level: int = ZSTD_LEVEL):
+        import zstandard
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.segment_max_bytes = segment_max_bytes
+        self._cctx = zstandard.ZstdCompressor(level=level)
+        self._stem = f"seg-{int(time.time())}-{os.getpid()}"
+        self._n = 0
+        self._data = None
+        self._idx = None
+        self._open_next()
+
+    def _open_next(self):
+        self.close()
+        self._n += 1
+        base = os.path.join(self.root, f"{self._stem}-{self._n:04d}")
+        self._data = open(base + ".zst", "ab")
+        self._idx = open(base + ".idx", "a", encoding="utf-8")
+
+    def append(self, url: str, body: str, doc_id: str,
+               genre_hint: Optional[str] = None, source_list: Optional[str] = None) -> Pointer:
+        fetched_at = dt.datetime.utcnow().isoformat(timespec="seconds")
+        header = {"url": url, "doc_id": doc_id, "fetched_at": fetched_at,
+                  "genre_hint": genre_hint, "source_list": source_list or ""}
+        frame = self._cctx.compress(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n" + body.encode("utf-8"))
+        if self._data.tell() and self._data.tell() + len(frame) > self.segment_max_bytes:
+            self._open_next()
+        offset = self._data.tell()
+        self._data.write(frame)
+        self._data.flush()
+        # خط idx بعد از داده نوشته می‌شود؛ اگر وسط کار crash شود فقط رکورد آخر بی‌ایندکس می‌ماند
+        self._idx.write(f"{doc_id}\t{offset}\t{len(frame)}\t{fetched_at}\n")
+        self._idx.flush()
+        return (self._data.name, offset, len(frame))
+
+    def close(self):
+        for f in (self._data, self._idx):
+            if f is not None:
+                try: f.close()
+                except Exception: pass
+        self._data = self._idx = None
+
+# ==================== Read side ====================
+def list_segments(root: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(root, "seg-*.zst")))
+
+def load_latest_index(root: str) -> Dict[str, Pointer]:
+    """doc_id → آخرین رکورد آن (بر اساس fetched_at). رکوردهایی که از انتهای فایل بیرون‌اند رد می‌شوند."""
+    latest: Dict[str, Tuple[str, Pointer]] = {}
+    for seg in list_segments(root):
+        idx_path = seg[:-4] + ".idx"
+        if not os.path.exists(idx_path):
+            continue
+        size = os.path.getsize(seg)
+        with open(idx_path, "r", encoding="utf-8") as f:
+            for ln in f:
+                parts = ln.rstrip("\n").split("\t")
+                if len(parts) != 4:
+                    continue
+                doc_id, off, length, fetched_at = parts[0], int(parts[1]), int(parts[2]), parts[3]
+                if off + length > size:
+                    continue
+                prev = latest.get(doc_id)
+                if prev is None or fetched_at >= prev[0]:
+                    latest[doc_id] = (fetched_at, (seg, off, length))
+    return {k: v[1] for k, v in latest.items()}
+
+def _decode(raw: bytes) -> Tuple[Dict, str]:
+    head, _, body = raw.partition(b"\n")
+    return json.loads(head), body.decode("utf-8", "replace")
+
+def read_records(pointers: List[Pointer]) -> Iterator[Tuple[Dict, str]]:
+    """رکوردها را به ترتیب (segment, offset) می‌خواند تا خواندن دیسک ترتیبی بماند."""
+    import zstandard
+    dctx = zstandard.ZstdDecompressor()
+    cur_path, fh = None, None
+    try:
+        for path, off, length in sorted(pointers):
+            if path != cur_path:
+                if fh: fh.close()
+                fh, cur_path = open(path, "rb"), path
+            fh.seek(off)
+            yield _decode(dctx.decompress(fh.read(length)))
+    finally:
+        if fh: fh.close()
+
+def iter_all(root: str) -> Iterator[Tuple[Dict, str]]:
+    """همه‌ی رکوردها (شامل نسخه‌های قدیمی) به ترتیب نوشتن."""
+    for seg in list_segments(root):
+        idx_path = seg[:-4] + ".idx"
+        ptrs: List[Pointer] = []
+        if os.path.exists(idx_path):
+            with open(idx_path, "r", encoding="utf-8") as f:
+                for ln in f:
+                    parts = ln.rstrip("\n").split("\t")
+                    if len(parts) == 4:
+                        ptrs.append((seg, int(parts[1]), int(parts[2])))
+        yield from read_records(ptrs)
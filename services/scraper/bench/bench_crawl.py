@@ -0,0 +1,253 @@
+# services/scraper/bench/bench_crawl.py
+"""
+بنچمارک آفلاین خزنده: صفحات ذخیره‌شده‌ی لیست/اپ (fixtures/manifest.json) را از طریق
+httpx.MockTransport به crawler.worker می‌دهد؛ frontier در حافظه است و ES یک stub محلی
+(در پروسه‌ی جدا تا CPUاش حساب نشود) که فقط bulk/update را جواب می‌دهد.
+
+خروجی:
+  - pages/s، apps/s و CPU به ازای هر صفحه برای اجرای کامل worker
+  - زمان و حافظه‌ی تخصیص‌یافته (tracemalloc) برای هر مرحله‌ی استخراج روی هر fixture
+
+اجرا:
+  python bench/bench_crawl.py
+  BENCH_LIST_PAGES=40 BENCH_CONCURRENCY=8 python bench/bench_crawl.py
+"""
+import asyncio, os, re, sys, json, time, hashlib, pathlib, tracemalloc, multiprocessing as mp
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import httpx
+from elasticsearch import Elasticsearch
+
+HERE = pathlib.Path(__file__).parent
+sys.path.insert(0, str(HERE.parent))
+
+FIXTURES_DIR   = pathlib.Path(os.getenv("BENCH_FIXTURES", str(HERE / "fixtures")))
+LIST_PAGES     = int(os.getenv("BENCH_LIST_PAGES", "10"))     # صفحات لیست به ازای هر استور
+CONCURRENCY    = int(os.getenv("BENCH_CONCURRENCY", "4"))
+STAGE_REPEAT   = int(os.getenv("BENCH_STAGE_REPEAT", "50"))
+ENABLE_REVIEWS = os.getenv("BENCH_REVIEWS", "1") == "1"
+ENABLE_AJAX    = os.getenv("BENCH_AJAX_REVIEWS", "0") == "1"
+JSON_OUT       = os.getenv("BENCH_JSON", "").strip()           # مسیر خروجی JSON (اختیاری)
+
+# ==================== Fixtures ====================
+def load_fixtures() -> Dict[str, Dict[str, str]]:
+    manifest = json.loads((FIXTURES_DIR / "manifest.json").read_text(encoding="utf-8"))
+    out: Dict[str, Dict[str, str]] = {}
+    for store, spec in manifest.items():
+        out[store] = {
+            "list_url": spec["list_url"],
+            "list": (FIXTURES_DIR / spec["list"]).read_text(encoding="utf-8"),
+            "app":  (FIXTURES_DIR / spec["app"]).read_text(encoding="utf-8"),
+        }
+    return out
+
+APP_HREF = re.compile(r'(/app/[A-Za-z0-9._-]+)')
+
+def _store_of(url: str) -> Optional[str]:
+    if "cafebazaar.ir" in url: return "bazaar"
+    if "myket.ir" in url: return "myket"
+    return None
+
+def make_transport(fx: Dict[str, Dict[str, str]]) -> httpx.MockTransport:
+    """هر صفحه‌ی لیست شناسه‌ی اپ‌هایش را با هش URL یکتا می‌کند تا هر صفحه اپ‌های تازه بدهد."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        store = _store_of(url)
+        if not store or store not in fx:
+            return httpx.Response(404, text="not found")
+        if "/app/" in url:
+            body = fx[store]["app"]
+        else:
+            tag = hashlib.sha1(url.encode("utf-8")).hexdigest()[:6]
+            body = APP_HREF.sub(lambda m: f"{m.group(1)}.p{tag}", fx[store]["list"])
+        return httpx.Response(200, text=body, headers={"content-type": "text/html; charset=utf-8"})
+    return httpx.MockTransport(handler)
+
+# ==================== In-memory Redis ====================
+class MemoryRedis:
+    """زیرمجموعه‌ی opهای redis.asyncio که crawler استفاده می‌کند."""
+    def __init__(self):
+        self.lists: Dict[str, List[str]] = {}
+        self.sets: Dict[str, set] = {}
+        self.kv: Dict[str, str] = {}
+        self.last_activity = time.perf_counter()
+
+    async def llen(self, key): return len(self.lists.get(key, []))
+    async def rpush(self, key, *vals):
+        self.lists.setdefault(key, []).extend(vals); return len(self.lists[key])
+    async def lpush(self, key, *vals):
+        lst = self.lists.setdefault(key, [])
+        for v in vals: lst.insert(0, v)
+        return len(lst)
+    async def lpop(self, key):
+        lst = self.lists.get(key)
+        return lst.pop(0) if lst else None
+    async def sadd(self, key, *vals):
+        s = self.sets.setdefault(key, set()); n = len(s); s.update(vals)
+        return len(s) - n
+    async def get(self, key): return self.kv.get(key)
+    async def set(self, key, val):
+        self.kv[key] = str(val); self.last_activity = time.perf_counter(); return True
+    async def xadd(self, key, fields, **kw):
+        self.lists.setdefault(key, []).append(fields); return f"{len(self.lists[key])}-0"
+    async def aclose(self): pass
+
+# ==================== Stub ES ====================
+class _StubES(BaseHTTPRequestHandler):
+    def log_message(self, *a): pass
+
+    def _reply(self, payload: Dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def do_HEAD(self):
+        self.send_response(200); self.send_header("X-Elastic-Product", "Elasticsearch"); self.end_headers()
+
+    def do_GET(self):
+        self._reply({"version": {"number": "8.13.4"}, "tagline": "You Know, for Search"})
+
+    def do_PUT(self):
+        self.do_POST()
+
+    def do_POST(self):
+        raw = self._body()
+        if self.path.split("?")[0].endswith("/_bulk"):
+            items = []
+            for ln in raw.splitlines():
+                if not ln.strip(): continue
+                obj = json.loads(ln)
+                op = next(iter(obj)) if len(obj) == 1 else None
+                if op in ("index", "create", "update", "delete"):
+                    meta = obj[op]
+                    items.append({op: {"_index": meta.get("_index"), "_id": meta.get("_id"), "status": 200, "result": "updated"}})
+            return self._reply({"took": 0, "errors": False, "items": items})
+        parts = self.path.split("?")[0].strip("/").split("/")
+        return self._reply({"_index": parts[0], "_id": parts[-1], "_version": 1, "result": "updated",
+                            "_shards": {"total": 1, "successful": 1, "failed": 0}})
+
+def _serve_stub_es(port_q):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _StubES)
+    port_q.put(srv.server_address[1])
+    srv.serve_forever()
+
+def start_stub_es():
+    q = mp.Queue()
+    proc = mp.Process(target=_serve_stub_es, args=(q,), daemon=True)
+    proc.start()
+    return proc, f"http://127.0.0.1:{q.get(timeout=10)}"
+
+# ==================== End-to-end run ====================
+async def run_crawl(crawler, fx) -> Dict:
+    rds = MemoryRedis()
+    crawler.rds = rds
+    seeds = [f"{spec['list_url']}?page={p}" for spec in fx.values() for p in range(1, LIST_PAGES + 1)]
+    await crawler.frontier_init(seeds)
+    await rds.sadd(crawler.SEEN_KEY, *seeds)
+
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    tasks = [asyncio.create_task(crawler.worker(f"B{i+1}")) for i in range(CONCURRENCY)]
+    # worker روی صف خالی poll می‌کند؛ وقتی صف خالی ماند و کاری جلو نرفت، متوقفش می‌کنیم
+    while True:
+        await asyncio.sleep(0.2)
+        if not rds.lists.get(crawler.FRONTIER_KEY) and time.perf_counter() - rds.last_activity > 1.0:
+            break
+    for t in tasks: t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await crawler.close_shared_client()
+    wall = rds.last_activity - t0
+    cpu = time.process_time() - cpu0
+
+    pages = len(seeds)
+    apps = len(rds.sets.get(crawler.SEEN_KEY, ())) - pages
+    return {
+        "list_pages": pages, "apps": apps, "wall_s": round(wall, 3),
+        "pages_per_s": round((pages + apps) / wall, 1) if wall else None,
+        "apps_per_s": round(apps / wall, 1) if wall else None,
+        "cpu_ms_per_page": round(1000 * cpu / max(1, pages + apps), 3),
+    }
+
+# ==================== Per-stage micro-benchmarks ====================
+def _stage(fn, *args) -> Dict:
+    fn(*args)  # warmup
+    t0 = time.perf_counter()
+    for _ in range(STAGE_REPEAT): fn(*args)
+    per_call = (time.perf_counter() - t0) / STAGE_REPEAT
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    out = fn(*args)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0)
+    del out
+    return {"ms": round(per_call * 1000, 3), "peak_kib": round(peak / 1024, 1), "blocks": blocks}
+
+def run_stages(crawler, fx) -> Dict[str, Dict[str, Dict]]:
+    out: Dict[str, Dict[str, Dict]] = {}
+    for store, spec in fx.items():
+        app_url = spec["list_url"].split("/cat/")[0].split("/games")[0] + "/app/com.bench.sample"
+        list_url = spec["list_url"]
+        app_html, list_html = spec["app"], spec["list"]
+        adapter = crawler.BAZAAR_ADAPTER if store == "bazaar" else crawler.MYKET_ADAPTER
+        stages = {
+            "extract_fields_basic": (crawler.extract_fields_basic, app_html),
+            "enrich_with_adapter":  (lambda u, h: crawler.enrich_with_adapter(u, h, {}), app_url, app_html),
+            "extract_links":        (crawler.extract_links, list_url, list_html),
+            "extract_image_urls":   (crawler.extract_image_urls, app_url, app_html),
+            "extract_reviews":      (crawler.extract_reviews_for_page, app_url, app_html, crawler.REVIEWS_PER_APP),
+            "to_game_doc":          (crawler.to_game_doc, app_url, crawler.extract_fields_basic(app_html)),
+        }
+        if adapter is not None:
+            stages[f"adapter.{store}.parse"] = (adapter.parse, app_url, app_html)
+        out[store] = {name: _stage(fn, *args) for name, (fn, *args) in stages.items()}
+    return out
+
+# ==================== Main ====================
+def print_report(e2e: Dict, stages: Dict[str, Dict[str, Dict]]):
+    print("\n== end-to-end (crawler.worker) ==")
+    for k, v in e2e.items():
+        print(f"  {k:<16} {v}")
+    print(f"\n== stages (x{STAGE_REPEAT}) ==")
+    print(f"  {'store':<8} {'stage':<28} {'ms/call':>9} {'peak KiB':>9} {'blocks':>8}")
+    for store, rows in stages.items():
+        for name, r in rows.items():
+            print(f"  {store:<8} {name:<28} {r['ms']:>9} {r['peak_kib']:>9} {r['blocks']:>8}")
+
+def main():
+    fx = load_fixtures()
+    proc, es_url = start_stub_es()
+    try:
+        import crawler
+        crawler.es = Elasticsearch(es_url, request_timeout=30)
+        crawler.HTTP_TRANSPORT = make_transport(fx)
+        crawler.DELAY_SEC = 0.0
+        crawler.MAX_PAGES = 0
+        crawler.MAX_APPS = 0
+        crawler.FOLLOW_LIST_LINKS = False
+        crawler.ENABLE_REVIEWS = ENABLE_REVIEWS
+        crawler.ENABLE_AJAX_REVIEWS = ENABLE_AJAX
+
+        e2e = asyncio.run(run_crawl(crawler, fx))
+        stages = run_stages(crawler, fx)
+    finally:
+        proc.terminate()
+
+    print_report(e2e, stages)
+    if JSON_OUT:
+        with open(JSON_OUT, "w", encoding="utf-8") as f:
+            json.dump({"e2e": e2e, "stages": stages, "concurrency": CONCURRENCY, "list_pages": LIST_PAGES}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
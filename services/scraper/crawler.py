@@ -1,11 +1,12 @@
 ﻿# ./services/scraper/crawler.py
 import asyncio, os, re, time, json, datetime as dt, sys, pathlib, hashlib
+from contextlib import contextmanager, nullcontext
 from typing import List, Optional, Dict, Tuple, Set
 from urllib.parse import urlparse, urljoin
 
 import httpx
 from selectolax.parser import HTMLParser
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import helpers
 from redis.asyncio import Redis
 
 # --- import path for local packages (spiders, adapters)
@@ -14,13 +15,18 @@ sys.path.append(str(BASE))
 sys.path.append(str(BASE / "spiders"))
 sys.path.append(str(BASE / "adapters"))
 sys.path.append(str(BASE / "utils"))
+sys.path.append(str(BASE.parent / "analyzer"))
+
+from genres import GENRE_PIPELINE, canonical_genre, genre_from_url, normalize_doc, ensure_pipeline
+from bulk_session import BulkSession, client as es_client
+import http_pool
 
 # ==================== ENV ====================
 ES_URL        = os.getenv("ES_HOST", "http://es:9200").rstrip("/")
 ES_INDEX      = os.getenv("ES_INDEX", "games")
 
 # reviews
-ES_REVIEWS_INDEX    = os.getenv("ES_REVIEWS_INDEX", "reviews")
+ES_REVIEWS_INDEX    = os.getenv("ES_REVIEWS_INDEX", "reviews")   # write alias روی reviews-YYYY.MM-NNNNNN (ILM rollover)
 ENABLE_REVIEWS      = os.getenv("ENABLE_REVIEWS", "1") == "1"
 REVIEWS_PER_APP     = int(os.getenv("REVIEWS_PER_APP", "50"))
 ENABLE_AJAX_REVIEWS = os.getenv("ENABLE_AJAX_REVIEWS", "1") == "1"  # ⬅️ جدید
@@ -44,6 +50,10 @@ SEEN_KEY      = os.getenv("SEEN_KEY", "frontier:seen")
 PAGES_COUNT   = os.getenv("PAGES_COUNT", "frontier:pages_count")
 APPS_COUNT    = os.getenv("APPS_COUNT", "frontier:apps_count")
 
+# Redis Stream برای رویداد app_indexed (services/worker مصرف می‌کند؛ خالی = غیرفعال)
+EVENTS_STREAM = os.getenv("EVENTS_STREAM", "events:app_indexed").strip()
+EVENTS_MAXLEN = int(os.getenv("EVENTS_MAXLEN", "1000000"))
+
 # Auto-discover
 USE_ADAPTERS        = os.getenv("USE_ADAPTERS", "1") == "1"
 
@@ -54,9 +64,17 @@ MYKET_MAX_LISTS     = int(os.getenv("MYKET_MAX_LISTS", "300"))
 BAZAAR_AUTO_DISCOVER = os.getenv("BAZAAR_AUTO_DISCOVER", "0") == "1"
 BAZAAR_ROOT          = os.getenv("BAZAAR_ROOT", "https://cafebazaar.ir/pages/list~app-category~game-categories")
 BAZAAR_MAX_LISTS     = int(os.getenv("BAZAAR_MAX_LISTS", "300"))
+DISCOVER_CONCURRENCY = int(os.getenv("DISCOVER_CONCURRENCY", "4"))
+
+# Raw page archive (empty = disabled) — see archive.py / reprocess.py
+ARCHIVE_DIR   = os.getenv("ARCHIVE_DIR", "").strip()
 
-# HTTP/2 toggle (fallback auto)
-HTTP2_ENABLED  = os.getenv("HTTP2", "0") == "1"
+# خزش بزرگ یک‌باره: refresh خاموش تا پایان خزش (bulk_session.py)؛ برای سرویس دائمی خاموش بماند
+BULK_SESSION  = os.getenv("CRAWL_BULK_SESSION", "0") == "1"
+
+# Prometheus /metrics (0 = disabled)
+METRICS_PORT          = int(os.getenv("METRICS_PORT", "9108"))
+FRONTIER_POLL_SEC     = float(os.getenv("FRONTIER_POLL_SEC", "5"))
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Linux; Android 12; Pixel 5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Mobile Safari/537.36",
@@ -65,30 +83,79 @@ HEADERS = {
 }
 
 # ==================== Clients ====================
-es = Elasticsearch(ES_URL, request_timeout=60)
+es = es_client(ES_URL, request_timeout=60)
 rds: Redis  # set in main()
+ARCHIVE = None  # archive.PageArchive, set in main() if ARCHIVE_DIR
+
+# ==================== Metrics ====================
+class _NoopMetric:
+    def labels(self, *a, **kw): return self
+    def inc(self, *a, **kw): pass
+    def observe(self, *a, **kw): pass
+    def set(self, *a, **kw): pass
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server
+    _LAT = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    PAGES_TOTAL    = Counter("crawler_pages_total", "List pages scanned", ["store"])
+    APPS_TOTAL     = Counter("crawler_apps_total", "App pages indexed", ["store"])
+    REVIEWS_TOTAL  = Counter("crawler_reviews_total", "Reviews indexed", ["store"])
+    ASSETS_TOTAL   = Counter("crawler_assets_total", "Assets indexed", ["store"])
+    RETRIES_TOTAL  = Counter("crawler_fetch_retries_total", "HTTP fetch retries", ["store"])
+    ERRORS_TOTAL   = Counter("crawler_errors_total", "Errors by stage and exception type", ["store", "stage", "error"])
+    FETCH_SECONDS  = Histogram("crawler_fetch_seconds", "HTTP fetch latency (incl. retries)", ["store"], buckets=_LAT)
+    PARSE_SECONDS  = Histogram("crawler_parse_seconds", "Whole-page parse time", ["store", "page"], buckets=_LAT)
+    EXTRACT_SECONDS = Histogram("crawler_extract_seconds", "Per-extractor time", ["extractor"], buckets=_LAT)
+    ES_SECONDS     = Histogram("crawler_es_seconds", "Elasticsearch request latency", ["op", "index"], buckets=_LAT)
+    REDIS_SECONDS  = Histogram("crawler_redis_seconds", "Redis op latency", ["op"], buckets=_LAT)
+    FRONTIER_DEPTH = Gauge("crawler_frontier_depth", "Pending URLs in the Redis frontier")
+    METRICS_ENABLED = True
+except Exception:
+    PAGES_TOTAL = APPS_TOTAL = REVIEWS_TOTAL = ASSETS_TOTAL = RETRIES_TOTAL = ERRORS_TOTAL = _NoopMetric()
+    FETCH_SECONDS = PARSE_SECONDS = EXTRACT_SECONDS = ES_SECONDS = REDIS_SECONDS = FRONTIER_DEPTH = _NoopMetric()
+    METRICS_ENABLED = False
+
+@contextmanager
+def timed(hist, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.labels(**labels).observe(time.perf_counter() - t0)
+
+def count_error(store: str, stage: str, e: BaseException):
+    ERRORS_TOTAL.labels(store=store, stage=stage, error=type(e).__name__).inc()
+
+async def redis_op(op: str, coro):
+    t0 = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        REDIS_SECONDS.labels(op=op).observe(time.perf_counter() - t0)
+
+def start_metrics_server():
+    if not (METRICS_ENABLED and METRICS_PORT > 0):
+        return
+    try:
+        start_http_server(METRICS_PORT)
+        print(f"[METRICS] serving /metrics on :{METRICS_PORT}")
+    except Exception as e:
+        print("[METRICS] start error:", e)
+
+async def frontier_depth_loop():
+    while True:
+        try:
+            FRONTIER_DEPTH.set(await redis_op("llen", rds.llen(FRONTIER_KEY)))
+        except Exception:
+            pass
+        await asyncio.sleep(FRONTIER_POLL_SEC)
 
 # ==================== Helpers ====================
 APP_PAT = re.compile(r"/app/([A-Za-z0-9._-]+)")
 
-# --- Genre normalization (FA -> slug) ---
-GENRE_MAP_FA = {
-    "اکشن": "action","ماجراجویی": "adventure","تفننی": "casual","رانندگی": "racing",
-    "مسابقه‌ای": "racing","مسابقه اي": "racing","مسابقه ايی": "racing","پازل": "puzzle",
-    "معمایی": "puzzle","شبیه‌سازی": "simulation","شبیه سازی": "simulation","ورزشی": "sports",
-    "کلمات": "word","کودکانه": "kids","آرکید": "arcade","استراتژی": "strategy",
-    "شوتر": "action","تیراندازی": "action","رانندگي": "racing","هيجاني": "action",
-}
-CANON_GENRES = {"action","adventure","casual","racing","puzzle","simulation","sports","word","kids","arcade","strategy"}
-
-def _norm_genre(txt: Optional[str]) -> Optional[str]:
-    if not txt: return None
-    t = re.sub(r"\s+", " ", str(txt)).strip().strip("/").strip()
-    low = t.lower()
-    if low in CANON_GENRES:
-        return low
-    key = t.replace("‌","")
-    return GENRE_MAP_FA.get(t) or GENRE_MAP_FA.get(key) or None
+# --- Genre normalization: جدول‌ها و pipeline در genres.py ---
+_norm_genre = canonical_genre
+infer_genre_from_url = genre_from_url
 
 def now_iso() -> str:
     return dt.datetime.utcnow().isoformat(timespec="seconds")
@@ -218,9 +285,11 @@ def _call_adapter(mod, name: str, *args, **kwargs):
         # فرض: parserها sync هستند. اگر async بود، صرف‌نظر می‌کنیم (برای fetch_reviews مسیر async جدا داریم).
         if asyncio.iscoroutinefunction(fn):
             return None
-        return fn(*args, **kwargs)
+        with timed(EXTRACT_SECONDS, extractor=f"adapter.{mod.__name__.rsplit('.', 1)[-1]}.{name}"):
+            return fn(*args, **kwargs)
     except Exception as e:
         print(f"[ADAPTER] {name} error:", e)
+        count_error(_store_from_url(args[0]) if args else "unknown", "adapter", e)
         return None
 
 def enrich_with_adapter(url: str, html: str, base_fields: Dict) -> Dict:
@@ -268,26 +337,6 @@ def is_relevant_list_url(url: str) -> bool:
     if "/video/" in url: return False
     return any(p in url for p in LIST_HINTS)
 
-def infer_genre_from_url(u: str) -> Optional[str]:
-    u = u.lower()
-    if "cafebazaar.ir/cat/" in u:
-        slug = u.split("cafebazaar.ir/cat/")[-1].split("?")[0].split("/")[0]
-        mapping = {
-            "strategy":"strategy","action":"action","arcade":"arcade","casual":"casual",
-            "racing":"racing","simulation":"simulation","word-trivia":"word_trivia",
-            "kids-games":"kids","puzzle":"puzzle","sports-game":"sports"
-        }
-        return mapping.get(slug, slug or None)
-    if "myket.ir/games/" in u:
-        slug = u.split("myket.ir/games/")[-1].split("?")[0].split("/")[0]
-        mapping = {
-            "action":"action","adventure":"adventure","casual":"casual","kids":"kids",
-            "puzzle":"puzzle","racing":"racing","simulation":"simulation","sports":"sports",
-            "strategy":"strategy","word":"word"
-        }
-        return mapping.get(slug, slug or None)
-    return None
-
 def extract_links(base_url: str, html: str) -> Tuple[List[Tuple[str, Optional[str]]], List[str]]:
     doc = parse_html(html)
     app_links: List[Tuple[str, Optional[str]]] = []
@@ -447,30 +496,53 @@ async def extract_reviews_extended(url: str, app_id: str, html: str, limit: int,
 
     return reviews[:limit]
 
-def bulk_index_reviews(app_url: str, app_title: str, app_id: str, store: str, reviews: List[Dict]) -> int:
-    if not reviews: return 0
+def existing_review_indices(ids: List[str]) -> Dict[str, str]:
+    """_id → ایندکس واقعی برای ریویوهایی که قبلاً (شاید قبل از rollover) ایندکس شده‌اند."""
+    if not ids: return {}
+    try:
+        with timed(ES_SECONDS, op="search", index=ES_REVIEWS_INDEX):
+            res = es.search(index=ES_REVIEWS_INDEX, query={"ids": {"values": ids}}, size=len(ids),
+                            source=False, track_total_hits=False)
+    except Exception as e:
+        print(f"[ES] WARN review lookup: {e}")
+        return {}
+    return {h["_id"]: h["_index"] for h in res.get("hits", {}).get("hits", [])}
+
+def review_actions(app_url: str, app_title: str, app_id: str, store: str, reviews: List[Dict]) -> List[Dict]:
     ts = now_iso()
+    rids = [_make_review_id(store, app_id, r) for r in reviews]
+    # update روی alias فقط به write index می‌رود؛ ریویوی موجود در ایندکس قدیمی‌تر همان‌جا به‌روز می‌شود
+    # (وگرنه بعد از هر rollover تکراری می‌شد) و indexed_at آن دست نمی‌خورد تا ایندکس‌های قدیمی از
+    # جستجوهای بازه‌ی اخیر کنار گذاشته شوند (و trends آن را ریویوی جدید حساب نکند)
+    known = existing_review_indices(list(dict.fromkeys(rids)))
     actions = []
-    for r in reviews:
+    for r, rid in zip(reviews, rids):
         doc = {
             "store": store, "app_id": app_id, "app_title": app_title,
             "author": r.get("author"), "rating": r.get("rating"),
             "title": r.get("title"), "body": r.get("body"),
-            "created_at": r.get("created_at"), "indexed_at": ts,
+            "created_at": r.get("created_at"),
             "source_url": app_url,
         }
-        rid = _make_review_id(store, app_id, r)
+        if rid not in known: doc["indexed_at"] = ts
         actions.append({
-            "_op_type": "update", "_index": ES_REVIEWS_INDEX, "_id": rid,
+            "_op_type": "update", "_index": known.get(rid, ES_REVIEWS_INDEX), "_id": rid,
             "doc": doc, "doc_as_upsert": True,
         })
-    ok, _ = helpers.bulk(es, actions, raise_on_error=False, request_timeout=60)
+    return actions
+
+def bulk_index_reviews(app_url: str, app_title: str, app_id: str, store: str, reviews: List[Dict]) -> int:
+    if not reviews: return 0
+    actions = review_actions(app_url, app_title, app_id, store, reviews)
+    with timed(ES_SECONDS, op="bulk", index=ES_REVIEWS_INDEX):
+        ok, _ = helpers.bulk(es, actions, raise_on_error=False, request_timeout=60)
+    REVIEWS_TOTAL.labels(store=store).inc(ok or 0)
     return ok or 0
 
-# ==================== Assets (icons & screenshots) ====================
+# ==================== Assets (icons, screenshots & videos) ====================
 def extract_image_urls(base_url: str, html: str) -> Dict[str, List[str]]:
     doc = parse_html(html)
-    out = {"icon": [], "screenshots": []}
+    out = {"icon": [], "screenshots": [], "videos": []}
 
     og = doc.css_first('meta[property="og:image"]')
     if og and og.attributes.get("content"):
@@ -488,21 +560,29 @@ def extract_image_urls(base_url: str, html: str) -> Dict[str, List[str]]:
             if "/video/" in u: continue
             out["screenshots"].append(u)
 
+    # ویدیوها (همان الگوی VIDEO_RE در adapterها: <video src> / <source src>)
+    for n in doc.css('video[src], video source[src]'):
+        src = (n.attributes.get("src") or "").strip()
+        if src: out["videos"].append(normalize_url(base_url, src))
+
     out["icon"] = list(dict.fromkeys(out["icon"]))
     out["screenshots"] = [u for i,u in enumerate(out["screenshots"]) if u not in out["screenshots"][:i]]
+    out["videos"] = list(dict.fromkeys(out["videos"]))[:5]
     return out
 
 def _asset_id(store: str, app_id: str, typ: str, url: str) -> str:
     return f"{store}::{app_id}::{typ}::{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}"
 
-def bulk_index_assets(app_url: str, app_title: str, app_id: str, store: str, assets: Dict[str, List[str]]) -> int:
+ASSET_TYPES = {"icon": "icon", "screenshots": "screenshot", "videos": "video"}
+
+def asset_actions(app_url: str, app_title: str, app_id: str, store: str, assets: Dict[str, List[str]]) -> List[Dict]:
     ts = now_iso()
     actions = []
     for typ, urls in assets.items():
         for u in urls:
             doc = {
                 "store": store, "app_id": app_id, "app_title": app_title,
-                "type": "icon" if typ == "icon" else "screenshot",
+                "type": ASSET_TYPES.get(typ, "screenshot"),
                 "url": u, "indexed_at": ts, "source_url": app_url,
             }
             actions.append({
@@ -510,9 +590,50 @@ def bulk_index_assets(app_url: str, app_title: str, app_id: str, store: str, ass
                 "_id": _asset_id(store, app_id, doc["type"], u),
                 "doc": doc, "doc_as_upsert": True,
             })
-    if not actions: return 0
-    ok, _ = helpers.bulk(es, actions, raise_on_error=False, request_timeout=60)
-    return ok or 0
+    return actions
+
+def asset_counts_action(app_url: str, assets: Dict[str, List[str]]) -> Dict:
+    """شمارش رسانه‌های همین صفحه روی سند بازی (جایگزین پاس composite روی کل assets در miner)."""
+    shots = len(assets.get("screenshots") or [])
+    doc = {
+        "assets_icon_count": len(assets.get("icon") or []),
+        "assets_screenshot_count": shots,
+        "screenshot_count": shots,
+        "video_count": len(assets.get("videos") or []),
+        "assets_counted_at": now_iso(),
+    }
+    return {"_op_type": "update", "_index": ES_INDEX, "_id": _doc_id(app_url), "doc": doc}
+
+def prune_stale_assets(store: str, app_id: str, keep_ids: List[str]) -> int:
+    """
+    assetهایی از این اپ که دیگر در صفحه نیستند حذف می‌شوند؛ ایندکس assets همیشه همان رسانه‌های آخرین خزش است
+    و شمارش miner reconcile با asset_counts_action یکی می‌ماند.
+    """
+    query = {"bool": {
+        "filter": [{"term": {"store": store}}, {"term": {"app_id": app_id}}],
+        "must_not": [{"ids": {"values": keep_ids}}] if keep_ids else [],
+    }}
+    try:
+        with timed(ES_SECONDS, op="delete_by_query", index=ES_ASSETS_INDEX):
+            resp = es.delete_by_query(index=ES_ASSETS_INDEX, query=query, conflicts="proceed", request_timeout=60)
+    except Exception as e:
+        print(f"[IDX] WARN prune stale assets {store}::{app_id}: {e}")
+        return 0
+    return int(resp.get("deleted") or 0)
+
+def bulk_index_assets(app_url: str, app_title: str, app_id: str, store: str, assets: Dict[str, List[str]]) -> int:
+    # شمارش‌ها در همان درخواست bulk نوشته می‌شوند (حتی وقتی صفحه هیچ رسانه‌ای ندارد)
+    actions = asset_actions(app_url, app_title, app_id, store, assets)
+    prune_stale_assets(store, app_id, [a["_id"] for a in actions])
+    actions.append(asset_counts_action(app_url, assets))
+    with timed(ES_SECONDS, op="bulk", index=ES_ASSETS_INDEX):
+        ok, errors = helpers.bulk(es, actions, raise_on_error=False, request_timeout=60)
+    counts_failed = any((e.get("update") or {}).get("_index") == ES_INDEX for e in errors or [])
+    if counts_failed:
+        print(f"[IDX] WARN asset counts not written for {app_url} (miner reconcile will fix)")
+    n = max(0, (ok or 0) - (0 if counts_failed else 1))
+    ASSETS_TOTAL.labels(store=store).inc(n)
+    return n
 
 # ==================== Breadcrumb → Genre ====================
 def genre_from_breadcrumbs_myket(html: str) -> Optional[str]:
@@ -548,19 +669,44 @@ def genre_from_breadcrumbs_bazaar(html: str) -> Optional[str]:
     return None
 
 # ==================== Network ====================
+# اگر ست شود (مثلاً httpx.MockTransport در بنچمارک)، همه‌ی کلاینت‌ها از آن استفاده می‌کنند
+HTTP_TRANSPORT: Optional[httpx.AsyncBaseTransport] = None
+
+_HTTP: Optional[httpx.AsyncClient] = None
+
+def make_client() -> httpx.AsyncClient:
+    """کلاینت جدا با pool خودش (images.py، اسکریپت‌ها)؛ تنظیمات pool/HTTP2/DNS در http_pool.py"""
+    return http_pool.make_async_client(HEADERS, transport=HTTP_TRANSPORT)
+
+def shared_client() -> httpx.AsyncClient:
+    """یک کلاینت برای کل پروسه: همه‌ی workerها و spiderهای discover یک pool و سقف per-host مشترک دارند"""
+    global _HTTP
+    if _HTTP is None or _HTTP.is_closed:
+        _HTTP = make_client()
+    return _HTTP
+
+async def close_shared_client():
+    global _HTTP
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
+
 async def fetch(url: str, client: httpx.AsyncClient, retries: int = 3) -> str:
     backoff = 1.0
-    for i in range(retries + 1):
-        try:
-            r = await client.get(url)
-            if r.status_code in (429, 500, 502, 503, 504):
-                raise httpx.HTTPStatusError("busy", request=r.request, response=r)
-            r.raise_for_status()
-            return r.text
-        except Exception:
-            if i >= retries: raise
-            await asyncio.sleep(backoff)
-            backoff = min(backoff * 2, 8.0)
+    store = _store_from_url(url)
+    with timed(FETCH_SECONDS, store=store):
+        for i in range(retries + 1):
+            try:
+                r = await client.get(url)
+                if r.status_code in (429, 500, 502, 503, 504):
+                    raise httpx.HTTPStatusError("busy", request=r.request, response=r)
+                r.raise_for_status()
+                return r.text
+            except Exception:
+                if i >= retries: raise
+                RETRIES_TOTAL.labels(store=store).inc()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 8.0)
 
 # ==================== Indexing ====================
 def _store_from_url(u: str) -> str:
@@ -574,47 +720,85 @@ def _app_id_from_url(u: str) -> Optional[str]:
 def _doc_id(u: str) -> str:
     return f"{_store_from_url(u)}::{_app_id_from_url(u) or 'unknown'}"
 
-async def index_app(url: str, html: str, client: httpx.AsyncClient,  # ⬅️ client اضافه شد
-                    genre_hint: Optional[str] = None, source_list: Optional[str] = None) -> bool:
-    fields = extract_fields_basic(html)
+def build_game_doc(url: str, html: str, genre_hint: Optional[str] = None,
+                   source_list: Optional[str] = None) -> Optional[Dict]:
+    """استخراج کامل سند بازی از HTML (بدون شبکه/ES)؛ برای صفحه‌ی خطا None برمی‌گرداند."""
+    with timed(EXTRACT_SECONDS, extractor="extract_fields_basic"):
+        fields = extract_fields_basic(html)
     if "خطا" in (fields.get("title") or ""):
-        print(f"[IDX] WARN skip error page: {url}")
-        return False
+        return None
 
     fields = enrich_with_adapter(url, html, fields)
 
     # genre enrichment/fallback
     if (not fields.get("genre")) or (fields.get("genre") in {"unknown", "GameApplication"}):
         g = None
-        if "myket.ir" in url: g = genre_from_breadcrumbs_myket(html)
-        elif "cafebazaar.ir" in url: g = genre_from_breadcrumbs_bazaar(html)
-        if not g and genre_hint: g = _norm_genre(genre_hint)
-        if not g: g = _norm_genre(infer_genre_from_url(url))
+        with timed(EXTRACT_SECONDS, extractor="genre_fallback"):
+            if "myket.ir" in url: g = genre_from_breadcrumbs_myket(html)
+            elif "cafebazaar.ir" in url: g = genre_from_breadcrumbs_bazaar(html)
+            if not g and genre_hint: g = _norm_genre(genre_hint)
+            if not g: g = _norm_genre(infer_genre_from_url(url))
         if g: fields["genre"] = g
 
     doc = to_game_doc(url, fields)
     if source_list: doc["source_list_url"] = source_list
+    # update API از ingest pipeline رد نمی‌شود؛ همان نرمال‌سازی GENRE_PIPELINE همین‌جا
+    normalize_doc(doc)
+    doc["content_hash"] = content_hash(doc)
+    return doc
+
+CONTENT_HASH_FIELDS = ("title", "description", "genre", "rating", "ratings_count", "installs", "developer", "updated_at")
+
+def content_hash(doc: Dict) -> str:
+    base = json.dumps({k: doc.get(k) for k in CONTENT_HASH_FIELDS}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()[:20]
+
+async def emit_app_indexed(doc: Dict):
+    if not EVENTS_STREAM: return
+    event = {"store": doc["store"], "app_id": doc["app_id"], "doc_id": _doc_id(doc["source_url"]),
+             "content_hash": doc.get("content_hash") or "", "indexed_at": doc.get("indexed_at") or now_iso()}
+    # مقادیر لحظه‌ای برای تاریخچه‌ی اسنپ‌شات (services/worker/snapshots.py)
+    for k in ("rating", "ratings_count", "installs", "genre"):
+        if doc.get(k) is not None: event[k] = str(doc[k])
+    try:
+        await redis_op("xadd", rds.xadd(EVENTS_STREAM, event, maxlen=EVENTS_MAXLEN, approximate=True))
+    except Exception as e:
+        print(f"[EVT] WARN xadd {doc.get('source_url')}: {e}")
+        count_error(doc["store"], "events", e)
+
+async def index_app(url: str, html: str, client: httpx.AsyncClient,  # ⬅️ client اضافه شد
+                    genre_hint: Optional[str] = None, source_list: Optional[str] = None) -> bool:
+    store = _store_from_url(url)
+    with timed(PARSE_SECONDS, store=store, page="app"):
+        doc = build_game_doc(url, html, genre_hint=genre_hint, source_list=source_list)
+    if doc is None:
+        print(f"[IDX] WARN skip error page: {url}")
+        return False
 
     # Upsert game
     body = {"doc": doc, "doc_as_upsert": True}
     try:
-        es.update(index=ES_INDEX, id=_doc_id(url), body=body)
+        with timed(ES_SECONDS, op="update", index=ES_INDEX):
+            es.update(index=ES_INDEX, id=_doc_id(url), body=body)
     except Exception:
         try:
-            es.index(index=ES_INDEX, id=_doc_id(url), document=doc)
+            with timed(ES_SECONDS, op="index", index=ES_INDEX):
+                es.index(index=ES_INDEX, id=_doc_id(url), document=doc, pipeline=GENRE_PIPELINE)
         except Exception as e2:
             print("[ES] index error:", e2)
+            count_error(store, "es_index", e2)
             return False
 
     # reviews (HTML + optional AJAX via adapter) – استفاده از همان client
     if ENABLE_REVIEWS:
         try:
             app_id = _app_id_from_url(url) or doc["app_id"]
-            store  = _store_from_url(url)
-            reviews_html = extract_reviews_for_page(url, html, REVIEWS_PER_APP)
+            with timed(EXTRACT_SECONDS, extractor="reviews_html"):
+                reviews_html = extract_reviews_for_page(url, html, REVIEWS_PER_APP)
             extra_cnt = 0
             if len(reviews_html) < REVIEWS_PER_APP and ENABLE_AJAX_REVIEWS:
-                reviews_all = await extract_reviews_extended(url, app_id, html, REVIEWS_PER_APP, client)
+                with timed(EXTRACT_SECONDS, extractor="reviews_extended"):
+                    reviews_all = await extract_reviews_extended(url, app_id, html, REVIEWS_PER_APP, client)
                 extra_cnt = max(0, len(reviews_all) - len(reviews_html))
             else:
                 reviews_all = reviews_html
@@ -624,16 +808,21 @@ async def index_app(url: str, html: str, client: httpx.AsyncClient,  # ⬅️ cl
                 print(f"[IDX] Reviews indexed: {n_ok} for {url} (ajax:{extra_cnt})")
         except Exception as e:
             print(f"[IDX] WARN reviews for {url}: {e}")
+            count_error(store, "reviews", e)
 
-    # assets (icons & screenshots)
+    # assets (icons, screenshots & videos) + شمارش‌ها روی سند بازی
     try:
-        imgs = extract_image_urls(url, html)
+        with timed(EXTRACT_SECONDS, extractor="extract_image_urls"):
+            imgs = extract_image_urls(url, html)
         n_assets = bulk_index_assets(url, doc["title"], doc["app_id"], doc["store"], imgs)
         if n_assets:
-            print(f"[IDX] Assets indexed: {n_assets} for {url} (icon:{len(imgs.get('icon',[]))} shots:{len(imgs.get('screenshots',[]))})")
+            print(f"[IDX] Assets indexed: {n_assets} for {url} (icon:{len(imgs.get('icon',[]))} shots:{len(imgs.get('screenshots',[]))} videos:{len(imgs.get('videos',[]))})")
     except Exception as e:
         print(f"[IDX] WARN assets for {url}: {e}")
+        count_error(store, "assets", e)
 
+    await emit_app_indexed(doc)
+    APPS_TOTAL.labels(store=store).inc()
     return True
 
 # ==================== Frontier (Redis) ====================
@@ -642,86 +831,115 @@ async def ensure_indices_once():
         if not es.indices.exists(index=ES_INDEX):
             es.indices.create(index=ES_INDEX)
         if ENABLE_REVIEWS and not es.indices.exists(index=ES_REVIEWS_INDEX):
-            es.indices.create(index=ES_REVIEWS_INDEX)
+            # معمولاً es-init ساخته است؛ نام date-math تا rollover ماه را در نام بگذارد (template: reviews-*)
+            es.indices.create(index=f"<{ES_REVIEWS_INDEX}-{{now/M{{yyyy.MM}}}}-000001>",
+                              aliases={ES_REVIEWS_INDEX: {"is_write_index": True}})
         if ES_ASSETS_INDEX and not es.indices.exists(index=ES_ASSETS_INDEX):
             try: es.indices.create(index=ES_ASSETS_INDEX)
             except Exception: pass
+        ensure_pipeline(es)
     except Exception as e:
         print("[ES] ensure index warn:", e)
 
-async def frontier_init(seed_urls: List[str]):
+async def frontier_init(seed_urls: List[str]) -> bool:
+    """seedها را فقط اگر صف خالی باشد وارد می‌کند؛ True یعنی شروع تازه (نه ادامه‌ی صف قبلی)."""
     await ensure_indices_once()
-    q_len = await rds.llen(FRONTIER_KEY)
+    q_len = await redis_op("llen", rds.llen(FRONTIER_KEY))
     if q_len == 0 and seed_urls:
         payloads = [json.dumps({"url": u, "genre_hint": infer_genre_from_url(u), "source_list": ""}) for u in seed_urls]
-        if payloads: await rds.rpush(FRONTIER_KEY, *payloads)
+        if payloads: await redis_op("rpush", rds.rpush(FRONTIER_KEY, *payloads))
+    return q_len == 0
 
 async def enqueue(url: str, front: bool = False, genre_hint: Optional[str] = None, source_list: Optional[str] = None):
-    added = await rds.sadd(SEEN_KEY, url)
+    added = await redis_op("sadd", rds.sadd(SEEN_KEY, url))
     if added == 1:
         payload = json.dumps({"url": url, "genre_hint": genre_hint, "source_list": source_list or ""})
-        if front: await rds.lpush(FRONTIER_KEY, payload)
-        else:     await rds.rpush(FRONTIER_KEY, payload)
+        if front: await redis_op("lpush", rds.lpush(FRONTIER_KEY, payload))
+        else:     await redis_op("rpush", rds.rpush(FRONTIER_KEY, payload))
 
 async def worker(name: str):
-    pages_cnt = int((await rds.get(PAGES_COUNT)) or 0)
-    apps_cnt  = int((await rds.get(APPS_COUNT)) or 0)
+    pages_cnt = int((await redis_op("get", rds.get(PAGES_COUNT))) or 0)
+    apps_cnt  = int((await redis_op("get", rds.get(APPS_COUNT))) or 0)
 
-    try:
-        client = httpx.AsyncClient(headers=HEADERS, follow_redirects=True, timeout=30, http2=HTTP2_ENABLED)
-    except Exception:
-        client = httpx.AsyncClient(headers=HEADERS, follow_redirects=True, timeout=30, http2=False)
+    client = shared_client()
 
-    async with client:
-        while True:
-            if MAX_APPS > 0 and apps_cnt >= MAX_APPS:  break
-            if MAX_PAGES > 0 and pages_cnt >= MAX_PAGES:  break
+    while True:
+        if MAX_APPS > 0 and apps_cnt >= MAX_APPS:  break
+        if MAX_PAGES > 0 and pages_cnt >= MAX_PAGES:  break
 
-            raw = await rds.lpop(FRONTIER_KEY)
-            if not raw:
-                await asyncio.sleep(0.4); continue
+        raw = await redis_op("lpop", rds.lpop(FRONTIER_KEY))
+        if not raw:
+            await asyncio.sleep(0.4); continue
 
-            url = raw; genre_hint = None; source_list = None
-            try:
-                obj = json.loads(raw)
-                if isinstance(obj, dict) and "url" in obj:
-                    url = obj["url"]; genre_hint = obj.get("genre_hint"); source_list = obj.get("source_list")
-            except Exception:
-                pass
+        url = raw; genre_hint = None; source_list = None
+        try:
+            obj = json.loads(raw)
+            if isinstance(obj, dict) and "url" in obj:
+                url = obj["url"]; genre_hint = obj.get("genre_hint"); source_list = obj.get("source_list")
+        except Exception:
+            pass
 
-            try:
-                html = await fetch(url, client)
-            except Exception as e:
-                print(f"[{name}] ERROR fetch {url}: {e}")
-                await asyncio.sleep(DELAY_SEC)
-                continue
+        try:
+            html = await fetch(url, client)
+        except Exception as e:
+            print(f"[{name}] ERROR fetch {url}: {e}")
+            count_error(_store_from_url(url), "fetch", e)
+            await asyncio.sleep(DELAY_SEC)
+            continue
 
-            if is_app_url(url):
-                ok = await index_app(url, html, client, genre_hint=genre_hint, source_list=source_list)  # ⬅️ client
-                if ok:
-                    apps_cnt += 1
-                    await rds.set(APPS_COUNT, apps_cnt)
-                    print(f"[{name}] Indexed app ({apps_cnt}/{MAX_APPS}): {url}")
-            else:
+        if is_app_url(url):
+            if ARCHIVE is not None:
+                try: ARCHIVE.append(url, html, _doc_id(url), genre_hint=genre_hint, source_list=source_list)
+                except Exception as e: print(f"[{name}] WARN archive {url}: {e}")
+            ok = await index_app(url, html, client, genre_hint=genre_hint, source_list=source_list)  # ⬅️ client
+            if ok:
+                apps_cnt += 1
+                await redis_op("set", rds.set(APPS_COUNT, apps_cnt))
+                print(f"[{name}] Indexed app ({apps_cnt}/{MAX_APPS}): {url}")
+        else:
+            with timed(PARSE_SECONDS, store=_store_from_url(url), page="list"):
                 app_links, list_links = extract_links(url, html)
-                for link, gh in app_links:
-                    await enqueue(link, front=True, genre_hint=(gh or infer_genre_from_url(url)), source_list=url)
-                for link in list_links:
-                    await enqueue(link, front=False)
-                pages_cnt += 1
-                await rds.set(PAGES_COUNT, pages_cnt)
-                print(f"[{name}] Scanned page ({pages_cnt}/{MAX_PAGES}): {url}  +apps:{len(app_links)} +lists:{len(list_links)}")
+            for link, gh in app_links:
+                await enqueue(link, front=True, genre_hint=(gh or infer_genre_from_url(url)), source_list=url)
+            for link in list_links:
+                await enqueue(link, front=False)
+            pages_cnt += 1
+            PAGES_TOTAL.labels(store=_store_from_url(url)).inc()
+            await redis_op("set", rds.set(PAGES_COUNT, pages_cnt))
+            print(f"[{name}] Scanned page ({pages_cnt}/{MAX_PAGES}): {url}  +apps:{len(app_links)} +lists:{len(list_links)}")
 
-            await asyncio.sleep(DELAY_SEC)
+        await asyncio.sleep(DELAY_SEC)
 
 # ==================== Bootstrap (auto-discover) ====================
-def discover_myket(games_root: str, limit_lists: int) -> List[str]:
-    from spiders.myket_discover import discover_from_games_root
-    return discover_from_games_root(games_root, limit_lists)
+async def push_seed(url: str, fresh: bool):
+    # شروع تازه: مثل frontier_init مستقیم به صف؛ ادامه‌ی صف قبلی: فقط اگر قبلاً دیده نشده
+    if fresh:
+        payload = json.dumps({"url": url, "genre_hint": infer_genre_from_url(url), "source_list": ""})
+        await redis_op("rpush", rds.rpush(FRONTIER_KEY, payload))
+        await redis_op("sadd", rds.sadd(SEEN_KEY, url))
+    else:
+        await enqueue(url, front=False, genre_hint=infer_genre_from_url(url))
+
+async def discover_into_frontier(store: str, root: str, limit_lists: int, fresh: bool) -> int:
+    """اسپایدر async را اجرا می‌کند و هر لیست کشف‌شده را همان لحظه وارد frontier می‌کند."""
+    if store == "myket":
+        from spiders.myket_discover import discover_from_games_root_async as discover
+    else:
+        from spiders.bazaar_discover import discover_from_bazaar_root_async as discover
+    print(f"[BOOT] {store} auto-discover from {root} (limit={limit_lists}, concurrency={DISCOVER_CONCURRENCY})")
+
+    async def on_list(u: str):
+        await push_seed(u, fresh)
 
-def discover_bazaar(root: str, limit_lists: int) -> List[str]:
-    from spiders.bazaar_discover import discover_from_bazaar_root
-    return discover_from_bazaar_root(root, limit_lists)
+    try:
+        found = await discover(root, limit_lists, concurrency=DISCOVER_CONCURRENCY, on_list=on_list,
+                               client=shared_client())
+    except Exception as e:
+        print(f"[BOOT] {store} discover error:", e); found = []
+    if not found:
+        await push_seed(root, fresh)
+    print(f"[BOOT] discovered {len(found)} {store} list pages")
+    return len(found)
 
 async def bootstrap_urls() -> List[str]:
     urls: List[str] = []
@@ -739,25 +957,7 @@ async def bootstrap_urls() -> List[str]:
     if START_URLS:
         urls += START_URLS
 
-    if MYKET_AUTO_DISCOVER:
-        print(f"[BOOT] Myket auto-discover from {MYKET_GAMES_ROOT} (limit={MYKET_MAX_LISTS})")
-        try:
-            u = discover_myket(MYKET_GAMES_ROOT, MYKET_MAX_LISTS)
-            if not u: u = [MYKET_GAMES_ROOT]
-            print(f"[BOOT] discovered {len(u)} myket list pages")
-            urls += u
-        except Exception as e:
-            print("[BOOT] myket discover error:", e); urls += [MYKET_GAMES_ROOT]
-
-    if BAZAAR_AUTO_DISCOVER:
-        print(f"[BOOT] Bazaar auto-discover from {BAZAAR_ROOT} (limit={BAZAAR_MAX_LISTS})")
-        try:
-            b = discover_bazaar(BAZAAR_ROOT, BAZAAR_MAX_LISTS)
-            if not b: b = [BAZAAR_ROOT]
-            print(f"[BOOT] discovered {len(b)} bazaar list pages")
-            urls += b
-        except Exception as e:
-            print("[BOOT] bazaar discover error:", e); urls += [BAZAAR_ROOT]
+    # auto-discover جدا و هم‌زمان با workerها اجرا می‌شود (discover_into_frontier)
 
     deduped: List[str] = []
     seen = set()
@@ -768,22 +968,41 @@ async def bootstrap_urls() -> List[str]:
 
 # ==================== Main ====================
 async def main():
-    global rds
+    global rds, ARCHIVE
     rds = Redis.from_url(REDIS_URL, decode_responses=True)
+    start_metrics_server()
+    if ARCHIVE_DIR:
+        from archive import PageArchive
+        ARCHIVE = PageArchive(ARCHIVE_DIR)
+        print(f"[BOOT] archiving app pages to {ARCHIVE_DIR}")
     try:
         seeds = await bootstrap_urls()
-        if not seeds:
+        if not seeds and not (MYKET_AUTO_DISCOVER or BAZAAR_AUTO_DISCOVER):
             print("No seeds provided (SCRAPE_START_URLS or SCRAPE_URLS_FILE or auto-discover).")
             return
 
-        await frontier_init(seeds)
+        fresh = await frontier_init(seeds)
         if seeds:
             await rds.sadd(SEEN_KEY, *seeds)
 
-        tasks = [asyncio.create_task(worker(f"W{i+1}")) for i in range(CONCURRENCY)]
-        await asyncio.gather(*tasks, return_exceptions=True)
+        discover_tasks = []
+        if MYKET_AUTO_DISCOVER:
+            discover_tasks.append(asyncio.create_task(discover_into_frontier("myket", MYKET_GAMES_ROOT, MYKET_MAX_LISTS, fresh)))
+        if BAZAAR_AUTO_DISCOVER:
+            discover_tasks.append(asyncio.create_task(discover_into_frontier("bazaar", BAZAAR_ROOT, BAZAAR_MAX_LISTS, fresh)))
+
+        depth_task = asyncio.create_task(frontier_depth_loop())
+        indices = [i for i in (ES_INDEX, ES_ASSETS_INDEX, ES_REVIEWS_INDEX if ENABLE_REVIEWS else "") if i]
+        with (BulkSession(es, indices, name="crawl") if BULK_SESSION else nullcontext()):
+            tasks = [asyncio.create_task(worker(f"W{i+1}")) for i in range(CONCURRENCY)]
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for t in discover_tasks: t.cancel()
+        await asyncio.gather(*discover_tasks, return_exceptions=True)
+        depth_task.cancel()
         print("✅ Done.")
     finally:
+        if ARCHIVE is not None: ARCHIVE.close()
+        await close_shared_client()
         try: await rds.aclose()
         except Exception: pass
 
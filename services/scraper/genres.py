@@ -0,0 +1,158 @@
+# ./services/scraper/genres.py
+"""
+نرمال‌سازی ژانر — تنها منبع جدول‌ها.
+
+همین جدول‌ها دو جا استفاده می‌شوند و الگوریتم هر دو یکی است:
+  - پایتون (crawler.build_game_doc و reprocess): normalize_doc
+  - ingest pipeline الاستیک (GENRE_PIPELINE) که از pipeline_body() با یک اسکریپت Painless ساخته می‌شود؛
+    scripts/backfill_genre.py و مسیر index کامل crawler از آن عبور می‌کنند.
+
+ترتیب: ژانر فعلی اگر canonical یا فارسیِ شناخته‌شده باشد → slug؛ اگر خالی/unknown باشد → slug آدرس
+لیست (source_list_url) و بعد آدرس خود اپ (source_url)؛ در غیر این صورت همان مقدار قبلی می‌ماند.
+"""
+import os, re
+from typing import Any, Dict, Optional
+
+GENRE_PIPELINE = os.getenv("GENRE_PIPELINE", "games-genre")
+PIPELINE_VERSION = 1
+
+GENRE_MAP_FA = {
+    "اکشن": "action","ماجراجویی": "adventure","تفننی": "casual","رانندگی": "racing",
+    "مسابقه‌ای": "racing","مسابقه اي": "racing","مسابقه ايی": "racing","پازل": "puzzle",
+    "معمایی": "puzzle","شبیه‌سازی": "simulation","شبیه سازی": "simulation","ورزشی": "sports",
+    "کلمات": "word","کودکانه": "kids","آرکید": "arcade","استراتژی": "strategy",
+    "شوتر": "action","تیراندازی": "action","رانندگي": "racing","هيجاني": "action",
+}
+CANON_GENRES = {"action","adventure","casual","racing","puzzle","simulation","sports","word","kids","arcade","strategy"}
+
+# مقدارهایی که یعنی «ژانر نداریم» (JSON-LD گاهی applicationCategory=GameApplication می‌دهد)
+UNKNOWN_GENRES = {"", "unknown", "gameapplication"}
+
+# الگوی آدرس لیست → (slug → ژانر)؛ slug ناشناخته خودش برگردانده می‌شود
+URL_SLUGS: Dict[str, Dict[str, str]] = {
+    "cafebazaar.ir/cat/": {
+        "strategy":"strategy","action":"action","arcade":"arcade","casual":"casual",
+        "racing":"racing","simulation":"simulation","word-trivia":"word_trivia",
+        "kids-games":"kids","puzzle":"puzzle","sports-game":"sports","board":"board",
+    },
+    "myket.ir/games/": {
+        "action":"action","adventure":"adventure","casual":"casual","kids":"kids",
+        "puzzle":"puzzle","racing":"racing","simulation":"simulation","sports":"sports",
+        "strategy":"strategy","word":"word","board":"board",
+    },
+}
+URL_FIELDS = ("source_list_url", "source_url")
+
+ZWNJ = "‌"
+
+# ==================== Python ====================
+def canonical_genre(txt: Optional[str]) -> Optional[str]:
+    if not txt: return None
+    t = re.sub(r"\s+", " ", str(txt)).strip().strip("/").strip()
+    low = t.lower()
+    if low in CANON_GENRES:
+        return low
+    return GENRE_MAP_FA.get(t) or GENRE_MAP_FA.get(t.replace(ZWNJ, "")) or None
+
+def genre_from_url(u: Optional[str]) -> Optional[str]:
+    if not u: return None
+    u = str(u).lower()
+    for marker, mapping in URL_SLUGS.items():
+        i = u.find(marker)
+        if i < 0: continue
+        slug = re.split(r"[/?#]", u[i + len(marker):], maxsplit=1)[0]
+        return mapping.get(slug, slug) if slug else None
+    return None
+
+def normalize_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """همان کاری که pipeline روی سند می‌کند (درجا)"""
+    g = doc.get("genre")
+    c = canonical_genre(g)
+    if c:
+        doc["genre"] = c
+        return doc
+    if g is not None and str(g).strip().lower() not in UNKNOWN_GENRES:
+        return doc
+    for f in URL_FIELDS:
+        s = genre_from_url(doc.get(f))
+        if s:
+            doc["genre"] = s
+            return doc
+    doc["genre"] = "unknown"
+    return doc
+
+# ==================== Ingest pipeline ====================
+# فقط با متدهای String (بدون regex تا به script.painless.regex.enabled وابسته نباشد)
+_PAINLESS = """
+String norm(def v) {
+  if (v == null) return '';
+  String t = v.toString();
+  while (t.contains('  ')) { t = t.replace('  ', ' '); }
+  t = t.trim();
+  while (t.startsWith('/')) { t = t.substring(1); }
+  while (t.endsWith('/')) { t = t.substring(0, t.length() - 1); }
+  return t.trim();
+}
+String slug(def v, Map slugs) {
+  if (v == null) return null;
+  String u = v.toString().toLowerCase();
+  for (def e : slugs.entrySet()) {
+    int i = u.indexOf(e.getKey());
+    if (i < 0) continue;
+    String s = u.substring(i + e.getKey().length());
+    for (String sep : ['/', '?', '#']) {
+      int j = s.indexOf(sep);
+      if (j >= 0) s = s.substring(0, j);
+    }
+    if (s.isEmpty()) return null;
+    def m = e.getValue().get(s);
+    return m == null ? s : m;
+  }
+  return null;
+}
+String t = norm(ctx.genre);
+String low = t.toLowerCase();
+if (params.canon.contains(low)) { ctx.genre = low; return; }
+def fa = params.fa.get(t);
+if (fa == null) fa = params.fa.get(t.replace(params.zwnj, ''));
+if (fa != null) { ctx.genre = fa; return; }
+if (ctx.genre != null && !params.unknown.contains(ctx.genre.toString().trim().toLowerCase())) return;
+for (String f : params.url_fields) {
+  String s = slug(ctx[f], params.slugs);
+  if (s != null) { ctx.genre = s; return; }
+}
+ctx.genre = 'unknown';
+"""
+
+def pipeline_body() -> Dict[str, Any]:
+    return {
+        "description": "genre normalization generated from services/scraper/genres.py",
+        "version": PIPELINE_VERSION,
+        "processors": [{
+            "script": {
+                "lang": "painless",
+                "source": _PAINLESS,
+                "params": {
+                    "fa": GENRE_MAP_FA,
+                    "canon": sorted(CANON_GENRES),
+                    "unknown": sorted(UNKNOWN_GENRES),
+                    "slugs": URL_SLUGS,
+                    "url_fields": list(URL_FIELDS),
+                    "zwnj": ZWNJ,
+                },
+            }
+        }],
+    }
+
+def ensure_pipeline(es, name: str = GENRE_PIPELINE) -> bool:
+    """pipeline را وقتی نبود یا نسخه‌اش قدیمی بود می‌نویسد؛ True یعنی نوشته شد."""
+    body = pipeline_body()
+    try:
+        cur = es.ingest.get_pipeline(id=name).get(name) or {}
+    except Exception:
+        cur = {}
+    if cur.get("version") == body["version"] and cur.get("processors") == body["processors"]:
+        return False
+    es.ingest.put_pipeline(id=name, **body)
+    print(f"[GENRE] ingest pipeline {name} v{body['version']} installed")
+    return True
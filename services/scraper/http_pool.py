@@ -0,0 +1,222 @@
+# ./services/scraper/http_pool.py
+"""
+کارخانه‌ی کلاینت HTTP مشترک خزنده (crawler.make_client، spiderهای discover، images.py).
+
+- HTTP/2 با ALPN (اگر h2 نصب نباشد یا سرور پشتیبانی نکند خودکار HTTP/1.1)
+- سقف هر host: تا وقتی اتصال HTTP/1.1 است HTTP_HOST_CONNECTIONS درخواست هم‌زمان (= اتصال)، بعد از
+  دیدن HTTP/2 روی همان host تا HTTP_HOST_STREAMS استریم روی اتصال مشترک
+- keep-alive: HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE / HTTP_KEEPALIVE_SEC
+- کش DNS با TTL (DNS_CACHE_TTL ثانیه، 0 = خاموش) روی network backend همان pool
+- متریک‌های Prometheus: درخواست در جریان/در انتظار هر host، اتصال‌های pool، کش DNS
+
+crawler یک کلاینت برای کل پروسه می‌سازد (crawler.shared_client) و همه‌ی workerها و spiderها از آن استفاده می‌کنند.
+"""
+import os, time, socket, asyncio, ipaddress
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import httpcore
+
+HTTP2            = os.getenv("HTTP2", "1") == "1"
+MAX_CONNECTIONS  = int(os.getenv("HTTP_MAX_CONNECTIONS", "32"))
+MAX_KEEPALIVE    = int(os.getenv("HTTP_MAX_KEEPALIVE", "16"))
+KEEPALIVE_SEC    = float(os.getenv("HTTP_KEEPALIVE_SEC", "60"))
+HOST_CONNECTIONS = int(os.getenv("HTTP_HOST_CONNECTIONS", "4"))
+HOST_STREAMS     = int(os.getenv("HTTP_HOST_STREAMS", "16"))
+DNS_CACHE_TTL    = float(os.getenv("DNS_CACHE_TTL", "300"))
+TIMEOUT          = httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "30")), connect=10.0, pool=60.0)
+
+LIMITS = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                      keepalive_expiry=KEEPALIVE_SEC)
+
+# ==================== Metrics ====================
+class _NoopMetric:
+    def labels(self, *a, **kw): return self
+    def inc(self, *a, **kw): pass
+    def set(self, *a, **kw): pass
+
+try:
+    from prometheus_client import Counter, Gauge
+    HOST_INFLIGHT  = Gauge("http_pool_inflight", "In-flight requests per host", ["host"])
+    HOST_WAITING   = Gauge("http_pool_waiting", "Requests waiting for a per-host slot", ["host"])
+    HOST_LIMIT     = Gauge("http_pool_host_limit", "Current per-host concurrency limit", ["host"])
+    POOL_CONNS     = Gauge("http_pool_connections", "Connections in the pool", ["state"])
+    REQUESTS_TOTAL = Counter("http_pool_requests_total", "Requests by host and HTTP version", ["host", "http_version"])
+    DNS_TOTAL      = Counter("http_pool_dns_total", "DNS cache lookups", ["result"])
+except Exception:
+    HOST_INFLIGHT = HOST_WAITING = HOST_LIMIT = POOL_CONNS = REQUESTS_TOTAL = DNS_TOTAL = _NoopMetric()
+
+# ==================== DNS cache ====================
+_dns: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+class CachedDNSBackend(httpcore.AsyncNetworkBackend):
+    """network backend پیش‌فرض httpcore + کش getaddrinfo؛ SNI/Host همچنان نام اصلی است."""
+    def __init__(self, inner: httpcore.AsyncNetworkBackend, ttl: float = DNS_CACHE_TTL):
+        self._inner = inner
+        self._ttl = ttl
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        key = (host, port)
+        hit = _dns.get(key)
+        if hit and hit[0] > time.monotonic():
+            DNS_TOTAL.labels(result="hit").inc()
+            return hit[1]
+        DNS_TOTAL.labels(result="miss").inc()
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addrs = list(dict.fromkeys(info[4][0] for info in infos))
+        _dns[key] = (time.monotonic() + self._ttl, addrs)
+        return addrs
+
+    async def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None,
+                          local_address: Optional[str] = None, socket_options=None):
+        if _is_ip(host):
+            return await self._inner.connect_tcp(host, port, timeout=timeout, local_address=local_address,
+                                                 socket_options=socket_options)
+        last: Optional[BaseException] = None
+        for ip in await self._resolve(host, port):
+            try:
+                return await self._inner.connect_tcp(ip, port, timeout=timeout, local_address=local_address,
+                                                     socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout, OSError) as e:
+                last = e
+        _dns.pop((host, port), None)  # آدرس‌ها شاید عوض شده‌اند؛ دفعه‌ی بعد دوباره resolve
+        raise last or httpcore.ConnectError(f"no address for {host}")
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options=None):
+        return await self._inner.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._inner.sleep(seconds)
+
+# ==================== Per-host limits ====================
+class _HostSlots:
+    def __init__(self, host: str, limit: int):
+        self.host = host
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._cond = asyncio.Condition()
+        HOST_LIMIT.labels(host=host).set(limit)
+
+    async def acquire(self):
+        async with self._cond:
+            self.waiting += 1
+            HOST_WAITING.labels(host=self.host).set(self.waiting)
+            try:
+                await self._cond.wait_for(lambda: self.active < self.limit)
+            finally:
+                self.waiting -= 1
+                HOST_WAITING.labels(host=self.host).set(self.waiting)
+            self.active += 1
+            HOST_INFLIGHT.labels(host=self.host).set(self.active)
+
+    async def release(self):
+        async with self._cond:
+            self.active -= 1
+            HOST_INFLIGHT.labels(host=self.host).set(self.active)
+            self._cond.notify()
+
+    async def raise_limit(self, limit: int):
+        if limit <= self.limit: return
+        async with self._cond:
+            self.limit = limit
+            HOST_LIMIT.labels(host=self.host).set(limit)
+            self._cond.notify_all()
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """slot تا خوانده/بسته شدن بدنه‌ی پاسخ نگه داشته می‌شود (اتصال تا آن موقع آزاد نیست)"""
+    def __init__(self, inner: httpx.AsyncByteStream, release: Callable[[], Any]):
+        self._inner = inner
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._inner:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._inner.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                await release()
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncHTTPTransport, host_connections: int = HOST_CONNECTIONS,
+                 host_streams: int = HOST_STREAMS):
+        self._inner = inner
+        self._host_connections = host_connections
+        self._host_streams = host_streams
+        self._slots: Dict[str, _HostSlots] = {}
+
+    def _for(self, host: str) -> _HostSlots:
+        s = self._slots.get(host)
+        if s is None:
+            s = self._slots[host] = _HostSlots(host, self._host_connections)
+        return s
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        slots = self._for(request.url.host)
+        await slots.acquire()
+        try:
+            resp = await self._inner.handle_async_request(request)
+        except BaseException:
+            await slots.release()
+            raise
+        version = resp.extensions.get("http_version", b"HTTP/1.1").decode("ascii", "replace")
+        REQUESTS_TOTAL.labels(host=slots.host, http_version=version).inc()
+        if version == "HTTP/2":
+            # یک اتصال multiplex؛ سقف از «اتصال» به «استریم» می‌رود
+            await slots.raise_limit(self._host_streams)
+        self._update_pool_gauges()
+        resp.stream = _ReleasingStream(resp.stream, slots.release)
+        return resp
+
+    def _update_pool_gauges(self):
+        conns = getattr(getattr(self._inner, "_pool", None), "connections", None)
+        if conns is None: return
+        idle = sum(1 for c in conns if c.is_idle())
+        POOL_CONNS.labels(state="idle").set(idle)
+        POOL_CONNS.labels(state="active").set(len(conns) - idle)
+
+    def stats(self) -> Dict[str, Any]:
+        conns = getattr(getattr(self._inner, "_pool", None), "connections", None) or []
+        return {
+            "connections": [c.info() for c in conns],
+            "hosts": {h: {"limit": s.limit, "active": s.active, "waiting": s.waiting} for h, s in self._slots.items()},
+        }
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+# ==================== Factories ====================
+def _inner_transport() -> httpx.AsyncHTTPTransport:
+    try:
+        inner = httpx.AsyncHTTPTransport(http2=HTTP2, limits=LIMITS)
+    except ImportError:
+        # بسته‌ی h2 نصب نیست
+        inner = httpx.AsyncHTTPTransport(http2=False, limits=LIMITS)
+    pool = getattr(inner, "_pool", None)
+    if DNS_CACHE_TTL > 0 and pool is not None and hasattr(pool, "_network_backend"):
+        pool._network_backend = CachedDNSBackend(pool._network_backend)
+    return inner
+
+def make_async_client(headers: Optional[Dict[str, str]] = None,
+                      transport: Optional[httpx.AsyncBaseTransport] = None, **kw) -> httpx.AsyncClient:
+    kw = dict(headers=headers, follow_redirects=True, timeout=TIMEOUT, **kw)
+    return httpx.AsyncClient(transport=transport or PooledTransport(_inner_transport()), **kw)
+
+def make_sync_client(headers: Optional[Dict[str, str]] = None, **kw) -> httpx.Client:
+    kw = dict(headers=headers, follow_redirects=True, timeout=TIMEOUT,
+              limits=httpx.Limits(max_connections=HOST_CONNECTIONS, keepalive_expiry=KEEPALIVE_SEC), **kw)
+    try:
+        return httpx.Client(http2=HTTP2, **kw)
+    except ImportError:
+        return httpx.Client(http2=False, **kw)
@@ -0,0 +1,270 @@
+# services/scraper/images.py
+"""
+پردازش تصویر assets (آیکن/اسکرین‌شات): ابعاد، dHash/pHash و پالت رنگ غالب.
+
+- assetهای بدون phash (و بدون image_error) به ترتیب (store, app_id) خوانده و بر اساس اپ گروه می‌شوند
+- دانلود async با IMAGES_CONCURRENCY درخواست هم‌زمان و سقف حجم IMAGES_MAX_BYTES (stream، قطع در صورت عبور)
+- decode فقط در اندازه‌ی thumbnail (Image.draft برای JPEG) در پروسه‌های جدا؛ هش‌ها و k-means پالت با NumPy
+- نتیجه با bulk روی سند asset و خلاصه‌اش (palette_dominants / screenshot_style) روی سند بازی نوشته می‌شود
+
+اجرا:
+  docker compose run --rm scraper python /app/images.py
+  IMAGES_LOOP_SEC=300 python images.py    # اجرای دائمی
+"""
+import os, io, sys, time, asyncio, colorsys, pathlib, concurrent.futures as cf
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from PIL import Image
+
+BASE = pathlib.Path(__file__).parent
+sys.path.append(str(BASE))
+
+import crawler
+from crawler import es, helpers, ES_INDEX, ES_ASSETS_INDEX
+
+CONCURRENCY    = int(os.getenv("IMAGES_CONCURRENCY", "16"))
+APPS_IN_FLIGHT = int(os.getenv("IMAGES_APPS_IN_FLIGHT", "32"))
+MAX_BYTES      = int(os.getenv("IMAGES_MAX_BYTES", str(4 * 1024 * 1024)))
+DECODE_WORKERS = int(os.getenv("IMAGES_DECODE_WORKERS", str(os.cpu_count() or 2)))
+PALETTE_K      = int(os.getenv("IMAGES_PALETTE_K", "5"))
+BULK_CHUNK     = int(os.getenv("IMAGES_BULK_CHUNK", "500"))
+PAGE_SIZE      = int(os.getenv("IMAGES_PAGE_SIZE", "1000"))
+LOOP_SEC       = float(os.getenv("IMAGES_LOOP_SEC", "0"))    # 0 = یک بار اجرا
+STORE_FILTER   = os.getenv("IMAGES_STORE", "").strip()
+THUMB          = 64
+
+ASSET_MAPPING = {
+    "phash":         {"type": "keyword"},
+    "dhash":         {"type": "keyword"},
+    "palette":       {"type": "keyword"},
+    "image_bytes":   {"type": "integer"},
+    "image_error":   {"type": "keyword", "ignore_above": 256},
+    "image_at":      {"type": "date"},
+}
+
+# ==================== Hashes & palette (پروسه‌های decode) ====================
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]; i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+_DCT32 = _dct_matrix(32)
+
+def _bits_hex(bits: np.ndarray) -> str:
+    return np.packbits(bits.astype(np.uint8)).tobytes().hex()
+
+def dhash(gray: Image.Image) -> str:
+    g = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.float32)
+    return _bits_hex((g[:, 1:] > g[:, :-1]).ravel())
+
+def phash(gray: Image.Image) -> str:
+    g = np.asarray(gray.resize((32, 32), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT32 @ g @ _DCT32.T)[:8, :8].ravel()
+    return _bits_hex(low > np.median(low[1:]))
+
+def kmeans_palette(px: np.ndarray, k: int, iters: int = 8) -> List[Tuple[str, float]]:
+    """k-means ساده روی پیکسل‌های thumbnail؛ خروجی [(hex, سهم)] به ترتیب سهم."""
+    k = max(1, min(k, len(px)))
+    lum = px @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    centers = px[np.argsort(lum)[np.linspace(0, len(px) - 1, k).astype(int)]].copy()
+    for _ in range(iters):
+        lab = ((px[:, None, :] - centers[None, :, :]) ** 2).sum(-1).argmin(1)
+        for j in range(k):
+            sel = px[lab == j]
+            if len(sel): centers[j] = sel.mean(0)
+    share = np.bincount(lab, minlength=k) / float(len(px))
+    order = np.argsort(-share)
+    return [("#%02x%02x%02x" % tuple(int(v) for v in centers[j]), round(float(share[j]), 3))
+            for j in order if share[j] > 0]
+
+def analyze_image(data: bytes) -> Dict[str, Any]:
+    im = Image.open(io.BytesIO(data))
+    w, h = im.size
+    im.draft("RGB", (THUMB * 2, THUMB * 2))  # JPEG: decode مستقیم در مقیاس کوچک
+    im = im.convert("RGB")
+    im.thumbnail((THUMB, THUMB))
+    gray = im.convert("L")
+    px = np.asarray(im, dtype=np.float32).reshape(-1, 3)
+
+    mx, mn = px.max(1), px.min(1)
+    sat = np.where(mx > 0, (mx - mn) / np.maximum(mx, 1e-6), 0.0)
+    return {
+        "width": w, "height": h,
+        "phash": phash(gray), "dhash": dhash(gray),
+        "palette": kmeans_palette(px, PALETTE_K),
+        "brightness": round(float(mx.mean() / 255.0), 3),
+        "saturation": round(float(sat.mean()), 3),
+    }
+
+# ==================== Game-level summary ====================
+def color_name(hex_color: str) -> str:
+    r, g, b = (int(hex_color[i:i + 2], 16) / 255.0 for i in (1, 3, 5))
+    h, s, v = colorsys.rgb_to_hsv(r, g, b)
+    if v < 0.2: return "black"
+    if s < 0.15: return "white" if v > 0.85 else "gray"
+    deg = h * 360
+    for limit, name in ((15, "red"), (40, "orange"), (70, "yellow"), (165, "green"),
+                        (200, "cyan"), (255, "blue"), (290, "purple"), (340, "pink")):
+        if deg < limit: return name
+    return "red"
+
+def game_fields(results: List[Tuple[Dict, Dict]]) -> Dict[str, Any]:
+    """از آیکن: palette_dominants؛ از اسکرین‌شات‌ها: screenshot_style (جهت، روشنایی، اشباع)."""
+    out: Dict[str, Any] = {}
+    icons = [r for src, r in results if src.get("type") == "icon"]
+    shots = [r for src, r in results if src.get("type") == "screenshot"]
+    if icons:
+        names = [color_name(c) for c, share in icons[0]["palette"] if share >= 0.1]
+        out["palette_dominants"] = list(dict.fromkeys(names))[:3]
+    if shots:
+        landscape = sum(1 for r in shots if r["width"] > r["height"])
+        bright = float(np.mean([r["brightness"] for r in shots]))
+        sat = float(np.mean([r["saturation"] for r in shots]))
+        out["screenshot_style"] = [
+            "landscape" if landscape * 2 > len(shots) else "portrait",
+            "dark" if bright < 0.35 else ("bright" if bright > 0.7 else "balanced"),
+            "colorful" if sat > 0.45 else ("muted" if sat < 0.2 else "natural"),
+        ]
+    return out
+
+# ==================== Fetch & process ====================
+async def fetch_image(url: str, client, sem: asyncio.Semaphore) -> bytes:
+    async with sem:
+        async with client.stream("GET", url, headers={"Accept": "image/*"}) as resp:
+            resp.raise_for_status()
+            if int(resp.headers.get("content-length") or 0) > MAX_BYTES:
+                raise ValueError("too_large")
+            buf = bytearray()
+            async for chunk in resp.aiter_bytes():
+                buf += chunk
+                if len(buf) > MAX_BYTES:
+                    raise ValueError("too_large")
+            return bytes(buf)
+
+async def process_asset(hit: Dict, client, sem: asyncio.Semaphore, pool: cf.Executor) -> Tuple[Dict, Optional[Dict], Optional[Dict]]:
+    src = hit.get("_source", {})
+    now = crawler.now_iso()
+    try:
+        data = await fetch_image(src["url"], client, sem)
+        res = await asyncio.get_running_loop().run_in_executor(pool, analyze_image, data)
+    except (httpx.TransportError, httpx.HTTPStatusError) as e:
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+            return src, None, {"image_error": f"http_{e.response.status_code}", "image_at": now}
+        return src, None, None  # خطای موقت: در اجرای بعدی دوباره تلاش می‌شود
+    except Exception as e:
+        err = str(e) if str(e) == "too_large" else type(e).__name__
+        return src, None, {"image_error": err, "image_at": now}
+    doc = {k: res[k] for k in ("width", "height", "phash", "dhash")}
+    doc.update({"palette": [c for c, _ in res["palette"]], "image_bytes": len(data), "image_at": now})
+    return src, res, doc
+
+async def process_app(key: Tuple[str, str], hits: List[Dict], client, sem, pool) -> List[Dict]:
+    done = await asyncio.gather(*(process_asset(h, client, sem, pool) for h in hits))
+    actions = [{"_op_type": "update", "_index": h["_index"], "_id": h["_id"], "doc": doc}
+               for h, (_, _, doc) in zip(hits, done) if doc]
+    summary = game_fields([(src, res) for src, res, _ in done if res])
+    if summary:
+        actions.append({"_op_type": "update", "_index": ES_INDEX, "_id": f"{key[0]}::{key[1]}", "doc": summary})
+    return actions
+
+# ==================== Pending assets (sorted by app) ====================
+def pending_query() -> Dict[str, Any]:
+    filt: List[Dict] = [{"terms": {"type": ["icon", "screenshot"]}}]
+    if STORE_FILTER: filt.append({"term": {"store": STORE_FILTER}})
+    return {"bool": {"filter": filt, "must_not": [{"exists": {"field": "phash"}}, {"exists": {"field": "image_error"}}]}}
+
+def iter_pending_groups() -> Iterator[Tuple[Tuple[str, str], List[Dict]]]:
+    pit = es.open_point_in_time(index=ES_ASSETS_INDEX, keep_alive="5m")["id"]
+    after, key, group = None, None, []
+    try:
+        while True:
+            resp = es.search(
+                pit={"id": pit, "keep_alive": "5m"}, query=pending_query(), size=PAGE_SIZE,
+                _source=["store", "app_id", "type", "url"],
+                sort=[{"store": "asc"}, {"app_id": "asc"}, {"_shard_doc": "asc"}],
+                **({"search_after": after} if after else {}),
+            )
+            pit = resp.get("pit_id", pit)
+            hits = resp["hits"]["hits"]
+            if not hits:
+                break
+            for h in hits:
+                src = h.get("_source", {})
+                k = (src.get("store"), src.get("app_id"))
+                if k != key and group:
+                    yield key, group
+                    group = []
+                key = k
+                if src.get("url"): group.append(h)
+            after = hits[-1]["sort"]
+        if group:
+            yield key, group
+    finally:
+        try:
+            es.close_point_in_time(id=pit)
+        except Exception:
+            pass
+
+def _flush(actions: List[Dict]) -> Tuple[int, int]:
+    if not actions: return 0, 0
+    ok, errors = helpers.bulk(es, actions, raise_on_error=False, request_timeout=120)
+    return ok or 0, len(errors) if isinstance(errors, list) else 0
+
+async def run_once(pool: cf.Executor) -> Tuple[int, int, int]:
+    sem = asyncio.Semaphore(CONCURRENCY)
+    inflight: set = set()
+    buf: List[Dict] = []
+    apps = ok = fail = 0
+
+    def collect(tasks):
+        nonlocal apps
+        for t in tasks:
+            buf.extend(t.result()); apps += 1
+
+    # صفحه‌های PIT و bulk (کلاینت sync) در thread جدا، تا دانلودهای در جریان روی event loop متوقف نشوند
+    groups = iter_pending_groups()
+    try:
+        async with crawler.make_client() as client:
+            while True:
+                item = await asyncio.to_thread(next, groups, None)
+                if item is None: break
+                key, hits = item
+                if not hits: continue
+                while len(inflight) >= APPS_IN_FLIGHT:
+                    done, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+                inflight.add(asyncio.create_task(process_app(key, hits, client, sem, pool)))
+                if len(buf) >= BULK_CHUNK:
+                    batch = buf[:]; buf.clear()
+                    o, f = await asyncio.to_thread(_flush, batch); ok += o; fail += f
+                    print(f"[IMG] apps={apps} ok={ok} fail={fail}")
+            if inflight:
+                done, _ = await asyncio.wait(inflight)
+                collect(done)
+    finally:
+        await asyncio.to_thread(groups.close)  # بستن PIT
+    o, f = await asyncio.to_thread(_flush, buf); ok += o; fail += f
+    return apps, ok, fail
+
+def ensure_mapping():
+    try:
+        es.indices.put_mapping(index=ES_ASSETS_INDEX, properties=ASSET_MAPPING)
+    except Exception as e:
+        print("[IMG] WARN put_mapping:", e)
+
+async def main():
+    ensure_mapping()
+    with cf.ProcessPoolExecutor(DECODE_WORKERS) as pool:
+        while True:
+            t0 = time.time()
+            apps, ok, fail = await run_once(pool)
+            print(f"[IMG] done: apps={apps} actions ok={ok} fail={fail} in {time.time() - t0:.1f}s")
+            if LOOP_SEC <= 0:
+                break
+            await asyncio.sleep(LOOP_SEC)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+# services/scraper/reprocess.py
+"""
+اجرای دوباره‌ی استخراج و ایندکس روی آرشیو خام (ARCHIVE_DIR) بدون خزش مجدد.
+
+برای هر doc_id فقط آخرین نسخه‌ی صفحه خوانده می‌شود؛ رکوردها به N بخش تقسیم و در
+پروسه‌های جدا از مسیر فعلی build_game_doc / استخراج ریویو / تصاویر عبور داده و با bulk
+نوشته می‌شوند. ریویوهای AJAX (نیازمند شبکه) در این مسیر اجرا نمی‌شوند.
+
+اجرا:
+  ARCHIVE_DIR=/data/archive REPROCESS_WORKERS=8 python reprocess.py
+"""
+import os, sys, time, pathlib, multiprocessing as mp
+from typing import Dict, Iterator, List, Tuple
+
+BASE = pathlib.Path(__file__).parent
+sys.path.append(str(BASE))
+sys.path.append(str(BASE.parent / "analyzer"))
+
+from archive import Pointer, load_latest_index, read_records
+from bulk_session import BulkSession, client as es_client
+
+ARCHIVE_DIR  = os.getenv("ARCHIVE_DIR", "").strip()
+WORKERS      = int(os.getenv("REPROCESS_WORKERS", str(os.cpu_count() or 2)))
+TASK_SIZE    = int(os.getenv("REPROCESS_TASK_SIZE", "500"))   # رکورد در هر تکه‌ی کار
+BULK_CHUNK   = int(os.getenv("REPROCESS_BULK_CHUNK", "1000"))
+STORE_FILTER = os.getenv("REPROCESS_STORE", "").strip()         # e.g. "myket" | "bazaar" | ""
+
+_crawler = None
+
+def _init_worker():
+    global _crawler
+    import crawler
+    crawler.ENABLE_AJAX_REVIEWS = False
+    # با fork، crawler.es (و سوکت‌های keep-alive آن) از والد به ارث می‌رسد؛ هر worker pool اتصال خودش را می‌سازد
+    crawler.es = es_client(crawler.ES_URL, request_timeout=120)
+    _crawler = crawler
+
+def _actions_for(header: Dict, html: str) -> Iterator[Dict]:
+    c = _crawler
+    url = header["url"]
+    doc = c.build_game_doc(url, html, genre_hint=header.get("genre_hint"), source_list=header.get("source_list") or None)
+    if doc is None:
+        return
+    # indexed_at را زمان خزش اصلی نگه می‌داریم، نه زمان بازپردازش
+    doc["indexed_at"] = header.get("fetched_at") or doc["indexed_at"]
+    yield {"_op_type": "update", "_index": c.ES_INDEX, "_id": header["doc_id"], "doc": doc, "doc_as_upsert": True}
+
+    if c.ENABLE_REVIEWS:
+        reviews = c._dedup_reviews(c.extract_reviews_for_page(url, html, c.REVIEWS_PER_APP))
+        yield from c.review_actions(url, doc["title"], doc["app_id"], doc["store"], reviews)
+    assets = c.extract_image_urls(url, html)
+    actions = c.asset_actions(url, doc["title"], doc["app_id"], doc["store"], assets)
+    c.prune_stale_assets(doc["store"], doc["app_id"], [a["_id"] for a in actions])
+    yield from actions
+    yield c.asset_counts_action(url, assets)
+
+def _process(pointers: List[Pointer]) -> Tuple[int, int, int]:
+    c = _crawler
+    n_pages = 0
+
+    def gen():
+        nonlocal n_pages
+        for header, html in read_records(pointers):
+            n_pages += 1
+            try:
+                yield from _actions_for(header, html)
+            except Exception as e:
+                print(f"[REPROC] WARN {header.get('url')}: {e}")
+
+    ok, errors = c.helpers.bulk(c.es, gen(), chunk_size=BULK_CHUNK, raise_on_error=False, request_timeout=120)
+    return n_pages, ok or 0, len(errors) if isinstance(errors, list) else 0
+
+def main():
+    if not ARCHIVE_DIR:
+        print("[REPROC] ARCHIVE_DIR is not set.")
+        return
+    latest = load_latest_index(ARCHIVE_DIR)
+    if STORE_FILTER:
+        latest = {k: v for k, v in latest.items() if k.startswith(f"{STORE_FILTER}::")}
+    if not latest:
+        print("[REPROC] archive is empty.")
+        return
+
+    # مرتب بر اساس (segment, offset) تا هر تکه یک بازه‌ی پیوسته از دیسک باشد
+    pointers = sorted(latest.values())
+    tasks = [pointers[i:i + TASK_SIZE] for i in range(0, len(pointers), TASK_SIZE)]
+    print(f"[REPROC] {len(pointers)} pages in {len(tasks)} tasks, workers={WORKERS}")
+
+    import crawler
+    indices = [i for i in (crawler.ES_INDEX, crawler.ES_ASSETS_INDEX,
+                            crawler.ES_REVIEWS_INDEX if crawler.ENABLE_REVIEWS else "") if i]
+    t0 = time.time()
+    pages = ok = fail = 0
+    # session (و thread heartbeat آن) کلاینت جدای خودش را دارد که با workerها مشترک نیست
+    with BulkSession(es_client(crawler.ES_URL), indices, name="reprocess"), \
+         mp.Pool(WORKERS, initializer=_init_worker) as pool:
+        for n, o, f in pool.imap_unordered(_process, tasks):
+            pages += n; ok += o; fail += f
+            print(f"[REPROC] {pages}/{len(pointers)} pages, actions ok={ok} fail={fail}")
+    dt_s = max(time.time() - t0, 1e-6)
+    print(f"[REPROC] done. pages={pages} ok={ok} fail={fail} in {dt_s:.1f}s ({pages / dt_s:.0f} pages/s)")
+
+if __name__ == "__main__":
+    main()
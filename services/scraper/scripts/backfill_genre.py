@@ -1,76 +1,99 @@
 # services/scraper/scripts/backfill_genre.py
-import os, re, sys, math, time
-from elasticsearch import Elasticsearch, helpers
+"""
+پرکردن/نرمال‌سازی ژانر سمت سرور: _update_by_query روی games با ingest pipeline ژانر (genres.py).
+هیچ سندی از شبکه رد نمی‌شود؛ کار به صورت task پس‌زمینه، sliced و throttled اجرا و پیشرفتش poll می‌شود.
+
+  BACKFILL_SCOPE=unknown   فقط ژانرهای خالی/unknown (پیش‌فرض)
+  BACKFILL_SCOPE=all       همه‌ی بازی‌ها (مثلاً بعد از تغییر جدول‌های genres.py)
+  BACKFILL_RPS             سقف سند در ثانیه برای کل task (-1 = بدون محدودیت)
+  BACKFILL_SLICES          auto یا عدد
+  BACKFILL_TASK            ادامه‌ی poll یک task قبلی (node:id) به جای شروع task جدید
+
+اجرا:
+  docker compose run --rm scraper python /app/scripts/backfill_genre.py
+"""
+import os, sys, time, pathlib
+from elasticsearch import Elasticsearch
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+from genres import GENRE_PIPELINE, URL_FIELDS, UNKNOWN_GENRES, ensure_pipeline
 
 ES_URL   = os.getenv("ES_HOST", "http://localhost:9200")
 ES_INDEX = os.getenv("ES_INDEX", "games")
+SCOPE    = os.getenv("BACKFILL_SCOPE", "unknown").strip().lower()
+RPS      = float(os.getenv("BACKFILL_RPS", "1000"))
+SLICES   = os.getenv("BACKFILL_SLICES", "auto").strip()
 BATCH    = int(os.getenv("BATCH", "1000"))
+POLL_SEC = float(os.getenv("BACKFILL_POLL_SEC", "5"))
+TASK_ID  = os.getenv("BACKFILL_TASK", "").strip()
 
-def infer_from_url(u: str):
-    if not u: return None
-    u = u.lower()
-    # myket
-    m = re.search(r"myket\.ir/games/([^/?#]+)", u)
-    if m:
-        slug = m.group(1)
-        map_ = {
-            "action":"action","adventure":"adventure","casual":"casual","kids":"kids",
-            "puzzle":"puzzle","racing":"racing","simulation":"simulation","sports":"sports",
-            "strategy":"strategy","word":"word","board":"board"
-        }
-        return map_.get(slug, slug)
-    # bazaar
-    m = re.search(r"cafebazaar\.ir/cat/([^/?#]+)", u)
-    if m:
-        slug = m.group(1)
-        map_ = {
-            "strategy":"strategy","action":"action","arcade":"arcade","casual":"casual",
-            "racing":"racing","simulation":"simulation","word-trivia":"word_trivia",
-            "kids-games":"kids","puzzle":"puzzle","sports-game":"sports","board":"board"
+def build_query():
+    if SCOPE == "all":
+        return {"match_all": {}}
+    # ژانر ندارد یا unknown است، و آدرسی برای حدس زدن دارد
+    return {
+        "bool": {
+            "should": [
+                {"terms": {"genre": sorted(g for g in UNKNOWN_GENRES if g)}},
+                {"bool": {"must_not": [{"exists": {"field": "genre"}}]}},
+            ],
+            "minimum_should_match": 1,
+            "filter": [{"bool": {"should": [{"exists": {"field": f}} for f in URL_FIELDS],
+                                 "minimum_should_match": 1}}],
         }
-        return map_.get(slug, slug)
-    return None
+    }
 
-def gen_updates(es: Elasticsearch, q):
-    # اسناد unknown با source_list_url یا حتی بدونش (fallback: nothing)
-    for hit in helpers.scan(
-        es,
+def start_task(es: Elasticsearch) -> str:
+    resp = es.update_by_query(
         index=ES_INDEX,
-        query=q,
-        size=BATCH,
-        _source=["genre","source_list_url","store"],
-    ):
-        src = hit.get("_source", {})
-        gid = hit["_id"]
-        if src.get("genre") and src["genre"] != "unknown":
-            continue
-        g = infer_from_url(src.get("source_list_url",""))
-        if g:
-            yield {
-                "_op_type": "update",
-                "_index": ES_INDEX,
-                "_id": gid,
-                "doc": {"genre": g}
-            }
+        query=build_query(),
+        pipeline=GENRE_PIPELINE,
+        conflicts="proceed",
+        slices=SLICES if SLICES == "auto" else int(SLICES),
+        requests_per_second=RPS if RPS > 0 else -1,
+        scroll_size=BATCH,
+        wait_for_completion=False,
+        refresh=True,
+    )
+    return resp["task"]
+
+def poll(es: Elasticsearch, task_id: str, tag: str = "BACKFILL") -> dict:
+    t0 = time.time()
+    while True:
+        resp = es.tasks.get(task_id=task_id)
+        st = resp.get("task", {}).get("status", {}) or {}
+        done = sum(st.get(k, 0) for k in ("created", "updated", "noops", "version_conflicts", "deleted"))
+        total = st.get("total", 0) or 0
+        pct = f"{100.0 * done / total:.1f}%" if total else "-"
+        print(f"[{tag}] {done}/{total} ({pct}) created={st.get('created', 0)} updated={st.get('updated', 0)} "
+              f"conflicts={st.get('version_conflicts', 0)} batches={st.get('batches', 0)} "
+              f"rps={st.get('requests_per_second')} elapsed={time.time() - t0:.0f}s")
+        if resp.get("completed"):
+            return resp
+        time.sleep(POLL_SEC)
 
 def main():
-    es = Elasticsearch(ES_URL)
-    q = {
-        "query": {
-            "bool": {
-                "must": [{ "term": {"genre": "unknown"} }],
-                "filter": [{ "exists": {"field": "source_list_url"} }]
-            }
-        }
-    }
-    cnt = 0
-    for ok, info in helpers.streaming_bulk(es, gen_updates(es, q), chunk_size=500, max_retries=3):
-        cnt += 1
-        if not ok:
-            print("ERR:", info, file=sys.stderr)
-        if cnt % 1000 == 0:
-            print(f"updated {cnt} docs...")
-    print(f"done. updated {cnt} docs.")
+    es = Elasticsearch(ES_URL, request_timeout=60)
+    task_id = TASK_ID
+    if not task_id:
+        ensure_pipeline(es)
+        task_id = start_task(es)
+        print(f"[BACKFILL] task {task_id} started (scope={SCOPE}, slices={SLICES}, rps={RPS})")
+    try:
+        resp = poll(es, task_id)
+    except KeyboardInterrupt:
+        # task در ES ادامه می‌دهد؛ با BACKFILL_TASK دوباره poll کنید یا لغو کنید
+        print(f"\n[BACKFILL] stopped polling; task {task_id} keeps running. "
+              f"cancel: POST _tasks/{task_id}/_cancel")
+        return
+    if resp.get("error"):
+        print("[BACKFILL] ERR:", resp["error"], file=sys.stderr)
+        sys.exit(1)
+    res = resp.get("response", {}) or {}
+    for f in res.get("failures", [])[:20]:
+        print("[BACKFILL] failure:", f, file=sys.stderr)
+    print(f"[BACKFILL] done. updated={res.get('updated', 0)} noops={res.get('noops', 0)} "
+          f"conflicts={res.get('version_conflicts', 0)} took={res.get('took', 0)}ms")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,73 @@
+# services/scraper/scripts/migrate_reviews_alias.py
+"""
+انتقال ایندکس قدیمی تک‌تکه‌ی `reviews` به ایندکس‌های ماهانه‌ی reviews-YYYY.MM-NNNNNN پشت write alias.
+
+  1) policy و template (elastic/ilm، elastic/templates) باید نصب باشند (es-init)
+  2) ایندکس bootstrap ماه جاری ساخته و کل `reviews` با _reindex (task پس‌زمینه، sliced) کپی می‌شود
+  3) ریویوهایی که در طول کپی رسیده‌اند (indexed_at ≥ شروع) یک بار دیگر کپی می‌شوند
+  4) در یک عمل اتمیک ایندکس قدیمی حذف و alias `reviews` روی ایندکس جدید (is_write_index) گذاشته می‌شود
+
+بهتر است در طول اجرا scraper متوقف باشد (نوشتن‌های بین مرحله‌ی ۳ و ۴ از دست می‌روند).
+
+اجرا:
+  docker compose stop scraper
+  docker compose run --rm scraper python /app/scripts/migrate_reviews_alias.py
+"""
+import os, sys, datetime as dt
+from elasticsearch import Elasticsearch
+
+from backfill_genre import poll
+
+ES_URL   = os.getenv("ES_HOST", "http://localhost:9200")
+ALIAS    = os.getenv("ES_REVIEWS_INDEX", "reviews")
+RPS      = float(os.getenv("MIGRATE_RPS", "-1"))
+SLICES   = os.getenv("MIGRATE_SLICES", "auto").strip()
+
+def reindex(es: Elasticsearch, src: str, dest: str, query=None) -> dict:
+    source = {"index": src, **({"query": query} if query else {})}
+    resp = es.reindex(source=source, dest={"index": dest}, conflicts="proceed",
+                      slices=SLICES if SLICES == "auto" else int(SLICES),
+                      requests_per_second=RPS if RPS > 0 else -1, wait_for_completion=False, refresh=True)
+    print(f"[MIGRATE] reindex {src} -> {dest} task {resp['task']}")
+    res = poll(es, resp["task"], tag="MIGRATE")
+    if res.get("error") or (res.get("response") or {}).get("failures"):
+        print("[MIGRATE] ERR:", res.get("error") or res["response"]["failures"][:5], file=sys.stderr)
+        sys.exit(1)
+    return res.get("response") or {}
+
+def main():
+    es = Elasticsearch(ES_URL, request_timeout=120)
+    if es.indices.exists_alias(name=ALIAS):
+        print(f"[MIGRATE] {ALIAS} is already an alias: {list(es.indices.get_alias(name=ALIAS))}")
+        return
+    if not es.indices.exists(index=ALIAS):
+        print(f"[MIGRATE] no legacy {ALIAS} index; es-init/crawler will bootstrap the alias.")
+        return
+    if not es.indices.exists_index_template(name="reviews"):
+        print("[MIGRATE] index template 'reviews' is missing; run es-init first.", file=sys.stderr)
+        sys.exit(1)
+
+    started = dt.datetime.utcnow().isoformat(timespec="seconds")
+    dest = es.indices.create(index=f"<{ALIAS}-{{now/M{{yyyy.MM}}}}-000001>")["index"]
+    print(f"[MIGRATE] created {dest}")
+    reindex(es, ALIAS, dest)
+    reindex(es, ALIAS, dest, query={"range": {"indexed_at": {"gte": started}}})
+
+    old_n = es.count(index=ALIAS)["count"]
+    new_n = es.count(index=dest)["count"]
+    if new_n < old_n:
+        print(f"[MIGRATE] count mismatch old={old_n} new={new_n}; alias not switched.", file=sys.stderr)
+        sys.exit(1)
+    es.indices.update_aliases(actions=[
+        {"remove_index": {"index": ALIAS}},
+        {"add": {"index": dest, "alias": ALIAS, "is_write_index": True}},
+    ])
+    try:
+        # ILM قبل از وجود alias روی rollover خطا داده است
+        es.ilm.retry(index=dest)
+    except Exception:
+        pass
+    print(f"[MIGRATE] done. {new_n} reviews in {dest}; {ALIAS} is now the write alias")
+
+if __name__ == "__main__":
+    main()
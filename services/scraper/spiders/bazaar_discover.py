@@ -1,8 +1,11 @@
-import re
-from typing import List, Tuple, Set
+import re, asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple, Set
 import httpx
 from selectolax.parser import HTMLParser
 
+from http_pool import make_async_client, make_sync_client
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Linux; Android 12; Pixel 5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Mobile Safari/537.36",
     "Accept-Language": "fa-IR,fa;q=0.9,en-US;q=0.8",
@@ -108,6 +111,29 @@ def _get(client: httpx.Client, url: str, timeout: float, retries: int = 2) -> ht
             last_exc = e
     raise last_exc or RuntimeError("request failed")
 
+async def _aget(client: httpx.AsyncClient, url: str, timeout: float, retries: int = 2) -> httpx.Response:
+    last_exc = None
+    for attempt in range(retries + 1):
+        try:
+            r = await client.get(url, headers=HEADERS, follow_redirects=True, timeout=timeout)
+            if r.status_code in (429, 500, 502, 503, 504):
+                raise httpx.HTTPStatusError("server busy", request=r.request, response=r)
+            r.raise_for_status()
+            return r
+        except Exception as e:
+            last_exc = e
+    raise last_exc or RuntimeError("request failed")
+
+def _expand(lists: List[str], max_pages_per_cat: int) -> List[str]:
+    """برای هر /cat/* بدون page، صفحه‌های page=2..N را هم پیشنهاد می‌کند؛ سپس خود لیست‌ها."""
+    out: List[str] = []
+    for u in lists:
+        if "/cat/" in u and "page=" not in u:
+            base_no_q = u.split("?", 1)[0]
+            out.extend(f"{base_no_q}?page={p}" for p in range(2, max_pages_per_cat + 1))
+    out.extend(lists)
+    return out
+
 def discover_from_bazaar_root(
     root: str,
     max_lists: int = 300,
@@ -124,11 +150,12 @@ def discover_from_bazaar_root(
 
     seeds: List[str] = []
     seen: Set[str] = set()
-    q: List[str] = [root]
+    q: Deque[str] = deque([root])
+    queued: Set[str] = {root}
 
-    with httpx.Client(http2=True) as client:
+    with make_sync_client(HEADERS) as client:
         while q and len(seeds) < max_lists:
-            url = q.pop(0)
+            url = q.popleft()
             if url in seen:
                 continue
             seen.add(url)
@@ -146,22 +173,67 @@ def discover_from_bazaar_root(
 
             apps, lists = _links_from(r.text, str(r.url))
 
-            # برای هر /cat/*، صفحه‌بندی را (عاقلانه) اضافه کن
-            for u in lists:
-                if "/cat/" in u:
-                    base_no_q = u.split("?", 1)[0]
-                    # اگر همین u قبلاً page داشت، دوباره page نساز
-                    has_page = "page=" in u
-                    if not has_page:
-                        for p in range(2, max_pages_per_cat + 1):
-                            paged = f"{base_no_q}?page={p}"
-                            if (paged not in seen) and (paged not in q) and (len(seeds) + len(q) < max_lists * 2):
-                                q.append(paged)
-
-            # بقیه لیست‌ها را در صف بگذار
-            for u in lists:
-                if (u not in seen) and (u not in q) and (len(seeds) + len(q) < max_lists * 2):
-                    q.append(u)
+            # صفحه‌بندی /cat/* و بقیه‌ی لیست‌ها را در صف بگذار
+            for u in _expand(lists, max_pages_per_cat):
+                if (u not in seen) and (u not in queued) and (len(seeds) + len(q) < max_lists * 2):
+                    q.append(u); queued.add(u)
 
     # یکتا و محدود
     return _uniq(seeds)[:max_lists]
+
+async def discover_from_bazaar_root_async(
+    root: str,
+    max_lists: int = 300,
+    max_pages_per_cat: int = 50,
+    per_request_timeout: float = 20.0,
+    concurrency: int = 4,
+    on_list: Optional[Callable[[str], Awaitable[None]]] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> List[str]:
+    """
+    نسخه‌ی async با حداکثر `concurrency` درخواست هم‌زمان.
+    هر لیست به محض کشف با on_list(url) گزارش می‌شود (مثلاً مستقیم به frontier).
+    """
+    if not _is_bazaar(root):
+        raise ValueError("Root must be an https://cafebazaar.ir/ URL")
+
+    seeds: List[str] = []
+    found: Set[str] = set()
+    queued: Set[str] = {root}
+    q: asyncio.Queue = asyncio.Queue()
+    q.put_nowait(root)
+
+    own_client = client is None
+    if own_client:
+        client = make_async_client(HEADERS)
+
+    async def work():
+        while True:
+            url = await q.get()
+            try:
+                if len(seeds) >= max_lists:
+                    continue
+                try:
+                    r = await _aget(client, url, timeout=per_request_timeout)
+                except Exception as e:
+                    print(f"[BAZAAR] fetch error {url}: {e}")
+                    continue
+                final = str(r.url)
+                if final not in found and len(seeds) < max_lists:
+                    found.add(final); seeds.append(final)
+                    if on_list: await on_list(final)
+                _, lists = _links_from(r.text, final)
+                for u in _expand(lists, max_pages_per_cat):
+                    if u not in queued and len(seeds) + q.qsize() < max_lists * 2:
+                        queued.add(u); q.put_nowait(u)
+            finally:
+                q.task_done()
+
+    workers = [asyncio.create_task(work()) for _ in range(max(1, concurrency))]
+    try:
+        await q.join()
+    finally:
+        for w in workers: w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if own_client: await client.aclose()
+    return seeds[:max_lists]
@@ -1,9 +1,12 @@
 # ./services/scraper/spiders/myket_discover.py
-import re
-from typing import List, Tuple, Set
+import re, asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple, Set
 import httpx
 from selectolax.parser import HTMLParser
 
+from http_pool import make_async_client, make_sync_client
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Linux; Android 12; Pixel 5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Mobile Safari/537.36",
     "Accept-Language": "fa-IR,fa;q=0.9,en-US;q=0.8,en;q=0.7",
@@ -95,12 +98,13 @@ def discover_from_games_root(games_root: str = "https://myket.ir/games", max_lis
     """
     seeds: List[str] = []
     seen: Set[str] = set()
-    q: List[str] = [games_root]
+    q: Deque[str] = deque([games_root])
+    queued: Set[str] = {games_root}
 
-    # HTTP/2 کمک می‌کند، ولی اجباری نیست
-    with httpx.Client(headers=HEADERS, follow_redirects=True, timeout=30, http2=True) as client:
+    # HTTP/2 کمک می‌کند، ولی اجباری نیست (http_pool بدون h2 به HTTP/1.1 برمی‌گردد)
+    with make_sync_client(HEADERS) as client:
         while q and len(seeds) < max_lists:
-            url = q.pop(0)
+            url = q.popleft()
             if url in seen:
                 continue
             seen.add(url)
@@ -121,7 +125,60 @@ def discover_from_games_root(games_root: str = "https://myket.ir/games", max_lis
 
             # صف کردن لینک‌های لیست (با سقف)
             for u in list_links:
-                if u not in seen and u not in q and (len(seeds) + len(q) < max_lists * 2):
-                    q.append(u)
+                if u not in seen and u not in queued and (len(seeds) + len(q) < max_lists * 2):
+                    q.append(u); queued.add(u)
 
     return seeds or [games_root]
+
+async def discover_from_games_root_async(
+    games_root: str = "https://myket.ir/games",
+    max_lists: int = 200,
+    concurrency: int = 4,
+    on_list: Optional[Callable[[str], Awaitable[None]]] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> List[str]:
+    """
+    نسخه‌ی async با حداکثر `concurrency` درخواست هم‌زمان.
+    هر لیست به محض کشف با on_list(url) گزارش می‌شود (مثلاً مستقیم به frontier).
+    """
+    seeds: List[str] = []
+    found: Set[str] = set()
+    queued: Set[str] = {games_root}
+    q: asyncio.Queue = asyncio.Queue()
+    q.put_nowait(games_root)
+
+    own_client = client is None
+    if own_client:
+        client = make_async_client(HEADERS)
+
+    async def work():
+        while True:
+            url = await q.get()
+            try:
+                if len(seeds) >= max_lists:
+                    continue
+                try:
+                    r = await client.get(url, headers=HEADERS, follow_redirects=True)
+                    r.raise_for_status()
+                except Exception as e:
+                    print(f"[MYKET] fetch error {url}: {e}")
+                    continue
+                final = str(r.url)
+                if final not in found and len(seeds) < max_lists:
+                    found.add(final); seeds.append(final)
+                    if on_list: await on_list(final)
+                _, list_links = _links_from(r.text, final)
+                for u in list_links:
+                    if u not in queued and len(seeds) + q.qsize() < max_lists * 2:
+                        queued.add(u); q.put_nowait(u)
+            finally:
+                q.task_done()
+
+    workers = [asyncio.create_task(work()) for _ in range(max(1, concurrency))]
+    try:
+        await q.join()
+    finally:
+        for w in workers: w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if own_client: await client.aclose()
+    return seeds
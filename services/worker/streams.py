@@ -0,0 +1,52 @@
+# services/worker/streams.py
+"""ابزار مشترک consumer groupهای Redis Stream (ack/retry/dead-letter/lag)."""
+import time
+from typing import Dict, List, Optional, Tuple
+
+from redis import Redis
+from redis.exceptions import ResponseError
+
+Message = Tuple[str, Dict[str, str]]
+
+def ensure_group(r: Redis, stream: str, group: str):
+    try:
+        r.xgroup_create(stream, group, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+def read_new(r: Redis, stream: str, group: str, consumer: str, count: int, block_ms: int) -> List[Message]:
+    resp = r.xreadgroup(group, consumer, {stream: ">"}, count=count, block=block_ms)
+    return resp[0][1] if resp else []
+
+def reclaim_stale(r: Redis, stream: str, group: str, consumer: str, count: int,
+                  idle_ms: int, max_deliveries: int, dead_stream: str) -> Tuple[List[Message], int]:
+    """
+    پیام‌های معلق قدیمی را برمی‌دارد؛ آن‌هایی که max_deliveries بار تلاش شده‌اند به dead_stream می‌روند.
+    خروجی: (پیام‌های claim‌شده برای تلاش دوباره، تعداد پیام‌های dead)
+    """
+    pending = r.xpending_range(stream, group, min="-", max="+", count=count, idle=idle_ms)
+    if not pending:
+        return [], 0
+    dead = [p["message_id"] for p in pending if p["times_delivered"] >= max_deliveries]
+    retry = [p["message_id"] for p in pending if p["times_delivered"] < max_deliveries]
+    for mid in dead:
+        for _, fields in r.xrange(stream, min=mid, max=mid):
+            r.xadd(dead_stream, {**fields, "orig_id": mid, "group": group})
+        r.xack(stream, group, mid)
+    if dead:
+        print(f"[STREAM] moved {len(dead)} events to {dead_stream}")
+    if not retry:
+        return [], len(dead)
+    return r.xclaim(stream, group, consumer, min_idle_time=idle_ms, message_ids=retry), len(dead)
+
+def group_lag(r: Redis, stream: str, group: str) -> Tuple[Optional[int], int]:
+    """(lag, pending) برای group؛ lag در Redis < 7 در دسترس نیست (None)."""
+    for g in r.xinfo_groups(stream):
+        if g.get("name") == group:
+            return g.get("lag"), g.get("pending") or 0
+    return None, 0
+
+def event_age(msg_id: str) -> float:
+    """فاصله‌ی زمانی از ثبت پیام (شناسه‌ی استریم بر حسب میلی‌ثانیه است)."""
+    return max(0.0, time.time() - int(msg_id.split("-")[0]) / 1000.0)
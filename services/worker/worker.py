@@ -0,0 +1,187 @@
+# services/worker/worker.py
+"""
+Pipeline runner رویدادمحور: رویدادهای app_indexed خزنده را از Redis Stream با consumer group
+می‌خواند و برای هر micro-batch:
+  1) سند بازی‌ها را با mget می‌گیرد (اپ‌هایی که content_hash‌شان قبلاً پردازش شده رد می‌شوند)
+  2) فیچرهای متنی را با همان منطق miner استخراج می‌کند (شمارش assets در ingest نوشته شده)
+  3) با آخرین model.pkl امتیاز predicted_success / feature_score را حساب می‌کند
+  4) همه را در یک bulk می‌نویسد، leaderboardهای Redis را به‌روز و بعد پیام‌ها را ack می‌کند
+
+پیام‌هایی که ack نشده‌اند بعد از PIPELINE_CLAIM_IDLE_MS دوباره برداشته می‌شوند و بعد از
+PIPELINE_MAX_DELIVERIES تلاش به استریم dead-letter منتقل می‌شوند.
+"""
+import os, time, socket, datetime as dt
+from typing import Any, Dict, List, Optional, Tuple
+
+from elasticsearch import helpers
+from redis import Redis
+
+import miner
+import score
+from streams import ensure_group, read_new, reclaim_stale, group_lag, event_age
+
+REDIS_URL       = os.getenv("REDIS_URL", "redis://redis:6379/0")
+EVENTS_STREAM   = os.getenv("EVENTS_STREAM", "events:app_indexed")
+DEAD_STREAM     = os.getenv("PIPELINE_DEAD_STREAM", EVENTS_STREAM + ":dead")
+GROUP           = os.getenv("PIPELINE_GROUP", "pipeline")
+CONSUMER        = os.getenv("PIPELINE_CONSUMER", f"{socket.gethostname()}-{os.getpid()}")
+BATCH           = int(os.getenv("PIPELINE_BATCH", "200"))
+BLOCK_MS        = int(os.getenv("PIPELINE_BLOCK_MS", "5000"))
+CLAIM_IDLE_MS   = int(os.getenv("PIPELINE_CLAIM_IDLE_MS", "60000"))
+MAX_DELIVERIES  = int(os.getenv("PIPELINE_MAX_DELIVERIES", "5"))
+LAG_EVERY_SEC   = float(os.getenv("PIPELINE_LAG_EVERY_SEC", "15"))
+METRICS_PORT    = int(os.getenv("METRICS_PORT", "9109"))
+
+ES_INDEX = miner.ES_INDEX
+es = miner.es
+
+# ==================== Metrics ====================
+class _NoopMetric:
+    def labels(self, *a, **kw): return self
+    def inc(self, *a, **kw): pass
+    def observe(self, *a, **kw): pass
+    def set(self, *a, **kw): pass
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server
+    EVENTS_TOTAL   = Counter("pipeline_events_total", "Stream events by outcome", ["outcome"])
+    BATCH_SECONDS  = Histogram("pipeline_batch_seconds", "Micro-batch processing time", ["stage"])
+    EVENT_AGE      = Histogram("pipeline_event_age_seconds", "Crawl-to-scored freshness",
+                               buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 21600, 86400))
+    GROUP_LAG      = Gauge("pipeline_group_lag", "Entries not yet delivered to the group")
+    GROUP_PENDING  = Gauge("pipeline_group_pending", "Delivered but unacknowledged entries")
+    METRICS_ENABLED = True
+except Exception:
+    EVENTS_TOTAL = BATCH_SECONDS = EVENT_AGE = GROUP_LAG = GROUP_PENDING = _NoopMetric()
+    METRICS_ENABLED = False
+
+# ==================== Model ====================
+_model: Dict[str, Any] = {"mtime": None, "artifact": None}
+
+def current_model() -> Optional[Dict[str, Any]]:
+    """model.pkl را فقط وقتی عوض شده دوباره بارگذاری می‌کند (بعد از train مجدد)."""
+    path = os.path.join(score.MODEL_DIR, "model.pkl")
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if mtime != _model["mtime"]:
+        try:
+            _model["artifact"] = score.load_artifact(path)
+            _model["mtime"] = mtime
+            print(f"[PIPE] loaded model {path}")
+        except Exception as e:
+            print("[PIPE] model load error:", e)
+    return _model["artifact"]
+
+# ==================== Stream helpers ====================
+def report_lag(r: Redis):
+    try:
+        lag, pending = group_lag(r, EVENTS_STREAM, GROUP)
+        if lag is not None: GROUP_LAG.set(lag)
+        GROUP_PENDING.set(pending)
+        print(f"[PIPE] group={GROUP} lag={lag} pending={pending}")
+    except Exception as e:
+        print("[PIPE] lag warn:", e)
+
+def next_messages(r: Redis):
+    retry, dead = reclaim_stale(r, EVENTS_STREAM, GROUP, CONSUMER, BATCH, CLAIM_IDLE_MS, MAX_DELIVERIES, DEAD_STREAM)
+    if dead: EVENTS_TOTAL.labels(outcome="dead").inc(dead)
+    if retry:
+        EVENTS_TOTAL.labels(outcome="retried").inc(len(retry))
+        return retry
+    return read_new(r, EVENTS_STREAM, GROUP, CONSUMER, BATCH, BLOCK_MS)
+
+# ==================== Processing ====================
+def process_batch(msgs: List[Tuple[str, Dict[str, str]]]) -> int:
+    # هر doc_id فقط با آخرین رویدادش
+    latest: Dict[str, Dict[str, str]] = {}
+    for _, fields in msgs:
+        if fields.get("doc_id"):
+            latest[fields["doc_id"]] = fields
+    if not latest:
+        return 0
+
+    t0 = time.perf_counter()
+    got = es.mget(index=ES_INDEX, ids=list(latest))
+    hits = []
+    for d in got.get("docs", []):
+        src = d.get("_source") if d.get("found") else None
+        if not src:
+            continue
+        h = latest[d["_id"]].get("content_hash") or ""
+        if h and src.get("pipeline_hash") == h:
+            continue  # همین محتوا قبلاً پردازش شده
+        hits.append({"_id": d["_id"], "_source": src})
+    BATCH_SECONDS.labels(stage="fetch").observe(time.perf_counter() - t0)
+    if not hits:
+        return 0
+
+    t0 = time.perf_counter()
+    # شمارش assets را خزنده هنگام ingest روی همین سند نوشته است
+    mined = {a["_id"]: a["doc"] for a in miner.build_updates(hits)}
+    BATCH_SECONDS.labels(stage="mine").observe(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    scores: Dict[str, Dict[str, float]] = {}
+    board = []
+    artifact = current_model()
+    if artifact is not None:
+        rows = [{"_id": h["_id"], **h["_source"], **mined.get(h["_id"], {})} for h in hits]
+        proba, fs = score.score_rows(rows, artifact)
+        for row, p, sc in zip(rows, proba, fs):
+            scores[row["_id"]] = {"predicted_success": float(round(p, 6)), "feature_score": float(round(sc, 6))}
+            board.append(score.leaderboard_entry(row, p))
+    BATCH_SECONDS.labels(stage="score").observe(time.perf_counter() - t0)
+
+    now = dt.datetime.utcnow().isoformat(timespec="seconds")
+    actions = []
+    for h in hits:
+        doc = {**mined.get(h["_id"], {}), **scores.get(h["_id"], {}), "pipeline_at": now,
+               "pipeline_hash": latest[h["_id"]].get("content_hash") or ""}
+        actions.append({"_op_type": "update", "_index": ES_INDEX, "_id": h["_id"], "doc": doc})
+
+    t0 = time.perf_counter()
+    ok, errors = helpers.bulk(es, actions, raise_on_error=False, request_timeout=120)
+    BATCH_SECONDS.labels(stage="write").observe(time.perf_counter() - t0)
+    if errors:
+        # اگر نوشتن ناقص بود ack نمی‌کنیم تا دوباره تلاش شود (خروجی idempotent است)
+        raise RuntimeError(f"bulk errors: {len(errors)}")
+    try:
+        score.update_leaderboards(board)
+    except Exception as e:
+        # leaderboard فقط cache است؛ score.py با SCORE_MODE=leaderboards از ایندکس بازسازی‌اش می‌کند
+        print("[PIPE] WARN leaderboards:", e)
+    return ok
+
+def main():
+    r = Redis.from_url(REDIS_URL, decode_responses=True)
+    ensure_group(r, EVENTS_STREAM, GROUP)
+    if METRICS_ENABLED and METRICS_PORT > 0:
+        start_http_server(METRICS_PORT)
+    print(f"[PIPE] consuming {EVENTS_STREAM} as {GROUP}/{CONSUMER} (batch={BATCH})")
+
+    last_lag = 0.0
+    while True:
+        if time.time() - last_lag >= LAG_EVERY_SEC:
+            report_lag(r); last_lag = time.time()
+
+        msgs = next_messages(r)
+        if not msgs:
+            continue
+        ids = [mid for mid, _ in msgs]
+        try:
+            n = process_batch(msgs)
+        except Exception as e:
+            EVENTS_TOTAL.labels(outcome="failed").inc(len(ids))
+            print(f"[PIPE] batch failed ({len(ids)} events), will retry: {e}")
+            time.sleep(1.0)
+            continue
+        r.xack(EVENTS_STREAM, GROUP, *ids)
+        EVENTS_TOTAL.labels(outcome="processed").inc(len(ids))
+        for mid in ids:
+            EVENT_AGE.observe(event_age(mid))
+        print(f"[PIPE] batch: events={len(ids)} updated={n}")
+
+if __name__ == "__main__":
+    main()